@@ -25,9 +25,29 @@
 #   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
 #############################################################################
 
+import time
+launch_time = time.time()
+
 import pyglet
 from core import config
 
+####################################################
+## Compile the dictionary ROOT needs to read std::vectors while the
+## window opens, unless the reader does not need ROOT
+import importlib
+from core.reader.dictionary import build_async
+reader_module = importlib.import_module('core.reader.%s' % config.filereader)
+needs_root = reader_module.Custom_Reader.needs_root(config.filename)
+
+## The processes scanning files in parallel are forked before any thread
+## is started or ROOT is imported, only if there are several files
+from core.reader.parallel import needs_pool, start_pool
+if needs_root and needs_pool(config.filename, config.cut_processes):
+    start_pool(config.cut_processes)
+
+if needs_root:
+    build_async()
+
 ####################################################
 ## Instantiate calorimeter and beamline
 calorimeters = []
@@ -45,7 +65,7 @@ beam = beamline.Beamline()
 ####################################################
 ## Instantiate Display
 from core.display import Display
-display = Display(calorimeters, beam)
+display = Display(calorimeters, beam, launch_time)
 display.clear()
 
         
@@ -30,6 +30,18 @@ import ConfigParser
 conf = ConfigParser.ConfigParser()
 conf.read('config.ini')
 
+
+## --------------------------------------- ##
+def option(get, section, name, default):
+    """
+    Value of an option read with get, default if config.ini predates it
+    """
+
+    if not conf.has_option(section, name):
+        return default
+    return get(section, name)
+
+
 """
 ===========================================================
 Input File
@@ -42,6 +54,94 @@ filereader = conf.get('InputFile', 'filereader')
 cut        = conf.get('InputFile', 'cut')
 
 
+"""
+===========================================================
+Reader
+===========================================================
+"""
+
+## Number of events read ahead in the background on each side
+## of the displayed event (0 to disable)
+prefetch_depth = option(conf.getint, 'Reader', 'prefetch_depth', 5)
+
+## Preload the branches declared by the reader into numpy arrays,
+## chunk_size entries at a time (0 to preload the whole tree)
+columnar            = option(conf.getboolean, 'Reader', 'columnar', False)
+columnar_chunk_size = option(conf.getint, 'Reader', 'columnar_chunk_size', 100000)
+
+## Number of entries scanned at a time when applying a cut (0 for all)
+cut_chunk_size = option(conf.getint, 'Reader', 'cut_chunk_size', 1000000)
+
+## Memory given to recently used selections, in MB
+cut_cache_mb = option(conf.getint, 'Reader', 'cut_cache_mb', 256)
+
+## Disk space given to the selections kept for the next sessions, in MB
+## (0 to compute them again every session)
+cut_cache_disk_mb = option(conf.getint, 'Reader', 'cut_cache_disk_mb', 64)
+
+## Number of processes scanning the files of a chain in parallel when
+## applying a cut (0 for one per core, 1 to scan in the display process)
+cut_processes = option(conf.getint, 'Reader', 'cut_processes', 0)
+
+## Switch off the branches the reader and the current cut do not read,
+## so that reading an event does not decompress them
+prune_branches = option(conf.getboolean, 'Reader', 'prune_branches', True)
+
+## Seed of the random order in which UP and DOWN walk the selected
+## events (0 for a different order every session)
+shuffle_seed = option(conf.getint, 'Reader', 'shuffle_seed', 0)
+
+## Branches identifying an event, for the :goto RUN:EVENT command
+run_branch   = option(conf.get, 'Reader', 'run_branch', 'RunNumber')
+event_branch = option(conf.get, 'Reader', 'event_branch', 'EventNumber')
+
+## Events shown per second without pressing a key, P pauses and
+## resumes (0 to start paused)
+auto_advance = option(conf.getfloat, 'Reader', 'auto_advance', 0.0)
+
+
+"""
+===========================================================
+Synthetic events (synthetic_reader)
+===========================================================
+"""
+
+## Number of events, the same seed always gives the same events
+synthetic_entries = option(conf.getint, 'Synthetic', 'entries', 1000000)
+synthetic_seed    = option(conf.getint, 'Synthetic', 'seed', 1)
+
+## Mean number of objects per event
+synthetic_multiplicities = {'jets'      : option(conf.getfloat, 'Synthetic', 'jets', 4.0),
+                            'taus'      : option(conf.getfloat, 'Synthetic', 'taus', 0.5),
+                            'muons'     : option(conf.getfloat, 'Synthetic', 'muons', 0.5),
+                            'electrons' : option(conf.getfloat, 'Synthetic', 'electrons', 0.5),
+                            'photons'   : option(conf.getfloat, 'Synthetic', 'photons', 1.0)}
+
+## Slopes of the falling pt spectra of the objects and of the MET (MeV)
+synthetic_pt_scales = {'jets'      : option(conf.getfloat, 'Synthetic', 'jet_pt', 40000.0),
+                       'taus'      : option(conf.getfloat, 'Synthetic', 'tau_pt', 25000.0),
+                       'muons'     : option(conf.getfloat, 'Synthetic', 'muon_pt', 30000.0),
+                       'electrons' : option(conf.getfloat, 'Synthetic', 'electron_pt', 30000.0),
+                       'photons'   : option(conf.getfloat, 'Synthetic', 'photon_pt', 20000.0),
+                       'met'       : option(conf.getfloat, 'Synthetic', 'met', 30000.0)}
+
+
+"""
+===========================================================
+Streamed events (stream_reader)
+===========================================================
+"""
+
+## Number of recent events kept, to go back to them
+stream_buffer = option(conf.getint, 'Stream', 'buffer', 1000)
+
+## Number of events waiting to be shown at most, and what to drop when
+## more arrive: latest keeps the newest ones, sampled keeps a uniform
+## sample of all the events that arrived since the display fell behind
+stream_pending = option(conf.getint, 'Stream', 'pending', 10)
+stream_policy  = option(conf.get, 'Stream', 'policy', 'latest')
+
+
 """
 ===========================================================
 Graphics
@@ -33,7 +33,7 @@ from pyglet.window import key
 from pyglet.window import mouse
 
 ## Basic python imports
-import math, random, importlib
+import math, random, importlib, time
 
 ## CDER imports
 from core.interface import Interface
@@ -41,6 +41,7 @@ from core.minitext  import MiniText
 from particle.particle import Particle
 import utils, config
 from reader.reader import CUT_NO_SELECTION
+from reader.jobs import Job
 
 ## imports to load file with appropriate reader
 reader_module = importlib.import_module('core.reader.%s' % config.filereader)
@@ -50,11 +51,17 @@ reader_module = importlib.import_module('core.reader.%s' % config.filereader)
 class Display(pyglet.window.Window):
 
     ## --------------------------------------- ##
-    def __init__(self, calorimeters, beam):
+    def __init__(self, calorimeters, beam, launch_time=None):
         """
-        Constructor
+        Constructor. launch_time is when CDER started, to report how
+        long it takes to show something
         """
 
+        if launch_time is None:
+            launch_time = time.time()
+        self.launch_time = launch_time
+        self.first_frame_shown = False
+
         ## Configure the parent class
         window_config = Config(sample_buffers=1, samples=4, depth_size=16, double_buffer=True)
         super(Display, self).__init__(resizable=True,
@@ -69,6 +76,12 @@ class Display(pyglet.window.Window):
         self.omega = config.camera_rotation_speed
         self.rotating = True
 
+        ## Automatic advance to the next event, at most one per frame,
+        ## switched off altogether when auto_advance is 0
+        self.advance_rate = config.auto_advance
+        self.advancing = self.advance_rate > 0
+        self.advance_wait = 0.0
+
         ## Window size
         self.width=800
         self.height=600
@@ -91,17 +104,44 @@ class Display(pyglet.window.Window):
         self.text_input_mode = False
         self.text_editor = MiniText(70)
 
+        ## Cut being evaluated in the background
+        self.cut_job = None
+
+        ## Event index being built in the background, and the event to show then
+        self.index_job = None
+        self.goto_target = None
+
+        ## Selected events being written to a skim in the background
+        self.export_job = None
+
+        ## Event weights being evaluated in the background
+        self.weight_job = None
+
+        ## input ROOT file management, opened in the background so that the
+        ## window shows up right away. Event navigation waits for the reader.
+        self.reader = None
+        self.reader_job = Job(self.open_reader)
+        self.reader_job.start()
+
         ## pyglet time control
         pyglet.clock.schedule_interval(self.update, 1.0/self.refresh_rate)
 
-        ## input ROOT file management
+
+
+    ## ---------------------------------------- ##
+    def open_reader(self, progress=None):
+        """
+        Open the input file with the reader set in config.ini. Runs in
+        the background.
+        """
+
         if not config.cut:
-            self.reader = reader_module.Custom_Reader(config.filename,
-                                                      config.treename)
+            return reader_module.Custom_Reader(config.filename,
+                                               config.treename)
         else:
-            self.reader = reader_module.Custom_Reader(config.filename,
-                                                      config.treename,
-                                                      initial_cut_string=config.cut)
+            return reader_module.Custom_Reader(config.filename,
+                                               config.treename,
+                                               initial_cut_string=config.cut)
 
     
 
@@ -181,7 +221,7 @@ class Display(pyglet.window.Window):
         if not self.text_input_mode:
 
             ## Turn on text input mode, enter cut
-            if symbol == key.C:
+            if symbol == key.C and self.reader is not None:
                 self.text_input_mode = True
                 self.negate_key = True
                 ## Display cut message
@@ -190,7 +230,7 @@ class Display(pyglet.window.Window):
                 self.history_index = -1
 
             ## Reset the cut, go back to full ROOT tree 
-            if symbol == key.R:
+            if symbol == key.R and self.reader is not None:
                 if self.reader.current_cut != CUT_NO_SELECTION:
                     self.reader.reset_cut()
                     self.interface.reset_cut()
@@ -224,8 +264,25 @@ class Display(pyglet.window.Window):
             if symbol == key.H:
                 self.interface.toggle_help()
 
-            ## Event navigation
-            if symbol == key.LEFT or symbol == key.RIGHT or symbol == key.UP or symbol == key.DOWN:
+            ## Write the selected events to a skim that later sessions can open
+            if symbol == key.E and self.reader is not None and self.export_job is None:
+                self.export_job = self.reader.export_async()
+                print 'Exporting %d events to %s' % (self.reader.entries, self.export_job.path)
+
+            ## Tag the current event, or untag it
+            if symbol == key.B and self.reader is not None:
+                self.reader.toggle_tag()
+
+            ## Pause or resume the automatic advance to the next event
+            if symbol == key.P and self.advance_rate > 0:
+                self.advancing = not self.advancing
+                self.advance_wait = 0.0
+
+            ## Event navigation, once the input file is open
+            if self.reader is None:
+                pass
+
+            elif symbol == key.LEFT or symbol == key.RIGHT or symbol == key.UP or symbol == key.DOWN:
 
                 ## Load particles from previous event
                 if symbol == key.LEFT:
@@ -235,31 +292,16 @@ class Display(pyglet.window.Window):
                 if symbol == key.RIGHT:
                     new_particles = self.reader.next()
 
-                ## Load particles from a random event
-                if symbol == key.UP or symbol == key.DOWN:
+                ## Load particles from the next random event
+                if symbol == key.UP:
                     new_particles = self.reader.random()
 
-                if new_particles is not None:
-                    
-                    ## Prepare for new event, remove particles from old event
-                    for particle in self.particles:
-                        particle.delete()
-
-                    self.particles = new_particles
-
-                    ## Remove calorimeter energy
-                    for calo in self.calorimeters:
-                        calo.reset()
-                        calo.energize(self.particles)
-
-                    ## Print out event information to terminal
-                    self.reader.print_event()
-
-                    ## Beam collision animation
-                    self.beam.start()
+                ## Go back to the previous random event
+                if symbol == key.DOWN:
+                    new_particles = self.reader.random_previous()
 
-                    ## Allow modification of calorimeter openGL primitives
-                    self.allow_calo_update = True
+                if new_particles is not None:
+                    self.show_event(new_particles)
 
 
         ## Text editor controls
@@ -335,31 +377,323 @@ class Display(pyglet.window.Window):
                     self.text_editor.reset()
                     self.interface.set_text('')
                     self.interface.toggle_cut()
-                ## Pass cut string to ROOT file reader
-                if self.reader.cut(self.text_editor.text_output):
-
-                    ## Prepare for new event, remove particles from old event
-                    for particle in self.particles:
-                        particle.delete()
-# 
-                    self.particles = []
-                    
-                    ## Remove calorimeter energy
-                    for calo in self.calorimeters:
-                        calo.reset()
-                        calo.energize(self.particles)
-                        
-                
-                    ## Select a random event that passes the cut, print and display
-                    self.particles = self.reader.random()
-                    self.reader.print_event()
-                    self.beam.start()
-                    self.allow_calo_update = True
+                ## Pass cut string to ROOT file reader, a new cut replaces
+                ## the one still being evaluated
+                if self.text_editor.text_output.strip() != '' and not self.run_command(self.text_editor.text_output):
+                    if self.cut_job is not None:
+                        self.cut_job.cancel()
+                    self.cut_job = self.reader.cut_async(self.text_editor.text_output)
                 
 
-        ## Quit CDER
+        ## Cancel the cut or the index being built, or quit CDER
         if symbol == key.ESCAPE:
-            self.dispatch_event('on_close')
+            if self.cut_job is not None:
+                self.cut_job.cancel()
+                self.cut_job = None
+                self.interface.set_progress('')
+            elif self.index_job is not None:
+                self.index_job.cancel()
+                self.index_job = None
+                self.interface.set_progress('')
+            elif self.export_job is not None:
+                self.export_job.cancel()
+                self.export_job = None
+                self.interface.set_progress('')
+            elif self.weight_job is not None:
+                self.weight_job.cancel()
+                self.weight_job = None
+                self.interface.set_progress('')
+            else:
+                self.dispatch_event('on_close')
+
+
+
+    ## ---------------------------------------- ##
+    def run_command(self, text):
+        """
+        Run a command typed in the cut prompt, returns False if the text
+        is not a command but a cut. Commands start with a colon, which no
+        cut does, and are not kept in the cut history.
+        """
+
+        words = text.split()
+        if len(words) == 0 or not words[0].startswith(':'):
+            return False
+
+        ## :goto RUN:EVENT, show an event given its run and event numbers
+        if words[0] == ':goto':
+            try:
+                run, event = [int(number) for number in ' '.join(words[1:]).replace(':', ' ').split()]
+            except ValueError:
+                print 'Usage : :goto RUN:EVENT'
+                return True
+            self.goto_event(run, event)
+            return True
+
+        ## :weight EXPRESSION, draw random events in proportion to it,
+        ## :weight alone to draw them uniformly again
+        if words[0] == ':weight':
+            expression = text.strip()[len(':weight'):].strip()
+            if self.weight_job is not None:
+                self.weight_job.cancel()
+                self.weight_job = None
+            if expression == '':
+                self.reader.set_weights(None, None)
+                print 'Random events are drawn uniformly'
+            else:
+                self.weight_job = self.reader.weight_async(expression)
+            return True
+
+        ## :tag NAME, tag sets the B key adds events to from now on
+        if words[0] == ':tag':
+            if len(words) != 2:
+                print 'Usage : :tag NAME'
+                return True
+            self.reader.tag_set = words[1]
+            print 'B now tags events %s' % words[1]
+            return True
+
+        ## :tagged NAME, browse the events of a tag set
+        if words[0] == ':tagged':
+            if len(words) != 2:
+                print 'Usage : :tagged NAME'
+                return True
+            selection = self.reader.tag_selection(words[1])
+            if selection is not None and self.reader.apply_cut(text, selection):
+                new_particles = self.reader.random()
+                if new_particles is not None:
+                    self.show_event(new_particles)
+            return True
+
+        ## :tags, list the tag sets
+        if words == [':tags']:
+            tags = self.reader.tag_sets()
+            if tags is not None:
+                if len(tags.names()) == 0:
+                    print 'No event tagged yet'
+                for name in tags.names():
+                    print '%-20s %10d events' % (name, tags.size(name))
+            return True
+
+        ## :selections, list the selections @N can refer to
+        if words == [':selections']:
+            if len(self.reader.bitmaps) == 0:
+                print 'No selection applied yet'
+            for number, (cut_string, bitmap) in enumerate(self.reader.bitmaps):
+                print '@%-3d %10d events : %s' % (number+1, bitmap.count(), cut_string)
+            return True
+
+        print 'Unknown command %s, use :goto, :weight, :tag, :tagged, :tags or :selections' % words[0]
+        return True
+
+
+
+    ## ---------------------------------------- ##
+    def goto_event(self, run, event):
+        """
+        Show an event given its run and event numbers, building the event
+        index first if there is none yet
+        """
+
+        if not self.reader.open_index():
+            self.goto_target = (run, event)
+            if self.index_job is None:
+                print 'Indexing events by %s and %s, only needed once' % (config.run_branch, config.event_branch)
+                self.index_job = self.reader.index_async()
+            return
+
+        entry = self.reader.find_event(run, event)
+        if entry is None:
+            print 'No event %d in run %d' % (event, run)
+            return
+
+        self.show_event(self.reader.goto_entry(entry))
+
+
+
+    ## ---------------------------------------- ##
+    def show_event(self, new_particles):
+        """
+        Replace the displayed event with new particles
+        """
+
+        ## Prepare for new event, remove particles from old event
+        for particle in self.particles:
+            particle.delete()
+
+        self.particles = new_particles
+
+        ## Remove calorimeter energy
+        for calo in self.calorimeters:
+            calo.reset()
+            calo.energize(self.particles)
+
+        ## Print out event information to terminal
+        self.reader.print_event()
+
+        ## Beam collision animation
+        self.beam.start()
+
+        ## Allow modification of calorimeter openGL primitives
+        self.allow_calo_update = True
+
+
+
+    ## ---------------------------------------- ##
+    def update_cut(self):
+        """
+        Report on the cut being evaluated, swap it in once ready
+        """
+
+        job = self.cut_job
+        progress = job.progress
+
+        if not job.done:
+            fraction = progress.fraction()
+            if fraction is None:
+                self.interface.set_progress('Applying cut ... %d events scanned, %d passing' %
+                                            (progress.scanned, progress.passing))
+            else:
+                self.interface.set_progress('Applying cut ... %d%%, %d events scanned, %d passing' %
+                                            (100*fraction, progress.scanned, progress.passing))
+            return
+
+        self.cut_job = None
+        self.interface.set_progress('')
+
+        if job.error is not None:
+            print 'Could not apply cut "%s" : %s' % (job.cut_string, job.error)
+            return
+
+        ## Select a random event that passes the cut, print and display
+        if self.reader.apply_cut(job.cut_string, job.result):
+            new_particles = self.reader.random()
+            if new_particles is not None:
+                self.show_event(new_particles)
+
+
+
+    ## ---------------------------------------- ##
+    def update_reader(self):
+        """
+        Report on the opening of the input file, unlock navigation once done
+        """
+
+        job = self.reader_job
+
+        if not job.done:
+            self.interface.set_progress('Opening %s ...' % config.filename)
+            return
+
+        self.reader_job = None
+        self.interface.set_progress('')
+
+        if job.error is not None:
+            print 'Could not open %s : %s' % (config.filename, job.error)
+            return
+
+        self.reader = job.result
+        print 'Events ready %.2f s after launch' % (time.time() - self.launch_time)
+
+
+
+    ## ---------------------------------------- ##
+    def update_advance(self, dt):
+        """
+        Show the next event when it is time to, stop at the last one
+        unless more events may arrive
+        """
+
+        self.advance_wait += dt
+        if self.advance_wait < 1.0/self.advance_rate:
+            return
+
+        ## Do not catch up on frames that came late
+        self.advance_wait = 0.0
+
+        new_particles = self.reader.next()
+        if new_particles is None:
+            if not self.reader.live():
+                self.advancing = False
+        else:
+            self.show_event(new_particles)
+
+
+
+    ## ---------------------------------------- ##
+    def update_export(self):
+        """
+        Report on the skim being written
+        """
+
+        job = self.export_job
+
+        if not job.done:
+            fraction = job.progress.fraction()
+            if fraction is not None:
+                self.interface.set_progress('Exporting events ... %d%%' % (100*fraction))
+            return
+
+        self.export_job = None
+        self.interface.set_progress('')
+
+        if job.error is not None:
+            print 'Could not export the events : %s' % job.error
+            return
+
+        print 'Wrote %d events to %s.' % (job.result, job.path)
+        print 'Set filename=%s in config.ini to open them.' % job.path
+
+
+
+    ## ---------------------------------------- ##
+    def update_weight(self):
+        """
+        Report on the event weights being evaluated, use them once ready
+        """
+
+        job = self.weight_job
+
+        if not job.done:
+            fraction = job.progress.fraction()
+            if fraction is not None:
+                self.interface.set_progress('Weighting events ... %d%%' % (100*fraction))
+            return
+
+        self.weight_job = None
+        self.interface.set_progress('')
+
+        if job.error is not None:
+            print 'Could not weight the events by "%s" : %s' % (job.expression, job.error)
+            return
+
+        self.reader.set_weights(job.expression, job.result)
+        print 'Random events are drawn in proportion to "%s"' % job.expression
+
+
+
+    ## ---------------------------------------- ##
+    def update_index(self):
+        """
+        Report on the event index being built, go to the requested event once ready
+        """
+
+        job = self.index_job
+
+        if not job.done:
+            fraction = job.progress.fraction()
+            if fraction is not None:
+                self.interface.set_progress('Indexing events ... %d%%' % (100*fraction))
+            return
+
+        self.index_job = None
+        self.interface.set_progress('')
+
+        if job.error is not None:
+            print 'Could not index the events : %s' % job.error
+            return
+
+        self.goto_event(*self.goto_target)
 
 
 
@@ -451,6 +785,30 @@ class Display(pyglet.window.Window):
         for calo in self.calorimeters:
             calo.update(dt)
 
+        ## Follow the opening of the input file
+        if self.reader_job is not None:
+            self.update_reader()
+
+        ## Follow the cut being evaluated
+        if self.cut_job is not None:
+            self.update_cut()
+
+        ## Follow the event index being built
+        if self.index_job is not None:
+            self.update_index()
+
+        ## Follow the skim being written
+        if self.export_job is not None:
+            self.update_export()
+
+        ## Follow the event weights being evaluated
+        if self.weight_job is not None:
+            self.update_weight()
+
+        ## Move on to the next event by itself
+        if self.advancing and self.reader is not None and not self.text_input_mode:
+            self.update_advance(dt)
+
         ## Update interface
         if self.text_input_mode:
             self.text_editor.update(dt)
@@ -512,5 +870,9 @@ class Display(pyglet.window.Window):
         self.mode_2D()
         self.interface.draw()
 
+        if not self.first_frame_shown:
+            self.first_frame_shown = True
+            print 'First frame %.2f s after launch' % (time.time() - self.launch_time)
+
         ## Switch back to 3D scene to allow for manipulation
         self.mode_3D()
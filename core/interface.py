@@ -130,6 +130,19 @@ class Interface():
 
 
         
+        ## Progress field ##
+        #-----------------#
+        
+        self.progress_field = pyglet.text.Label('',
+                                                font_name='Monaco',
+                                                font_size=10,
+                                                x=window_width*0.02,
+                                                y=window_height*0.06,
+                                                color=(73, 145, 255, 160),
+                                                align='center')
+
+
+        
         ## Display everything initially
         self.resize(window_width, window_height)
 
@@ -188,6 +201,10 @@ class Interface():
         self.text_field.x = window_width*0.02
         self.text_field.y = window_height*0.1
 
+        ## Reposition progress field
+        self.progress_field.x = window_width*0.02
+        self.progress_field.y = window_height*0.06
+
 
 
     ## --------------------------------------- ##
@@ -199,6 +216,15 @@ class Interface():
 
 
 
+    ## --------------------------------------- ##
+    def set_progress(self, text):
+        """
+        Set the progress field content
+        """
+        self.progress_field.text = text
+
+
+
     ## --------------------------------------- ##
     def update(self, dt):
         """
@@ -269,6 +295,9 @@ class Interface():
         ## Draw text field
         self.text_field.draw()
 
+        ## Draw progress field
+        self.progress_field.draw()
+
 
 
     ## --------------------------------------- ##
@@ -25,90 +25,29 @@
 #   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
 #############################################################################
 
-## ROOT imports
-from ROOT import gROOT
-
 ## CDER imports
-from reader import Reader
-
-## Enable ROOT to read std::vectors
-gROOT.ProcessLine('.L core/reader/addVectorToROOT.C+')
+from reader import Reader, CUT_NO_SELECTION
 
 ####################################################
 class Custom_Reader(Reader):
 
-    ## --------------------------------------- ##
-    def __init__(self, file_path, tree_name):
-        """
-        Constructor
-        """
-        
-        Reader.__init__(self, file_path, tree_name)
-
-
-            
-    ## --------------------------------------- ##
-    def get_taus(self):
-        """
-        Taus
-        """
-
-        if self.tree.nTaus > 0:
-            self.event_taus.append((self.tree.tau1_pt, self.tree.tau1_eta, self.tree.tau1_phi))
-        if self.tree.nTaus > 1:
-            self.event_taus.append((self.tree.tau2_pt, self.tree.tau2_eta, self.tree.tau2_phi))
-
-
-        
-    ## --------------------------------------- ##
-    def get_muons(self):
-        """
-        Muons
-        """
-
-        if self.tree.lep1_flavour == 13:
-            self.event_muons.append((self.tree.lep1_pt, self.tree.lep1_eta, self.tree.lep1_phi))
-        if self.tree.lep2_flavour == 13:
-            self.event_muons.append((self.tree.lep2_pt, self.tree.lep2_eta, self.tree.lep2_phi))
-        if self.tree.lep3_flavour == 13:
-            self.event_muons.append((self.tree.lep3_pt, self.tree.lep3_eta, self.tree.lep3_phi))
-        if self.tree.lep4_flavour == 13:
-            self.event_muons.append((self.tree.lep4_pt, self.tree.lep4_eta, self.tree.lep4_phi))
-
-
-            
-    ## --------------------------------------- ##
-    def get_electrons(self):
-        """
-        Electrons
-        """
-        
-        if self.tree.lep1_flavour == 11:
-            self.event_electrons.append((self.tree.lep1_pt, self.tree.lep1_eta, self.tree.lep1_phi))
-        if self.tree.lep2_flavour == 11:
-            self.event_electrons.append((self.tree.lep2_pt, self.tree.lep2_eta, self.tree.lep2_phi))
-        if self.tree.lep3_flavour == 11:
-            self.event_electrons.append((self.tree.lep3_pt, self.tree.lep3_eta, self.tree.lep3_phi))
-        if self.tree.lep4_flavour == 11:
-            self.event_electrons.append((self.tree.lep4_pt, self.tree.lep4_eta, self.tree.lep4_phi))
-
+    ## Objects to display, MET_pt is in GeV
+    schema = {'taus'      : [{'pt' : 'tau1_pt', 'eta' : 'tau1_eta', 'phi' : 'tau1_phi', 'select' : 'nTaus > 0'},
+                             {'pt' : 'tau2_pt', 'eta' : 'tau2_eta', 'phi' : 'tau2_phi', 'select' : 'nTaus > 1'}],
+              'muons'     : [{'pt' : 'lep1_pt', 'eta' : 'lep1_eta', 'phi' : 'lep1_phi', 'select' : 'lep1_flavour == 13'},
+                             {'pt' : 'lep2_pt', 'eta' : 'lep2_eta', 'phi' : 'lep2_phi', 'select' : 'lep2_flavour == 13'},
+                             {'pt' : 'lep3_pt', 'eta' : 'lep3_eta', 'phi' : 'lep3_phi', 'select' : 'lep3_flavour == 13'},
+                             {'pt' : 'lep4_pt', 'eta' : 'lep4_eta', 'phi' : 'lep4_phi', 'select' : 'lep4_flavour == 13'}],
+              'electrons' : [{'pt' : 'lep1_pt', 'eta' : 'lep1_eta', 'phi' : 'lep1_phi', 'select' : 'lep1_flavour == 11'},
+                             {'pt' : 'lep2_pt', 'eta' : 'lep2_eta', 'phi' : 'lep2_phi', 'select' : 'lep2_flavour == 11'},
+                             {'pt' : 'lep3_pt', 'eta' : 'lep3_eta', 'phi' : 'lep3_phi', 'select' : 'lep3_flavour == 11'},
+                             {'pt' : 'lep4_pt', 'eta' : 'lep4_eta', 'phi' : 'lep4_phi', 'select' : 'lep4_flavour == 11'}],
+              'met'       : [{'pt' : 'MET_pt', 'unit' : 1000.0, 'phi' : 'MET_phi'}]}
 
-    
     ## --------------------------------------- ##
-    def get_met(self):
+    def __init__(self, file_path, tree_name, initial_cut_string=CUT_NO_SELECTION):
         """
-        MET
+        Constructor
         """
         
-        self.event_met = (self.tree.MET_pt*1000.0, self.tree.MET_phi)
-
-
-        
-    ## --------------------------------------- ##
-    def get_extra_information(self):
-        """
-        Extra information
-        """
-
-
-            
+        Reader.__init__(self, file_path, tree_name, initial_cut_string)
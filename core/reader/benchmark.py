@@ -0,0 +1,305 @@
+#**************************************************#
+# file   : core/reader/benchmark.py                #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Time the navigation and cuts of the Reader over  #
+# synthetic samples and write the results as JSON  #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import os, sys, json, time, timeit, platform, argparse, subprocess
+
+## numpy imports
+import numpy
+
+## Pyglet imports
+import pyglet
+
+## CDER imports
+from .. import config
+from .reader import reader_schema
+from .example_reader import Custom_Reader
+from .synthetic import SyntheticStore, write_tree, scaled_multiplicities, BRANCHES, BLOCK_SIZE, GENERATOR_VERSION
+from .mapped import write_cache, is_cache
+from .selection import SelectionCache
+from .inputs import user_cache_directory
+
+## Version of the results file, changes whenever results cannot be compared
+RESULTS_VERSION = 1
+
+## Samples: numbers of entries, object multiplicities as factors of the
+## nominal ones, and file formats
+SIZES    = (1000, 100000)
+PROFILES = {'low'     : 0.25,
+            'nominal' : 1.0,
+            'high'    : 4.0}
+FORMATS  = ('root', 'cder')
+
+## Name of the tree in the samples
+TREE_NAME = 'events'
+
+## Cuts timed on every sample, from one branch to reductions over objects
+CUTS = ('MET > 50000',
+        'Sum$(jet_pt > 50000) >= 2',
+        'Length$(mu_pt) + Length$(el_pt) > 0 && MET > 20000')
+
+## Reported percentiles of the call times
+PERCENTILES = (50, 90, 99)
+
+## Settings of config.ini changing the results
+READER_SETTINGS = ('prefetch_depth', 'columnar', 'columnar_chunk_size', 'cut_chunk_size',
+                   'cut_processes', 'prune_branches', 'shuffle_seed')
+
+
+## --------------------------------------- ##
+def sample_path(directory, form, n_entries, profile, seed):
+    """
+    Path of a sample, samples are generated once and reused by later runs
+    """
+
+    extension = {'root' : '.root', 'cder' : '.cder'}[form]
+    name = 'synthetic-v%d-%s-%d-%d%s' % (GENERATOR_VERSION, profile, n_entries, seed, extension)
+    return os.path.join(directory, name)
+
+
+
+## --------------------------------------- ##
+def make_sample(path, form, n_entries, profile, seed):
+    """
+    Generate a sample with the branches of example.root, unless it exists
+    """
+
+    if os.path.isfile(path) or is_cache(path):
+        return
+
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    print 'Generating %s ...' % path
+    multiplicities = scaled_multiplicities(PROFILES[profile])
+
+    if form == 'root':
+        store = SyntheticStore(n_entries, BRANCHES, seed, multiplicities, chunk_size=16*BLOCK_SIZE)
+        write_tree(store, path, TREE_NAME)
+
+    ## The columns of the reader, and the branches cuts may use
+    else:
+        expressions = list(BRANCHES)
+        for expression in reader_schema(Custom_Reader).expressions:
+            if expression not in expressions:
+                expressions.append(expression)
+        store = SyntheticStore(n_entries, expressions, seed, multiplicities, chunk_size=16*BLOCK_SIZE)
+        write_cache(store, path, 'example_reader', TREE_NAME)
+
+
+
+## --------------------------------------- ##
+def time_calls(function, calls):
+    """
+    Time calls to a function, in seconds
+    """
+
+    times = []
+    for i in range(calls):
+        start = timeit.default_timer()
+        function()
+        times.append(timeit.default_timer() - start)
+    return times
+
+
+
+## --------------------------------------- ##
+def summarize(times):
+    """
+    Statistics of call times, in seconds
+    """
+
+    times = numpy.array(times, dtype=numpy.float64)
+
+    summary = {'calls' : len(times),
+               'mean'  : times.mean(),
+               'min'   : times.min(),
+               'max'   : times.max()}
+    for percentile in PERCENTILES:
+        summary['p%d' % percentile] = numpy.percentile(times, percentile)
+
+    return summary
+
+
+
+## --------------------------------------- ##
+def benchmark_reader(path, calls, repeat):
+    """
+    Time the reader over a sample, as (operation, argument, times) triples
+    """
+
+    timings = []
+
+    start = timeit.default_timer()
+    reader = Custom_Reader(path, TREE_NAME)
+    timings.append(('open', None, [timeit.default_timer() - start]))
+
+    ## Walk forward from the first event, then back
+    n_calls = min(calls, reader.entries)
+    timings.append(('next', None, time_calls(reader.next, n_calls)))
+    timings.append(('previous', None, time_calls(reader.previous, n_calls)))
+    timings.append(('random', None, time_calls(reader.random, n_calls)))
+
+    ## Particles of random events, the kinematics being already decoded
+    times = []
+    for i in range(n_calls):
+        reader.random()
+        reader.event_particles = []
+        times += time_calls(reader.make_particles, 1)
+    timings.append(('make_particles', None, times))
+
+    ## Selections are computed again every time, not taken from the cache
+    for cut_string in CUTS:
+        cut_times, reset_times = [], []
+        for i in range(repeat):
+            reader.selection_cache = SelectionCache(0)
+            cut_times += time_calls(lambda: reader.cut(cut_string), 1)
+            reset_times += time_calls(reader.reset_cut, 1)
+        timings.append(('cut', cut_string, cut_times))
+        timings.append(('reset_cut', cut_string, reset_times))
+
+    if reader.prefetcher is not None:
+        reader.prefetcher.stop()
+
+    return timings
+
+
+
+## --------------------------------------- ##
+def source_version():
+    """
+    Commit of the CDER sources, and whether they have local changes
+    """
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=directory).strip()
+        changes = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=directory)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+    return commit, len(changes.strip()) > 0
+
+
+
+## --------------------------------------- ##
+def environment():
+    """
+    What the results depend on besides the samples
+    """
+
+    commit, modified = source_version()
+
+    try:
+        from ROOT import gROOT
+        root_version = gROOT.GetVersion()
+    except ImportError:
+        root_version = None
+
+    return {'commit'   : commit,
+            'modified' : modified,
+            'python'   : platform.python_version(),
+            'numpy'    : numpy.__version__,
+            'root'     : root_version,
+            'machine'  : platform.platform(),
+            'config'   : dict((name, getattr(config, name)) for name in READER_SETTINGS)}
+
+
+
+## --------------------------------------- ##
+def main(arguments):
+    """
+    python -m core.reader.benchmark [options], see --help
+    """
+
+    parser = argparse.ArgumentParser(prog='python -m core.reader.benchmark',
+                                     description='Time the CDER Reader over synthetic samples.')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES),
+                        help='numbers of entries of the samples, up to 10000000 (default %(default)s)')
+    parser.add_argument('--profiles', default='nominal',
+                        help='object multiplicities among %s (default %%(default)s)' % ', '.join(sorted(PROFILES)))
+    parser.add_argument('--formats', default=','.join(FORMATS),
+                        help='ROOT files and/or columnar caches (default %(default)s)')
+    parser.add_argument('--calls', type=int, default=200,
+                        help='calls timed for each navigation method (default %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='times each cut is applied (default %(default)s)')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the samples (default %(default)s)')
+    parser.add_argument('--samples', default=os.path.join(user_cache_directory(), 'benchmark'),
+                        help='directory of the generated samples (default %(default)s)')
+    parser.add_argument('--output', default='benchmark.json', help='results file (default %(default)s)')
+    options = parser.parse_args(arguments)
+
+    sizes    = [int(float(size)) for size in options.sizes.split(',')]
+    profiles = options.profiles.split(',')
+    formats  = options.formats.split(',')
+    for profile in profiles:
+        if profile not in PROFILES:
+            parser.error('unknown profile %s' % profile)
+    for form in formats:
+        if form not in FORMATS:
+            parser.error('unknown format %s' % form)
+
+    ## Particles are drawn into OpenGL display lists, which needs a context
+    window = pyglet.window.Window(visible=False)
+
+    results = []
+    for form in formats:
+        for profile in profiles:
+            for n_entries in sizes:
+                path = sample_path(options.samples, form, n_entries, profile, options.seed)
+                make_sample(path, form, n_entries, profile, options.seed)
+
+                print 'Timing %s ...' % path
+                for operation, argument, times in benchmark_reader(path, options.calls, options.repeat):
+                    results.append({'format'    : form,
+                                    'profile'   : profile,
+                                    'entries'   : n_entries,
+                                    'operation' : operation,
+                                    'argument'  : argument,
+                                    'seconds'   : summarize(times)})
+
+    window.close()
+
+    report = {'version'     : RESULTS_VERSION,
+              'date'        : time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'seed'        : options.seed,
+              'generator'   : GENERATOR_VERSION,
+              'environment' : environment(),
+              'results'     : results}
+
+    with open(options.output, 'w') as output:
+        json.dump(report, output, indent=1, sort_keys=True)
+
+    print 'Wrote %d results to %s.' % (len(results), options.output)
+
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,279 @@
+#**************************************************#
+# file   : core/reader/bitmap.py                   #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Compressed bitmaps of selected entries, and the  #
+# boolean algebra of previous selections (@1 &&    #
+# !@3)                                             #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## numpy imports
+import numpy
+
+## CDER imports
+from expression import parse, ExpressionError
+
+## Entries are split in chunks of CHUNK_BITS. A chunk with few entries keeps
+## their offsets (uint16), a fuller one keeps its bits packed in bytes (uint8).
+## Chunks without entries are not stored.
+CHUNK_BITS   = 1 << 16
+SPARSE_LIMIT = CHUNK_BITS / 16
+
+
+## --------------------------------------- ##
+def compress(offsets):
+    """
+    Container of the sorted offsets of a chunk, None if there are none
+    """
+
+    if len(offsets) == 0:
+        return None
+    if len(offsets) <= SPARSE_LIMIT:
+        return offsets.astype(numpy.uint16)
+
+    bits = numpy.zeros(CHUNK_BITS, dtype=bool)
+    bits[offsets] = True
+    return numpy.packbits(bits)
+
+
+
+## --------------------------------------- ##
+def expand(container):
+    """
+    Bits of a chunk as a boolean array
+    """
+
+    if container is None:
+        return numpy.zeros(CHUNK_BITS, dtype=bool)
+    if container.dtype == numpy.uint16:
+        bits = numpy.zeros(CHUNK_BITS, dtype=bool)
+        bits[container] = True
+        return bits
+    return numpy.unpackbits(container).astype(bool)
+
+
+
+## --------------------------------------- ##
+def offsets(container):
+    """
+    Sorted offsets of the entries of a chunk
+    """
+
+    if container is None:
+        return numpy.zeros(0, dtype=numpy.int64)
+    if container.dtype == numpy.uint16:
+        return container.astype(numpy.int64)
+    return numpy.flatnonzero(numpy.unpackbits(container))
+
+
+
+####################################################
+class Bitmap():
+
+    ## --------------------------------------- ##
+    def __init__(self, n_entries, containers=None):
+        """
+        Constructor. Set of entries among n_entries, containers maps chunk
+        indices to the containers of their entries.
+        """
+
+        self.n_entries  = n_entries
+        self.containers = containers or {}
+
+
+
+    ## --------------------------------------- ##
+    def entries(self):
+        """
+        Sorted array of the entries in the set
+        """
+
+        chunks = [offsets(self.containers[index]) + index*CHUNK_BITS
+                  for index in sorted(self.containers)]
+        if len(chunks) == 0:
+            return numpy.zeros(0, dtype=numpy.int64)
+        return numpy.concatenate(chunks)
+
+
+
+    ## --------------------------------------- ##
+    def count(self):
+        """
+        Number of entries in the set
+        """
+
+        total = 0
+        for container in self.containers.itervalues():
+            if container.dtype == numpy.uint16:
+                total += len(container)
+            else:
+                total += int(numpy.unpackbits(container).sum())
+        return total
+
+
+
+    ## --------------------------------------- ##
+    def nbytes(self):
+        """
+        Memory taken by the containers
+        """
+
+        return sum(container.nbytes for container in self.containers.itervalues())
+
+
+
+    ## --------------------------------------- ##
+    def combine(self, other, operation):
+        """
+        Chunk by chunk combination of two bitmaps with a numpy bitwise function
+        """
+
+        n_entries = max(self.n_entries, other.n_entries)
+
+        ## Chunks missing on both sides stay empty for and, or, and-not
+        indices = set(self.containers)
+        if operation is not numpy.logical_and:
+            indices |= set(other.containers)
+
+        containers = {}
+        for index in indices:
+            mine, theirs = self.containers.get(index), other.containers.get(index)
+
+            ## Sparse chunks are combined without expanding them
+            if mine is not None and theirs is not None and \
+               mine.dtype == numpy.uint16 and theirs.dtype == numpy.uint16:
+                if operation is numpy.logical_and:
+                    result = numpy.intersect1d(mine, theirs, assume_unique=True)
+                else:
+                    result = numpy.union1d(mine, theirs)
+            else:
+                result = numpy.flatnonzero(operation(expand(mine), expand(theirs)))
+
+            container = compress(result)
+            if container is not None:
+                containers[index] = container
+
+        return Bitmap(n_entries, containers)
+
+
+
+    ## --------------------------------------- ##
+    def __and__(self, other):
+        return self.combine(other, numpy.logical_and)
+
+    def __or__(self, other):
+        return self.combine(other, numpy.logical_or)
+
+
+
+    ## --------------------------------------- ##
+    def invert(self):
+        """
+        Entries not in the set
+        """
+
+        containers = {}
+        for index in range((self.n_entries + CHUNK_BITS - 1) / CHUNK_BITS):
+            bits = ~expand(self.containers.get(index))
+
+            ## Past the last entry
+            last = self.n_entries - index*CHUNK_BITS
+            if last < CHUNK_BITS:
+                bits[last:] = False
+
+            container = compress(numpy.flatnonzero(bits))
+            if container is not None:
+                containers[index] = container
+
+        return Bitmap(self.n_entries, containers)
+
+
+
+## --------------------------------------- ##
+def from_entries(entries, n_entries):
+    """
+    Bitmap of a sorted array of entries among n_entries
+    """
+
+    entries = numpy.asarray(entries, dtype=numpy.int64)
+    chunk_indices = entries / CHUNK_BITS
+    bounds = numpy.flatnonzero(numpy.diff(chunk_indices)) + 1
+
+    containers = {}
+    for chunk in numpy.split(entries, bounds):
+        if len(chunk) > 0:
+            index = int(chunk[0] / CHUNK_BITS)
+            containers[index] = compress(chunk - index*CHUNK_BITS)
+
+    return Bitmap(n_entries, containers)
+
+
+
+## --------------------------------------- ##
+def uses_selections(cut_string):
+    """
+    Does a cut combine previous selections (@N)?
+    """
+
+    try:
+        node = parse(cut_string)
+    except ExpressionError:
+        return False
+
+    def walk(node):
+        if node[0] == 'selection':
+            return True
+        return any(walk(child) for child in node[2:] if isinstance(child, tuple))
+
+    return walk(node)
+
+
+
+## --------------------------------------- ##
+def combine_selections(cut_string, bitmaps, n_entries):
+    """
+    Entries of a combination of previous selections, bitmaps[N-1] being
+    the bitmap of @N. Only &&, ||, ! and parentheses are allowed.
+    """
+
+    def evaluate(node):
+        kind = node[0]
+
+        if kind == 'selection':
+            if not 1 <= node[1] <= len(bitmaps):
+                raise ExpressionError('There is no selection @%d' % node[1])
+            return bitmaps[node[1]-1]
+
+        if kind == 'unary' and node[1] == '!':
+            bitmap = evaluate(node[2])
+            return Bitmap(n_entries, bitmap.containers).invert()
+
+        if kind == 'binary' and node[1] == '&&':
+            return evaluate(node[2]) & evaluate(node[3])
+
+        if kind == 'binary' and node[1] == '||':
+            return evaluate(node[2]) | evaluate(node[3])
+
+        raise ExpressionError('Selections (@N) only combine with &&, || and !')
+
+    return evaluate(parse(cut_string)).entries()
@@ -0,0 +1,221 @@
+#**************************************************#
+# file   : core/reader/branches.py                 #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Keep only the branches read by the reader and    #
+# the cuts active, so that GetEntry does not       #
+# decompress the others                            #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+
+## --------------------------------------- ##
+def branch_names(tree):
+    """
+    Dictionary mapping the names PyROOT accepts as attributes of the tree
+    (branch and leaf names) to the branches holding them
+    """
+
+    ## The branches are only known once a tree of the chain is loaded
+    if tree.GetReadEntry() < 0:
+        tree.LoadTree(0)
+
+    names = {}
+    for leaf in tree.GetListOfLeaves():
+        names[leaf.GetName()] = leaf.GetBranch().GetName()
+    for branch in tree.GetListOfBranches():
+        names[branch.GetName()] = branch.GetName()
+    return names
+
+
+
+## --------------------------------------- ##
+def formula_branches(tree, expression):
+    """
+    Set of the branches a TTreeFormula expression reads, empty if the
+    expression is not valid
+    """
+
+    from ROOT import TTreeFormula
+
+    if tree.GetReadEntry() < 0:
+        tree.LoadTree(0)
+
+    formula = TTreeFormula('cder_branches', expression, tree)
+    if formula.GetNdim() == 0:
+        return set()
+
+    branches = set()
+    for i in range(formula.GetNcodes()):
+        leaf = formula.GetLeaf(i)
+        if leaf:
+            branches.add(leaf.GetBranch().GetName())
+    return branches
+
+
+
+####################################################
+class BranchRecorder():
+
+    ## --------------------------------------- ##
+    def __init__(self, tree, names):
+        """
+        Constructor. Stands for the tree in the kinematic getters and
+        records the branches they read. names is the output of branch_names.
+        """
+
+        self.__dict__['tree']    = tree
+        self.__dict__['names']   = names
+        self.__dict__['touched'] = set()
+
+
+
+    ## --------------------------------------- ##
+    def __getattr__(self, name):
+        """
+        Forward to the tree, remembering branches
+        """
+
+        branch = self.names.get(name)
+        if branch is not None:
+            self.touched.add(branch)
+        return getattr(self.tree, name)
+
+
+
+####################################################
+class BranchPruner():
+
+    ## --------------------------------------- ##
+    def __init__(self, tree, declared=()):
+        """
+        Constructor. declared are branches known to be read by the getters,
+        the others are discovered while reading events. All the branches
+        stay active until the getters have run once.
+        """
+
+        self.tree  = tree
+        self.names = branch_names(tree)
+
+        all_branches = set(self.names.itervalues())
+
+        ## Branches read by the getters, branches needed by the current cut,
+        ## and branches read by running jobs with their number of jobs
+        self.used  = set(declared) & all_branches
+        self.extra = set()
+        self.held  = {}
+
+        ## Can branches be switched off yet?
+        self.known = len(self.used) > 0
+
+        ## Active branches, None if all of them are
+        self.active = None
+        self.prune()
+
+
+
+    ## --------------------------------------- ##
+    def record(self, touched):
+        """
+        Take note of the branches read by the getters for one event. Returns
+        True if some of them were inactive, the event must then be read again.
+        """
+
+        self.used.update(touched)
+
+        if not self.known:
+            self.known = True
+            self.prune()
+            return False
+
+        if self.active is None or touched <= self.active:
+            return False
+
+        self.require(touched)
+        return True
+
+
+
+    ## --------------------------------------- ##
+    def require(self, branches):
+        """
+        Activate branches on top of the active ones, until the next prune
+        """
+
+        if self.active is None:
+            return
+
+        for branch in sorted(set(branches) - self.active):
+            self.tree.SetBranchStatus(branch, 1)
+            self.active.add(branch)
+
+
+
+    ## --------------------------------------- ##
+    def hold(self, branches):
+        """
+        Activate branches and keep them active through prunes until they
+        are released, for a job reading them in the background
+        """
+
+        for branch in set(branches):
+            self.held[branch] = self.held.get(branch, 0) + 1
+        self.require(branches)
+
+
+
+    ## --------------------------------------- ##
+    def release(self, branches):
+        """
+        Let the next prune switch off held branches, once no other job holds them
+        """
+
+        for branch in set(branches):
+            count = self.held.get(branch, 0) - 1
+            if count > 0:
+                self.held[branch] = count
+            else:
+                self.held.pop(branch, None)
+
+
+
+    ## --------------------------------------- ##
+    def prune(self, extra=None):
+        """
+        Only keep the branches used by the getters, the extra ones and the
+        held ones active. The extra branches are kept from the previous
+        call if not given.
+        """
+
+        if extra is not None:
+            self.extra = set(extra)
+        if not self.known:
+            return
+
+        wanted = self.used | self.extra | set(self.held)
+        if wanted == self.active:
+            return
+
+        self.tree.SetBranchStatus('*', 0)
+        for branch in sorted(wanted):
+            self.tree.SetBranchStatus(branch, 1)
+        self.active = wanted
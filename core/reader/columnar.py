@@ -0,0 +1,455 @@
+#**************************************************#
+# file   : core/reader/columnar.py                 #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Preload tree branches into flat numpy arrays     #
+# with offsets, so that reading an event becomes   #
+# slicing                                          #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import copy, threading
+from collections import OrderedDict
+
+## numpy imports
+import numpy
+
+## CDER imports
+from expression import parse, evaluate_node, is_scalar, ExpressionError
+
+## Number of entries meaning "until the end of the tree", ROOT clamps it
+ALL_ENTRIES = 1000000000000000000
+
+
+## --------------------------------------- ##
+def to_array(buffer, size):
+    """
+    Copy the content of a C double* handed back by PyROOT into a numpy array
+    """
+
+    if size == 0:
+        return numpy.zeros(0)
+
+    ## The buffer does not know its own length
+    try:
+        buffer.SetSize(size)
+    except AttributeError:
+        buffer.reshape((size,))
+
+    return numpy.frombuffer(buffer, dtype=numpy.float64, count=size).copy()
+
+
+
+## --------------------------------------- ##
+def draw(tree, expression, first_entry=0, n_entries=ALL_ENTRIES, selection='', estimate=1000000):
+    """
+    Evaluate a TTreeFormula expression over a range of entries without
+    drawing anything, return all the rows as a numpy array, or None
+    if ROOT does not understand the expression
+    """
+
+    while True:
+        tree.SetEstimate(estimate)
+        rows = tree.Draw(expression, selection, 'goff', n_entries, first_entry)
+
+        ## Invalid expression
+        if rows < 0:
+            return None
+
+        ## ROOT only keeps the last rows if the buffer was too small, try again
+        if rows <= estimate:
+            return to_array(tree.GetV1(), rows)
+
+        estimate = rows + 1
+
+
+
+## --------------------------------------- ##
+def is_per_event(tree, expression):
+    """
+    Does a valid expression only involve one value per event (no vector branch)?
+    """
+
+    from ROOT import TTreeFormula
+
+    ## The formula needs a tree of the chain to look branches up
+    if tree.GetReadEntry() < 0:
+        tree.LoadTree(0)
+
+    formula = TTreeFormula('cder_multiplicity', expression, tree)
+    return formula.GetNdim() > 0 and formula.GetMultiplicity() == 0
+
+
+
+## --------------------------------------- ##
+def evaluate_column(expression, columns, n_entries, scalars):
+    """
+    Evaluate an expression with numpy over columns of branches, as a
+    (values, offsets) pair like the columns themselves. scalars is the
+    set of branches holding one value per event.
+    """
+
+    try:
+        with numpy.errstate(all='ignore'):
+            values, counts = evaluate_node(parse(expression), columns, n_entries, scalars)
+    except ExpressionError, error:
+        raise ValueError('Cannot evaluate column "%s" (%s)' % (expression, error))
+
+    if counts is None:
+        counts = numpy.ones(len(values), dtype=numpy.int64)
+    offsets = numpy.zeros(len(counts)+1, dtype=numpy.int64)
+    numpy.cumsum(counts, out=offsets[1:])
+
+    return values, offsets
+
+
+
+## --------------------------------------- ##
+def take_rows(values, offsets, rows):
+    """
+    Values of some rows of a column, as a (values, offsets) pair
+    """
+
+    counts = offsets[rows+1] - offsets[rows]
+    taken = numpy.zeros(len(rows)+1, dtype=numpy.int64)
+    numpy.cumsum(counts, out=taken[1:])
+
+    index = numpy.repeat(offsets[rows] - taken[:-1], counts) + numpy.arange(taken[-1])
+    return values[index], taken
+
+
+
+####################################################
+class Chunk():
+
+    ## --------------------------------------- ##
+    def __init__(self, first_entry, n_entries, columns):
+        """
+        Constructor. columns maps every expression to a (values, offsets)
+        pair, values of entry i being values[offsets[i]:offsets[i+1]]
+        """
+
+        self.first_entry = first_entry
+        self.n_entries   = n_entries
+        self.columns     = columns
+
+
+
+    ## --------------------------------------- ##
+    def contains(self, entry):
+        """
+        Is the entry in this chunk?
+        """
+
+        return self.first_entry <= entry < self.first_entry + self.n_entries
+
+
+
+    ## --------------------------------------- ##
+    def event(self, entry):
+        """
+        Per-event slices of all columns
+        """
+
+        i = entry - self.first_entry
+        event = {}
+        for expression, (values, offsets) in self.columns.iteritems():
+            event[expression] = values[offsets[i]:offsets[i+1]]
+        return event
+
+
+
+####################################################
+class ColumnarStore():
+
+    ## --------------------------------------- ##
+    def __init__(self, tree, expressions, chunk_size=0, max_chunks=2, lock=None):
+        """
+        Constructor. expressions are branch names or any TTreeFormula
+        expression. Columns are read chunk_size entries at a time (0 to read
+        the whole tree at once), and at most max_chunks are kept in memory.
+        """
+
+        self.tree        = tree
+        self.expressions = list(expressions)
+        self.chunk_size  = chunk_size
+        self.max_chunks  = max(max_chunks, 1)
+
+        ## Loaded chunks, least recently used first
+        self.chunks = OrderedDict()
+
+        ## expression : does it have one value per event?
+        self.scalar_expressions = {}
+
+        ## Reading goes through the tree, which may be shared with other threads
+        if lock is None:
+            lock = threading.RLock()
+        self.lock = lock
+
+
+
+    ## --------------------------------------- ##
+    def chunk_index(self, entry):
+        """
+        Index of the chunk holding an entry
+        """
+
+        if self.chunk_size <= 0:
+            return 0
+        return entry / self.chunk_size
+
+
+
+    ## --------------------------------------- ##
+    def read_column(self, expression, first_entry, n_entries):
+        """
+        Read one column over a range of entries as a (values, offsets) pair
+        """
+
+        ## One row per entry with the number of values, then all the values
+        counts = draw(self.tree, 'Length$(%s)' % expression, first_entry, n_entries)
+        values = draw(self.tree, expression, first_entry, n_entries)
+        if counts is None or values is None:
+            raise ValueError('Cannot read column "%s"' % expression)
+
+        offsets = numpy.zeros(len(counts)+1, dtype=numpy.int64)
+        numpy.cumsum(counts.astype(numpy.int64), out=offsets[1:])
+        if offsets[-1] != len(values):
+            raise ValueError('Inconsistent number of values in column "%s"' % expression)
+
+        return values, offsets
+
+
+
+    ## --------------------------------------- ##
+    def is_scalar(self, expression):
+        """
+        Does an expression have one value per event, whatever the event?
+        Decided from the types of the branches, not from their values.
+        """
+
+        return is_per_event(self.tree, expression)
+
+
+
+    ## --------------------------------------- ##
+    def scalars(self, expressions):
+        """
+        Set of the expressions having one value per event
+        """
+
+        with self.lock:
+            for expression in expressions:
+                if expression not in self.scalar_expressions:
+                    self.scalar_expressions[expression] = self.is_scalar(expression)
+
+        return set(expression for expression in expressions if self.scalar_expressions[expression])
+
+
+
+    ## --------------------------------------- ##
+    def has_column(self, expression):
+        """
+        Can an expression be read from this store?
+        """
+
+        try:
+            with self.lock:
+                self.read_column(expression, 0, 1)
+        except (ValueError, ExpressionError):
+            return False
+        return True
+
+
+
+    ## --------------------------------------- ##
+    def extended(self, expressions):
+        """
+        Store over the same input declaring more columns, with chunks of its own
+        """
+
+        store = copy.copy(self)
+        store.expressions = self.expressions + [expression for expression in expressions
+                                                if expression not in self.expressions]
+        store.chunks = OrderedDict()
+        return store
+
+
+
+    ## --------------------------------------- ##
+    def load(self, index, expressions=()):
+        """
+        Chunk of a given index with the declared columns and any other
+        expressions requested, reading what is missing
+        """
+
+        if self.chunk_size <= 0:
+            first_entry, n_entries = 0, ALL_ENTRIES
+        else:
+            first_entry, n_entries = index*self.chunk_size, self.chunk_size
+
+        with self.lock:
+            chunk = self.chunks.pop(index, None)
+            if chunk is None:
+                chunk = Chunk(first_entry, 0, {})
+
+            for expression in self.expressions + list(expressions):
+                if expression not in chunk.columns:
+                    values, offsets = self.read_column(expression, first_entry, n_entries)
+                    chunk.columns[expression] = (values, offsets)
+                    chunk.n_entries = len(offsets) - 1
+
+            ## Most recently used last, forget the oldest ones
+            self.chunks[index] = chunk
+            while len(self.chunks) > self.max_chunks:
+                self.chunks.popitem(last=False)
+
+        return chunk
+
+
+
+    ## --------------------------------------- ##
+    def last_chunk(self, chunk):
+        """
+        Is there nothing to read after this chunk?
+        """
+
+        return self.chunk_size <= 0 or chunk.n_entries < self.chunk_size
+
+
+
+    ## --------------------------------------- ##
+    def iter_chunks(self, entries=None):
+        """
+        All the chunks in order, or only the ones holding some of the
+        given sorted entries
+        """
+
+        if entries is not None and self.chunk_size > 0:
+            for index in numpy.unique(entries / self.chunk_size):
+                yield self.load(int(index))
+            return
+
+        index = 0
+        while True:
+            chunk = self.load(index)
+            yield chunk
+            if self.last_chunk(chunk):
+                return
+            index += 1
+
+
+
+    ## --------------------------------------- ##
+    def chunk(self, entry):
+        """
+        Chunk holding an entry, read it if needed
+        """
+
+        return self.load(self.chunk_index(entry))
+
+
+
+    ## --------------------------------------- ##
+    def event(self, entry):
+        """
+        Dictionary of per-event slices of all the columns for one entry
+        """
+
+        chunk = self.chunk(entry)
+        if not chunk.contains(entry):
+            raise IndexError('Entry %d is not in the tree' % entry)
+        return chunk.event(entry)
+
+
+
+    ## --------------------------------------- ##
+    def clear(self):
+        """
+        Forget all loaded chunks
+        """
+
+        with self.lock:
+            self.chunks.clear()
+
+
+
+####################################################
+class FormulaStore():
+
+    ## --------------------------------------- ##
+    def __init__(self, tree, expressions, lock=None):
+        """
+        Constructor. Same event interface as ColumnarStore, evaluating the
+        expressions for one entry at a time with TTreeFormulas compiled
+        once. Only the branches used by the expressions are read.
+        """
+
+        from ROOT import TTreeFormula
+
+        self.tree        = tree
+        self.expressions = list(expressions)
+
+        if lock is None:
+            lock = threading.RLock()
+        self.lock = lock
+
+        ## The formulas need a tree of the chain to look branches up
+        if tree.GetReadEntry() < 0:
+            tree.LoadTree(0)
+        self.tree_number = tree.GetTreeNumber()
+
+        self.formulas = []
+        for index, expression in enumerate(self.expressions):
+            formula = TTreeFormula('cder_column%d' % index, expression, tree)
+            if formula.GetNdim() == 0:
+                raise ValueError('Cannot read column "%s"' % expression)
+            self.formulas.append((expression, formula))
+
+
+
+    ## --------------------------------------- ##
+    def event(self, entry):
+        """
+        Dictionary of the values of all the expressions for one entry
+        """
+
+        with self.lock:
+            if self.tree.LoadTree(entry) < 0:
+                raise IndexError('Entry %d is not in the tree' % entry)
+
+            ## The leaves moved to another file of the chain
+            if self.tree.GetTreeNumber() != self.tree_number:
+                self.tree_number = self.tree.GetTreeNumber()
+                for expression, formula in self.formulas:
+                    formula.UpdateFormulaLeaves()
+
+            event = {}
+            for expression, formula in self.formulas:
+                n_values = formula.GetNdata()
+                values = numpy.empty(n_values, dtype=numpy.float64)
+                for i in xrange(n_values):
+                    values[i] = formula.EvalInstance(i)
+                event[expression] = values
+
+        return event
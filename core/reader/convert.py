@@ -0,0 +1,103 @@
+#**************************************************#
+# file   : core/reader/convert.py                  #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Convert the input file of config.ini into a      #
+# columnar cache that CDER can display without     #
+# ROOT                                             #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import os, sys, time, importlib
+
+## CDER imports
+from .. import config
+from .reader import open_chain, reader_schema
+from .derived import derived_inputs
+from .columnar import ColumnarStore
+from .mapped import write_cache, EXTENSION
+from .inputs import chain_identity
+
+
+## --------------------------------------- ##
+def default_output(file_path):
+    """
+    Cache path next to the input file, wildcards left out
+    """
+
+    base = os.path.splitext(file_path.replace('*', ''))[0].rstrip('._-')
+    return base + EXTENSION
+
+
+
+## --------------------------------------- ##
+def convert(file_path, tree_name, reader_name, output):
+    """
+    Write the columns of the schema of a reader for the given input to a cache
+    """
+
+    reader_module = importlib.import_module('core.reader.%s' % reader_name)
+    schema = reader_schema(reader_module.Custom_Reader)
+    if schema is None:
+        raise ValueError('%s has no schema, there is nothing to convert' % reader_name)
+
+    chain = open_chain(file_path, tree_name)
+
+    ## Keep what the derived columns and the event index need, when the tree has it
+    expressions = list(schema.expressions)
+    for expression in derived_inputs(reader_module.Custom_Reader.derived):
+        if expression not in expressions:
+            expressions.append(expression)
+    for branch in (config.run_branch, config.event_branch):
+        if chain.GetBranch(branch) and branch not in expressions:
+            expressions.append(branch)
+
+    store = ColumnarStore(chain, expressions, chunk_size=config.columnar_chunk_size)
+
+    return write_cache(store, output, reader_name, tree_name, chain_identity(chain))
+
+
+
+## --------------------------------------- ##
+def main(arguments):
+    """
+    python -m core.reader.convert [output]
+    """
+
+    output = default_output(config.filename)
+    if len(arguments) > 0:
+        output = arguments[0]
+
+    print 'Converting %s (%s, %s) into %s' % (config.filename, config.treename, config.filereader, output)
+    print 'Please wait ...'
+
+    start = time.time()
+    n_entries = convert(config.filename, config.treename, config.filereader, output)
+
+    print 'Wrote %d events in %.1f s.' % (n_entries, time.time() - start)
+    print 'Set filename=%s in config.ini to display them.' % output
+
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,358 @@
+#**************************************************#
+# file   : core/reader/derived.py                  #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Columns computed from the branches with numpy,   #
+# chunk by chunk, and stored next to the input     #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import os, inspect, hashlib, threading
+from collections import OrderedDict
+
+## numpy imports
+import numpy
+
+## CDER imports
+from columnar import Chunk
+from expression import parse, names, evaluate_node, ExpressionError
+from inputs import sidecar_paths
+
+## Entries computed at once, and stored in one file
+DERIVED_CHUNK_SIZE = 100000
+
+## Bump to compute stored columns again
+DERIVED_VERSION = 1
+
+
+## --------------------------------------- ##
+def nth(column, n):
+    """
+    Value of the n-th object of each event of a (values, offsets) column,
+    NaN for events with fewer objects
+    """
+
+    values, offsets = column
+    counts = numpy.diff(offsets)
+
+    result = numpy.full(len(counts), numpy.nan)
+    present = counts > n
+    result[present] = values[offsets[:-1][present] + n]
+    return result
+
+
+
+## --------------------------------------- ##
+def pair_mass(pt, eta, phi, first=0, second=1):
+    """
+    Invariant mass of two massless objects of each event, given the
+    (values, offsets) columns of their kinematics, NaN if there are not
+    enough objects
+    """
+
+    pt_1, eta_1, phi_1 = [nth(column, first) for column in (pt, eta, phi)]
+    pt_2, eta_2, phi_2 = [nth(column, second) for column in (pt, eta, phi)]
+
+    with numpy.errstate(invalid='ignore'):
+        return numpy.sqrt(2*pt_1*pt_2*(numpy.cosh(eta_1 - eta_2) - numpy.cos(phi_1 - phi_2)))
+
+
+
+## --------------------------------------- ##
+def compile_definition(name, definition):
+    """
+    (inputs, function) pair of a derived column, function getting the
+    list of (values, offsets) columns of the inputs and the set of inputs
+    holding one value per event. A definition is either an expression
+    over branches evaluated with numpy (see expression.py), or an
+    (inputs, function) pair, function getting the (values, offsets)
+    column of each input over a chunk of events and returning one value
+    per event.
+    """
+
+    if not isinstance(definition, basestring):
+        inputs, user_function = definition
+        return tuple(inputs), lambda columns, scalars: user_function(*columns)
+
+    node = parse(definition)
+    inputs = tuple(sorted(names(node)))
+
+    def function(columns, scalars):
+        n_entries = len(columns[0][1]) - 1
+        with numpy.errstate(all='ignore'):
+            values, counts = evaluate_node(node, dict(zip(inputs, columns)), n_entries, scalars)
+        if counts is None:
+            return values
+
+        ## At most one value per event, such as jet_pt[1]
+        if numpy.any(counts > 1):
+            raise ExpressionError('Derived column "%s" is not one value per event' % name)
+        result = numpy.full(n_entries, numpy.nan)
+        result[counts == 1] = values
+        return result
+
+    return inputs, function
+
+
+
+## --------------------------------------- ##
+def derived_inputs(definitions):
+    """
+    Branches and expressions derived columns are computed from
+    """
+
+    inputs = set()
+    for name, definition in definitions.iteritems():
+        inputs.update(compile_definition(name, definition)[0])
+    return sorted(inputs)
+
+
+
+## --------------------------------------- ##
+def definition_key(definition):
+    """
+    What the stored values of a derived column depend on, besides the input.
+    For a function, its source and the source of its module, where the
+    helpers it calls usually are.
+    """
+
+    if isinstance(definition, basestring):
+        return (DERIVED_VERSION, definition)
+
+    inputs, function = definition
+    sources = []
+    for code in (function, inspect.getmodule(function)):
+        try:
+            sources.append(inspect.getsource(code))
+        except (IOError, TypeError):
+            sources.append(getattr(code, '__name__', repr(code)))
+    digest = hashlib.sha1('\n'.join(sources)).hexdigest()
+    return (DERIVED_VERSION, tuple(inputs), digest)
+
+
+
+####################################################
+class DerivedStore():
+
+    ## --------------------------------------- ##
+    def __init__(self, source, definitions, identity, chunk_size=DERIVED_CHUNK_SIZE, max_chunks=2, lock=None):
+        """
+        Constructor. source is a store reading any branch or expression of
+        the input over a range of entries (see ColumnarStore.read_column),
+        definitions maps the names of the derived columns to their
+        definitions (see compile_definition), identity is the identity of
+        the input files.
+        """
+
+        self.source      = source
+        self.chunk_size  = chunk_size
+        self.max_chunks  = max(max_chunks, 1)
+
+        self.definitions = {}
+        self.keys = {}
+        self.paths = {}
+        for name, definition in definitions.iteritems():
+            self.definitions[name] = compile_definition(name, definition)
+            if len(self.definitions[name][0]) == 0:
+                raise ValueError('Derived column "%s" does not read any branch' % name)
+            self.keys[name] = definition_key(definition)
+            self.paths[name] = sidecar_paths(identity, 'derived', (name, self.keys[name], chunk_size))
+
+        ## Computed chunks, least recently used first, index : {name : values}
+        self.chunks = OrderedDict()
+
+        ## Reading goes through the input, which may be shared with other threads
+        if lock is None:
+            lock = threading.RLock()
+        self.lock = lock
+
+
+
+    ## --------------------------------------- ##
+    def used_by(self, expression):
+        """
+        Does an expression use derived columns?
+        """
+
+        try:
+            return len(names(parse(expression)) & set(self.definitions)) > 0
+        except ExpressionError:
+            return False
+
+
+
+    ## --------------------------------------- ##
+    def definition_keys(self, expression):
+        """
+        Keys of the definitions of the derived columns an expression uses,
+        for what is computed from them to follow their changes
+        """
+
+        used = names(parse(expression)) & set(self.definitions)
+        return tuple((name, self.keys[name]) for name in sorted(used))
+
+
+
+    ## --------------------------------------- ##
+    def branches(self, expression):
+        """
+        Branches an expression reads, through the derived columns or directly
+        """
+
+        used = names(parse(expression))
+        branches = used - set(self.definitions)
+        for name in used & set(self.definitions):
+            branches.update(self.definitions[name][0])
+        return branches
+
+
+
+    ## --------------------------------------- ##
+    def scalars(self, expressions):
+        """
+        Set of the given expressions holding one value per event: derived
+        columns, and the others as the input says
+        """
+
+        derived = set(expressions) & set(self.definitions)
+        with self.lock:
+            return derived | self.source.scalars(set(expressions) - derived)
+
+
+
+    ## --------------------------------------- ##
+    def evaluate(self, name, first_entry, n_entries):
+        """
+        Values of a derived column over a range of entries, computed from
+        the input
+        """
+
+        inputs, function = self.definitions[name]
+        columns = [self.source.read_column(expression, first_entry, n_entries) for expression in inputs]
+        n_entries = len(columns[0][1]) - 1
+
+        values = numpy.asarray(function(columns, self.source.scalars(inputs)), dtype=numpy.float64)
+        if values.shape != (n_entries,):
+            raise ValueError('Derived column "%s" is not one value per event' % name)
+        return values
+
+
+
+    ## --------------------------------------- ##
+    def compute(self, name, index):
+        """
+        Values of a derived column over a chunk, read from disk or computed
+        and stored for the next sessions
+        """
+
+        file_name = '%d.npy' % index
+        for path in self.paths[name]:
+            try:
+                return numpy.load(os.path.join(path, file_name))
+            except (IOError, ValueError):
+                continue
+
+        values = self.evaluate(name, index*self.chunk_size, self.chunk_size)
+
+        ## Stored at the first place where it can be written
+        for path in self.paths[name]:
+            try:
+                if not os.path.isdir(path):
+                    os.makedirs(path)
+                temporary = os.path.join(path, '%s.tmp%d' % (file_name, os.getpid()))
+                with open(temporary, 'wb') as output:
+                    numpy.save(output, values)
+                os.rename(temporary, os.path.join(path, file_name))
+                break
+            except (IOError, OSError):
+                continue
+
+        return values
+
+
+
+    ## --------------------------------------- ##
+    def column(self, name, index):
+        """
+        Values of a derived column over the chunk of a given index
+        """
+
+        with self.lock:
+            columns = self.chunks.pop(index, {})
+            if name not in columns:
+                columns[name] = self.compute(name, index)
+
+            ## Most recently used last, forget the oldest ones
+            self.chunks[index] = columns
+            while len(self.chunks) > self.max_chunks:
+                self.chunks.popitem(last=False)
+
+        return columns[name]
+
+
+
+    ## --------------------------------------- ##
+    def value(self, name, entry):
+        """
+        Value of a derived column for one entry, taken from its chunk:
+        in memory, read from its stored file, or computed and stored once
+        """
+
+        values = self.column(name, entry / self.chunk_size)
+        return values[entry % self.chunk_size]
+
+
+
+    ## --------------------------------------- ##
+    def load(self, index, expressions=()):
+        """
+        Chunk of a given index with the requested derived columns and
+        branches, as with ColumnarStore.load
+        """
+
+        first_entry = index*self.chunk_size
+
+        columns = {}
+        for expression in expressions:
+            if expression in self.definitions:
+                values = self.column(expression, index)
+                columns[expression] = (values, numpy.arange(len(values)+1, dtype=numpy.int64))
+            else:
+                with self.lock:
+                    columns[expression] = self.source.read_column(expression, first_entry, self.chunk_size)
+
+        n_entries = 0
+        if len(columns) > 0:
+            n_entries = len(columns.values()[0][1]) - 1
+
+        return Chunk(first_entry, n_entries, columns)
+
+
+
+    ## --------------------------------------- ##
+    def last_chunk(self, chunk):
+        """
+        Is there nothing to read after this chunk?
+        """
+
+        return chunk.n_entries < self.chunk_size
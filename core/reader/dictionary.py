@@ -0,0 +1,127 @@
+#**************************************************#
+# file   : core/reader/dictionary.py               #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Compile the dictionary of the std::vector types  #
+# once per ROOT version and keep it in the user    #
+# cache directory                                  #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import os, shutil, hashlib, threading
+
+## CDER imports
+from inputs import user_cache_directory
+
+## Dictionary of the std::vector types found in the trees
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'addVectorToROOT.C')
+LIBRARY_NAME = 'addVectorToROOT_C'
+
+## Compilation running in the background, if any
+builder = None
+
+
+## --------------------------------------- ##
+def library_path():
+    """
+    Where the compiled dictionary is kept, a directory for each ROOT
+    version, architecture and version of the source
+    """
+
+    from ROOT import gROOT, gSystem
+
+    with open(SOURCE) as source_file:
+        digest = hashlib.sha1(source_file.read()).hexdigest()[:16]
+
+    version = '%s-%s-%s' % (gROOT.GetVersion().replace('/', '-'), gSystem.GetBuildArch(), digest)
+    directory = os.path.join(user_cache_directory(), 'dictionaries', version)
+
+    return os.path.join(directory, '%s.%s' % (LIBRARY_NAME, gSystem.GetSoExt()))
+
+
+
+## --------------------------------------- ##
+def build_dictionary():
+    """
+    Compile the dictionary with ACLiC unless it already is, return the
+    path of the library
+    """
+
+    from ROOT import gSystem
+
+    library = library_path()
+    if os.path.exists(library):
+        return library
+
+    ## Compile in a scratch directory, so that other sessions never see
+    ## a half-written library, and only load it from its final place
+    directory = os.path.dirname(library)
+    temporary = '%s.tmp%d' % (directory, os.getpid())
+    if os.path.isdir(temporary):
+        shutil.rmtree(temporary)
+    os.makedirs(temporary)
+
+    print 'Compiling %s, only needed once for this ROOT version' % os.path.basename(SOURCE)
+    if not gSystem.CompileMacro(SOURCE, 'kOc', os.path.join(temporary, os.path.basename(library)), temporary):
+        shutil.rmtree(temporary, ignore_errors=True)
+        raise RuntimeError('Cannot compile %s' % SOURCE)
+
+    ## Another session may have been faster
+    try:
+        os.rename(temporary, directory)
+    except OSError:
+        shutil.rmtree(temporary, ignore_errors=True)
+
+    return library
+
+
+
+## --------------------------------------- ##
+def build_async():
+    """
+    Start compiling the dictionary in the background if needed
+    """
+
+    global builder
+
+    builder = threading.Thread(target=build_dictionary, name='CDER dictionary')
+    builder.daemon = True
+    builder.start()
+
+
+
+## --------------------------------------- ##
+def load_vector_dictionary():
+    """
+    Enable ROOT to read std::vectors, waiting for the background
+    compilation or compiling the dictionary if needed
+    """
+
+    from ROOT import gSystem
+
+    if builder is not None:
+        builder.join()
+
+    library = build_dictionary()
+    if gSystem.Load(library) < 0:
+        raise RuntimeError('Cannot load %s' % library)
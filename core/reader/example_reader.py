@@ -25,141 +25,58 @@
 #   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
 #############################################################################
 
-## ROOT imports
-from ROOT import gROOT
-
 ## CDER imports
-from reader import Reader
+from reader import Reader, CUT_NO_SELECTION
+from derived import pair_mass
 
-## Enable ROOT to read std::vectors
-gROOT.ProcessLine('.L core/reader/addVectorToROOT.C+')
 
-####################################################
-class Custom_Reader(Reader):
+## --------------------------------------- ##
+def first_jets_mass(pt, eta, phi):
+    """
+    Invariant mass of the first two jets of each event, in GeV
+    """
 
-    ## --------------------------------------- ##
-    def __init__(self, file_path, tree_name):
-        """
-        Constructor
-        """
+    return pair_mass(pt, eta, phi)/1000.0
 
-        ## Execute the base class constructor
-        Reader.__init__(self, file_path, tree_name)
-
-
-        
-    ## --------------------------------------- ##
-    def get_jets(self):
-        """
-        Get the jet kinematics. Each entry in self.event_jets must be 
-        at least a 3-tuple containing jet pt (MeV), jet eta, and jet phi in that
-        order. If b-tagging information is relevant and available, pass a 
-        4-tuple, the last element being a boolean representing if the jet is
-        b-tagged or not.
-        """
-        
-        for i in range(len(self.tree.jet_pt)):
-            self.event_jets.append((self.tree.jet_pt[i],
-                                    self.tree.jet_eta[i],
-                                    self.tree.jet_phi[i],
-                                    self.tree.jet_btag[i]))
-
-
-
-            
-    ## --------------------------------------- ##
-    def get_taus(self):
-        """
-        Get the tau kinematics. Each entry in self.event_taus must be 
-        a 3-tuple containing tau pt (MeV), tau eta, and tau phi in that
-        order.
-        """
-        
-        for i in range(len(self.tree.tau_pt)):
-            self.event_taus.append((self.tree.tau_pt[i],
-                                    self.tree.tau_eta[i],
-                                    self.tree.tau_phi[i]))
-
-
-
-            
-    ## --------------------------------------- ##
-    def get_muons(self):
-        """
-        Get the muon kinematics. Each entry in self.event_muons must be 
-        a 3-tuple containing muon pt (MeV), muon eta, and muon phi in that
-        order.
-        """
-        
-        for i in range(len(self.tree.mu_pt)):
-            self.event_muons.append((self.tree.mu_pt[i],
-                                     self.tree.mu_eta[i],
-                                     self.tree.mu_phi[i]))
 
 
+####################################################
+class Custom_Reader(Reader):
 
-            
-    ## --------------------------------------- ##
-    def get_electrons(self):
-        """
-        Get the electron kinematics. Each entry in self.event_muons must be 
-        a 3-tuple containing electron pt (MeV), electron eta, and electron phi in that
-        order.
-        """
-        
-        for i in range(len(self.tree.el_pt)):
-            self.event_electrons.append((self.tree.el_pt[i],
-                                         self.tree.el_eta[i],
-                                         self.tree.el_phi[i]))
-
-
-
-            
-    ## --------------------------------------- ##
-    def get_photons(self):
-        """
-        Get the photon kinematics. Each entry in self.event_muons must be 
-        a 3-tuple containing photon pt (MeV), photon eta, and photon phi in that
-        order.
-        """
-        
-        for i in range(len(self.tree.ph_pt)):
-            self.event_photons.append((self.tree.ph_pt[i],
-                                       self.tree.ph_eta[i],
-                                       self.tree.ph_phi[i]))
-
-
-
-            
-    ## --------------------------------------- ##
-    def get_met(self):
-        """
-        Get the MET kinematics. self.event_met must be a 2-tuple
-        containing MET magnitude (MeV) and MET phi in that order.
-        """
-        
-        for i in range(len(self.tree.MET)):
-            self.event_met = (self.tree.MET[i], self.tree.MET_phi[0])
-
-
+    ## Objects to display. Each container gets a list of sources, a source
+    ## gives the pt (MeV), eta and phi of its objects (pt and phi for MET)
+    ## as branch names or TTreeFormula expressions. Jets may come with a
+    ## b-tagging expression, a jet being b-tagged above btag_cut.
+    schema = {'jets'      : [{'pt'       : 'jet_pt',
+                              'eta'      : 'jet_eta',
+                              'phi'      : 'jet_phi',
+                              'btag'     : 'jet_btag',
+                              'btag_cut' : 0}],
+              'taus'      : [{'pt' : 'tau_pt', 'eta' : 'tau_eta', 'phi' : 'tau_phi'}],
+              'muons'     : [{'pt' : 'mu_pt',  'eta' : 'mu_eta',  'phi' : 'mu_phi'}],
+              'electrons' : [{'pt' : 'el_pt',  'eta' : 'el_eta',  'phi' : 'el_phi'}],
+              'photons'   : [{'pt' : 'ph_pt',  'eta' : 'ph_eta',  'phi' : 'ph_phi'}],
+              'met'       : [{'pt' : 'MET',    'phi' : 'MET_phi'}]}
+
+    ## Columns computed from the branches, given as expressions or as the
+    ## branches to read and a function of their columns (see derived.py).
+    ## They can be used in cuts like branches.
+    derived = {'jet1_pt'    : 'jet_pt[0]/1000.0',
+               'mass_j1_j2' : (('jet_pt', 'jet_eta', 'jet_phi'), first_jets_mass)}
+
+    ## Extra information. Keys are variable names that you can customize and
+    ## values are 2-tuples containing the expression to display, and the
+    ## variable type as you would give it for string formatting. Derived
+    ## columns are given by their name.
+    extra_schema = {'flebles'       : ('Sum$(Flebles)', 'd'),
+                    'jet 1 pt'      : ('jet1_pt', '.2f'),
+                    'jets 1-2 mass' : ('mass_j1_j2', '.2f')}
 
-            
     ## --------------------------------------- ##
-    def get_extra_information(self):
+    def __init__(self, file_path, tree_name, initial_cut_string=CUT_NO_SELECTION):
         """
-        Get the extra information. self.extra_information is a
-        dictionary where keys are variable names that you can customize and
-        values are 2-tuples containing the variable value, and the variable type
-        as you would give it for string formatting.
+        Constructor
         """
-        
-        nFlebles = 0
-        for i in range(len(self.tree.Flebles)):
-            nFlebles += self.tree.Flebles[i]
-
-        self.extra_information['flebles'] = (nFlebles, 'd')
 
-            
-
-
-            
+        ## Execute the base class constructor
+        Reader.__init__(self, file_path, tree_name, initial_cut_string)
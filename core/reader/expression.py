@@ -0,0 +1,456 @@
+#**************************************************#
+# file   : core/reader/expression.py               #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Parse TTreeFormula-style cut expressions and     #
+# evaluate them with numpy over columnar data      #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import re
+
+## numpy imports
+import numpy
+
+## Tokens of a cut expression
+TOKEN = re.compile(r"""\s*(?:
+    (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+   |(?P<name>[A-Za-z_]\w*(?:::[A-Za-z_]\w*)*\$?)
+   |(?P<selection>@\d+)
+   |(?P<operator>&&|\|\||==|!=|<=|>=|[-+*/%<>!(),\[\]])
+   )""", re.VERBOSE)
+
+## Operators by increasing precedence
+OR             = ('||',)
+AND            = ('&&',)
+COMPARISON     = ('==', '!=', '<', '>', '<=', '>=')
+ADDITIVE       = ('+', '-')
+MULTIPLICATIVE = ('*', '/', '%')
+UNARY          = ('!', '-', '+')
+
+## Element-wise functions
+FUNCTIONS = {'abs'         : numpy.abs,
+             'fabs'        : numpy.abs,
+             'TMath::Abs'  : numpy.abs,
+             'sqrt'        : numpy.sqrt,
+             'TMath::Sqrt' : numpy.sqrt}
+
+## Functions reducing the objects of an event to one value
+REDUCTIONS = ('Length$', 'Sum$', 'Max$', 'Min$')
+
+
+####################################################
+class ExpressionError(Exception):
+    """
+    Raised for expressions that cannot be evaluated with numpy,
+    ROOT may still understand them
+    """
+
+
+
+## --------------------------------------- ##
+def tokenize(text):
+    """
+    Split an expression into (kind, value) tokens
+    """
+
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise ExpressionError('Unexpected character at "%s"' % text[position:])
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+
+    return tokens
+
+
+
+####################################################
+class Parser():
+
+    ## --------------------------------------- ##
+    def __init__(self, text):
+        """
+        Constructor
+        """
+
+        self.text     = text
+        self.tokens   = tokenize(text)
+        self.position = 0
+
+
+
+    ## --------------------------------------- ##
+    def peek(self):
+        """
+        Value of the next token, None at the end
+        """
+
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][1]
+        return None
+
+
+
+    ## --------------------------------------- ##
+    def take(self, expected=None):
+        """
+        Consume the next token, checking its value if expected is given
+        """
+
+        if self.position >= len(self.tokens):
+            raise ExpressionError('Unexpected end of "%s"' % self.text)
+
+        kind, value = self.tokens[self.position]
+        if expected is not None and value != expected:
+            raise ExpressionError('Expected "%s" instead of "%s"' % (expected, value))
+
+        self.position += 1
+        return kind, value
+
+
+
+    ## --------------------------------------- ##
+    def parse(self):
+        """
+        Syntax tree of the whole expression, nodes are tuples starting
+        with the node type
+        """
+
+        node = self.parse_binary(0)
+        if self.peek() is not None:
+            raise ExpressionError('Unexpected "%s"' % self.peek())
+        return node
+
+
+
+    ## --------------------------------------- ##
+    def parse_binary(self, level):
+        """
+        Left-associative binary operators of a given precedence level
+        """
+
+        levels = (OR, AND, COMPARISON, ADDITIVE, MULTIPLICATIVE)
+        if level == len(levels):
+            return self.parse_unary()
+
+        node = self.parse_binary(level+1)
+        while self.peek() in levels[level]:
+            kind, operator = self.take()
+            node = ('binary', operator, node, self.parse_binary(level+1))
+
+        return node
+
+
+
+    ## --------------------------------------- ##
+    def parse_unary(self):
+        """
+        Negation, sign
+        """
+
+        if self.peek() in UNARY:
+            kind, operator = self.take()
+            return ('unary', operator, self.parse_unary())
+
+        return self.parse_primary()
+
+
+
+    ## --------------------------------------- ##
+    def parse_primary(self):
+        """
+        Numbers, branches, function calls, parenthesized expressions,
+        previous selections (@N)
+        """
+
+        kind, value = self.take()
+
+        if kind == 'number':
+            return ('number', float(value))
+
+        if kind == 'selection':
+            return ('selection', int(value[1:]))
+
+        if value == '(':
+            node = self.parse_binary(0)
+            self.take(')')
+            return node
+
+        if kind != 'name':
+            raise ExpressionError('Unexpected "%s"' % value)
+
+        ## Function call
+        if self.peek() == '(':
+            if value not in FUNCTIONS and value not in REDUCTIONS:
+                raise ExpressionError('Unsupported function "%s"' % value)
+            self.take('(')
+            argument = self.parse_binary(0)
+            self.take(')')
+            return ('call', value, argument)
+
+        ## Object of a vector branch
+        if self.peek() == '[':
+            self.take('[')
+            kind, index = self.take()
+            if kind != 'number' or not index.isdigit():
+                raise ExpressionError('Only constant indices are supported')
+            self.take(']')
+            return ('index', value, int(index))
+
+        return ('name', value)
+
+
+
+## --------------------------------------- ##
+def parse(text):
+    """
+    Syntax tree of an expression
+    """
+
+    return Parser(text).parse()
+
+
+
+## --------------------------------------- ##
+def names(node):
+    """
+    Set of branch names used in a syntax tree
+    """
+
+    if node[0] in ('name', 'index'):
+        return set([node[1]])
+    if node[0] == 'call':
+        return names(node[2])
+    if node[0] == 'unary':
+        return names(node[2])
+    if node[0] == 'binary':
+        return names(node[2]) | names(node[3])
+    return set()
+
+
+
+## --------------------------------------- ##
+def is_scalar(node, scalars):
+    """
+    Does a syntax tree have one value per event, whatever the event?
+    scalars is the set of branches holding one value per event.
+    """
+
+    if node[0] == 'name':
+        return node[1] in scalars
+    if node[0] == 'call' and node[1] not in REDUCTIONS:
+        return is_scalar(node[2], scalars)
+    if node[0] == 'unary':
+        return is_scalar(node[2], scalars)
+    if node[0] == 'binary':
+        return is_scalar(node[2], scalars) and is_scalar(node[3], scalars)
+    return True
+
+
+
+## --------------------------------------- ##
+def keep_first(data, counts, keep):
+    """
+    Keep the first keep[i] objects of each event i
+    """
+
+    starts = numpy.cumsum(counts) - counts
+    event = numpy.repeat(numpy.arange(len(keep)), keep)
+    position = numpy.arange(keep.sum()) - numpy.repeat(numpy.cumsum(keep) - keep, keep)
+    return data[starts[event] + position]
+
+
+
+## --------------------------------------- ##
+def align(left, right):
+    """
+    Bring two values to the same shape. Per-event values are repeated for
+    every object, vectors of different lengths are cut to the shortest
+    one in each event, like ROOT does.
+    """
+
+    (left_data, left_counts), (right_data, right_counts) = left, right
+
+    if left_counts is None and right_counts is None:
+        return left_data, right_data, None
+    if left_counts is None:
+        return numpy.repeat(left_data, right_counts), right_data, right_counts
+    if right_counts is None:
+        return left_data, numpy.repeat(right_data, left_counts), left_counts
+    if numpy.array_equal(left_counts, right_counts):
+        return left_data, right_data, left_counts
+
+    counts = numpy.minimum(left_counts, right_counts)
+    return (keep_first(left_data, left_counts, counts),
+            keep_first(right_data, right_counts, counts),
+            counts)
+
+
+
+## --------------------------------------- ##
+def reduce_objects(function, data, counts, n_entries):
+    """
+    Reduce the objects of every event to one value, 0 for events without
+    objects
+    """
+
+    event = numpy.repeat(numpy.arange(n_entries), counts)
+
+    if function == 'Length$':
+        return counts.astype(numpy.float64)
+
+    if function == 'Sum$':
+        return numpy.bincount(event, weights=data, minlength=n_entries)
+
+    if function == 'Max$':
+        result = numpy.full(n_entries, -numpy.inf)
+        numpy.maximum.at(result, event, data)
+    else:
+        result = numpy.full(n_entries, numpy.inf)
+        numpy.minimum.at(result, event, data)
+
+    result[counts == 0] = 0.0
+    return result
+
+
+
+## --------------------------------------- ##
+def evaluate_node(node, columns, n_entries, scalars):
+    """
+    Value of a node as a (data, counts) pair. counts is None for per-event
+    values, otherwise data holds all objects and counts their number per event.
+    scalars is the set of branches holding one value per event, the others
+    are vectors even if all their events happen to have one value. A
+    missing value, such as the i-th object of an event with fewer objects,
+    is NaN and fails the cut like with ROOT.
+    """
+
+    kind = node[0]
+
+    if kind == 'number':
+        return numpy.full(n_entries, node[1]), None
+
+    if kind == 'selection':
+        raise ExpressionError('@%d can only be combined with other selections' % node[1])
+
+    if kind in ('name', 'index'):
+        if node[1] not in columns:
+            raise ExpressionError('Unknown column "%s"' % node[1])
+        values, offsets = columns[node[1]]
+        values = values.astype(numpy.float64)
+        counts = numpy.diff(offsets)
+
+        ## i-th object, missing in events with fewer objects
+        if kind == 'index':
+            present = counts > node[2]
+            data = numpy.full(n_entries, numpy.nan)
+            data[present] = values[offsets[:-1][present] + node[2]]
+            return data, None
+
+        if node[1] in scalars:
+            if not numpy.all(counts == 1):
+                raise ExpressionError('"%s" is not one value per event' % node[1])
+            return values, None
+        return values, counts
+
+    if kind == 'call':
+        data, counts = evaluate_node(node[2], columns, n_entries, scalars)
+        if node[1] in REDUCTIONS:
+            if counts is None:
+                counts = numpy.ones(n_entries, dtype=numpy.int64)
+            return reduce_objects(node[1], data, counts, n_entries), None
+        return FUNCTIONS[node[1]](data), counts
+
+    if kind == 'unary':
+        data, counts = evaluate_node(node[2], columns, n_entries, scalars)
+        if node[1] == '!':
+            result = (data == 0).astype(numpy.float64)
+            result[numpy.isnan(data)] = numpy.nan
+            return result, counts
+        if node[1] == '-':
+            return -data, counts
+        return data, counts
+
+    ## Binary operators
+    operator = node[1]
+    left, right, counts = align(evaluate_node(node[2], columns, n_entries, scalars),
+                                evaluate_node(node[3], columns, n_entries, scalars))
+
+    if operator == '||':
+        result = (left != 0) | (right != 0)
+    elif operator == '&&':
+        result = (left != 0) & (right != 0)
+    elif operator == '==':
+        result = left == right
+    elif operator == '!=':
+        result = left != right
+    elif operator == '<':
+        result = left < right
+    elif operator == '>':
+        result = left > right
+    elif operator == '<=':
+        result = left <= right
+    elif operator == '>=':
+        result = left >= right
+    elif operator == '+':
+        result = left + right
+    elif operator == '-':
+        result = left - right
+    elif operator == '*':
+        result = left * right
+    elif operator == '/':
+        result = left / right
+    else:
+        ## Integer modulo, like TTreeFormula
+        result = numpy.fmod(numpy.trunc(left), numpy.trunc(right))
+
+    result = result.astype(numpy.float64)
+    result[numpy.isnan(left) | numpy.isnan(right)] = numpy.nan
+
+    return result, counts
+
+
+
+## --------------------------------------- ##
+def evaluate(node, columns, n_entries, scalars):
+    """
+    Boolean numpy array telling which of n_entries events pass the
+    expression. columns maps branch names to (values, offsets) pairs,
+    scalars is the set of branches holding one value per event.
+    An event passes if any of its objects does, like with ROOT.
+    """
+
+    with numpy.errstate(all='ignore'):
+        data, counts = evaluate_node(node, columns, n_entries, scalars)
+    passing = (data != 0) & ~numpy.isnan(data)
+
+    if counts is None:
+        return passing
+
+    event = numpy.repeat(numpy.arange(n_entries), counts)
+    return numpy.bincount(event[passing], minlength=n_entries) > 0
@@ -0,0 +1,212 @@
+#**************************************************#
+# file   : core/reader/index.py                    #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Hash index from (run number, event number) to    #
+# tree entry, stored on disk next to the input     #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import os, shutil
+
+## numpy imports
+import numpy
+
+## CDER imports
+from inputs import sidecar_paths
+
+## Multipliers of the hash function, any odd 64-bit constants do
+RUN_MULTIPLIER   = 0x9E3779B97F4A7C15
+EVENT_MULTIPLIER = 0xC2B2AE3D27D4EB4F
+MASK_64          = 0xFFFFFFFFFFFFFFFF
+
+## Empty slot of the table
+EMPTY = -1
+
+
+## --------------------------------------- ##
+def hash_keys(runs, events):
+    """
+    64-bit hashes of arrays of run and event numbers
+    """
+
+    runs   = runs.astype(numpy.int64).view(numpy.uint64)
+    events = events.astype(numpy.int64).view(numpy.uint64)
+
+    ## Multiplications wrap around, as intended
+    with numpy.errstate(over='ignore'):
+        hashes = (runs*numpy.uint64(RUN_MULTIPLIER)) ^ (events*numpy.uint64(EVENT_MULTIPLIER))
+    return hashes ^ (hashes >> numpy.uint64(29))
+
+
+
+## --------------------------------------- ##
+def hash_key(run, event):
+    """
+    Same as hash_keys for a single run and event number
+    """
+
+    value = ((run*RUN_MULTIPLIER) & MASK_64) ^ ((event*EVENT_MULTIPLIER) & MASK_64)
+    return value ^ (value >> 29)
+
+
+
+## --------------------------------------- ##
+def index_paths(identity, branches):
+    """
+    Where the index of given input files may be stored: next to the first
+    file, and in the user cache directory if that place is not writable
+    """
+
+    return sidecar_paths(identity, 'index', branches)
+
+
+
+####################################################
+class EventIndex():
+
+    ## --------------------------------------- ##
+    def __init__(self, slots, runs, events):
+        """
+        Constructor. Open-addressing table with linear probing: slots holds
+        tree entries (or EMPTY), the key of entry i is (runs[i], events[i]).
+        """
+
+        self.slots  = slots
+        self.runs   = runs
+        self.events = events
+        self.mask   = len(slots) - 1
+
+
+
+    ## --------------------------------------- ##
+    def find(self, run, event):
+        """
+        First tree entry of an event, None if it is not in the tree
+        """
+
+        slot = hash_key(run, event) & self.mask
+        while True:
+            entry = int(self.slots[slot])
+            if entry == EMPTY:
+                return None
+            if self.runs[entry] == run and self.events[entry] == event:
+                return entry
+            slot = (slot + 1) & self.mask
+
+
+
+    ## --------------------------------------- ##
+    def save(self, path):
+        """
+        Store the index as a directory of arrays, replacing it atomically
+        """
+
+        temporary = '%s.tmp%d' % (path, os.getpid())
+        if os.path.isdir(temporary):
+            shutil.rmtree(temporary)
+        os.makedirs(temporary)
+
+        for name in ('slots', 'runs', 'events'):
+            numpy.save(os.path.join(temporary, name + '.npy'), getattr(self, name))
+
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.rename(temporary, path)
+
+
+
+## --------------------------------------- ##
+def build_index(runs, events):
+    """
+    Index of tree entries by (run, event), runs and events being the
+    numbers of all the entries in tree order. The table is filled with
+    numpy, placing at each round the entries whose slot is free.
+    """
+
+    runs   = numpy.asarray(runs, dtype=numpy.int64)
+    events = numpy.asarray(events, dtype=numpy.int64)
+
+    ## At most half full, a power of 2
+    capacity = 2
+    while capacity < 2*len(runs):
+        capacity *= 2
+    slots = numpy.empty(capacity, dtype=numpy.int64)
+    slots.fill(EMPTY)
+
+    pending   = numpy.arange(len(runs), dtype=numpy.int64)
+    positions = (hash_keys(runs, events) & numpy.uint64(capacity-1)).astype(numpy.int64)
+
+    while len(pending) > 0:
+
+        ## Among the entries landing on the same free slot, the first one wins,
+        ## so duplicated events resolve to their first entry
+        free = numpy.flatnonzero(slots[positions] == EMPTY)
+        taken, first = numpy.unique(positions[free], return_index=True)
+        slots[taken] = pending[free[first]]
+
+        ## The others try the next slot
+        placed = numpy.zeros(len(pending), dtype=bool)
+        placed[free[first]] = True
+        pending   = pending[~placed]
+        positions = (positions[~placed] + 1) & (capacity-1)
+
+    return EventIndex(slots, runs, events)
+
+
+
+## --------------------------------------- ##
+def open_index(paths):
+    """
+    Memory-map the first index found among paths, None if there is none
+    """
+
+    for path in paths:
+        try:
+            arrays = [numpy.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+                      for name in ('slots', 'runs', 'events')]
+        except (IOError, ValueError):
+            continue
+        return EventIndex(*arrays)
+
+    return None
+
+
+
+## --------------------------------------- ##
+def save_index(index, paths):
+    """
+    Store an index at the first place among paths where it can be written
+    """
+
+    for path in paths:
+        try:
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            index.save(path)
+            return path
+        except (IOError, OSError):
+            continue
+
+    return None
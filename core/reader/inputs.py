@@ -0,0 +1,228 @@
+#**************************************************#
+# file   : core/reader/inputs.py                   #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Identify the files making up an input chain, so  #
+# that anything derived from them can be cached    #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import os, json, threading, hashlib
+
+
+## --------------------------------------- ##
+def chain_files(chain):
+    """
+    Paths of the files added to a TChain, in chain order
+    """
+
+    return [element.GetTitle() for element in chain.GetListOfFiles()]
+
+
+
+## --------------------------------------- ##
+def file_identity(path):
+    """
+    (path, size, modification time) of a file, changes whenever the
+    file is rewritten. Size and time are None for files that cannot be
+    looked at locally (e.g. xrootd)
+    """
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (path, None, None)
+
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime)
+
+
+
+## --------------------------------------- ##
+def chain_identity(chain):
+    """
+    Identity of all the files making up a TChain
+    """
+
+    return tuple(file_identity(path) for path in chain_files(chain))
+
+
+
+## --------------------------------------- ##
+def user_cache_directory():
+    """
+    Directory where CDER keeps files it can rebuild
+    """
+
+    base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'cder')
+
+
+
+## --------------------------------------- ##
+def sidecar_paths(identity, kind, key):
+    """
+    Where a file derived from given input files may be stored: next to
+    the first file, and in the user cache directory if that place is not
+    writable. kind names the file, key tells apart files of one kind.
+    """
+
+    digest = hashlib.sha1(repr((identity, key))).hexdigest()[:16]
+
+    first_path = identity[0][0]
+    base = os.path.splitext(os.path.basename(first_path.rstrip('/')))[0]
+    name = '.%s.cder-%s-%s' % (base, kind, digest)
+
+    directory = os.path.dirname(os.path.abspath(first_path))
+    if os.path.isdir(first_path):
+        directory = first_path
+
+    return [os.path.join(directory, name),
+            os.path.join(user_cache_directory(), name)]
+
+
+
+## --------------------------------------- ##
+def user_data_directory():
+    """
+    Directory where CDER keeps what the user made and cannot be rebuilt
+    """
+
+    base = os.environ.get('XDG_DATA_HOME', os.path.join(os.path.expanduser('~'), '.local', 'share'))
+    return os.path.join(base, 'cder')
+
+
+
+## --------------------------------------- ##
+def count_entries(path, tree_name):
+    """
+    Number of entries of a tree in one file, opening only that file
+    """
+
+    from ROOT import TFile
+
+    input_file = TFile.Open(path)
+    if not input_file or input_file.IsZombie():
+        raise IOError('Cannot open %s' % path)
+
+    try:
+        tree = input_file.Get(tree_name)
+        if not tree:
+            raise IOError('No tree %s in %s' % (tree_name, path))
+        return tree.GetEntries()
+    finally:
+        input_file.Close()
+
+
+
+####################################################
+class EntryCounts():
+
+    ## --------------------------------------- ##
+    def __init__(self, path=None):
+        """
+        Constructor. Number of entries of the trees of the files already
+        looked at, kept in a JSON file of the user cache directory as
+        tree name : {path : [size, modification time, entries]}
+        """
+
+        if path is None:
+            path = os.path.join(user_cache_directory(), 'entries.json')
+        self.path = path
+
+        self.lock = threading.Lock()
+        self.counts = self.read()
+
+
+
+    ## --------------------------------------- ##
+    def read(self):
+        """
+        Content of the JSON file, empty if there is none
+        """
+
+        try:
+            with open(self.path) as counts_file:
+                return json.load(counts_file)
+        except (IOError, ValueError):
+            return {}
+
+
+
+    ## --------------------------------------- ##
+    def get(self, path, tree_name):
+        """
+        Number of entries of the tree in a file, None if the file was
+        not counted or changed since
+        """
+
+        identity = file_identity(path)
+        if identity[1] is None:
+            return None
+
+        with self.lock:
+            record = self.counts.get(tree_name, {}).get(identity[0])
+
+        if record is None or record[:2] != [identity[1], identity[2]]:
+            return None
+        return record[2]
+
+
+
+    ## --------------------------------------- ##
+    def put(self, path, tree_name, entries):
+        """
+        Remember the number of entries of the tree in a file, files that
+        cannot be looked at locally are not remembered
+        """
+
+        identity = file_identity(path)
+        if identity[1] is None:
+            return
+
+        with self.lock:
+            self.counts.setdefault(tree_name, {})[identity[0]] = [identity[1], identity[2], entries]
+
+
+
+    ## --------------------------------------- ##
+    def save(self):
+        """
+        Write the counts back, along with the ones other sessions wrote meanwhile
+        """
+
+        with self.lock:
+            counts = self.read()
+            for tree_name, records in self.counts.iteritems():
+                counts.setdefault(tree_name, {}).update(records)
+            self.counts = counts
+
+            try:
+                directory = os.path.dirname(self.path)
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                temporary = '%s.tmp%d' % (self.path, os.getpid())
+                with open(temporary, 'w') as counts_file:
+                    json.dump(counts, counts_file)
+                os.rename(temporary, self.path)
+            except (IOError, OSError), error:
+                print 'WARNING : cannot store the entry counts (%s)' % error
@@ -0,0 +1,155 @@
+#**************************************************#
+# file   : core/reader/jobs.py                     #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Long reader operations running in the            #
+# background, with progress reporting and          #
+# cancellation                                     #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import threading
+
+
+####################################################
+class Cancelled(Exception):
+    """
+    Raised inside a job once it has been cancelled
+    """
+
+
+
+####################################################
+class Progress():
+
+    ## --------------------------------------- ##
+    def __init__(self):
+        """
+        Constructor
+        """
+
+        ## Number of entries to go through, 0 if unknown
+        self.total = 0
+
+        ## Entries looked at and entries kept so far
+        self.scanned = 0
+        self.passing = 0
+
+        self.cancelled = False
+
+
+
+    ## --------------------------------------- ##
+    def advance(self, scanned, passing=0):
+        """
+        Record work done, bail out if the job was cancelled in the meantime
+        """
+
+        self.scanned += scanned
+        self.passing += passing
+
+        if self.cancelled:
+            raise Cancelled()
+
+
+
+    ## --------------------------------------- ##
+    def cancel(self):
+        """
+        Ask the job to stop at the next opportunity
+        """
+
+        self.cancelled = True
+
+
+
+    ## --------------------------------------- ##
+    def fraction(self):
+        """
+        Fraction of the work done, None if the total is unknown
+        """
+
+        if self.total <= 0:
+            return None
+        return min(float(self.scanned) / self.total, 1.0)
+
+
+
+####################################################
+class Job(threading.Thread):
+
+    ## --------------------------------------- ##
+    def __init__(self, function, *args):
+        """
+        Constructor. function is called with args and a progress keyword
+        argument in a background thread, call start() to run it
+        """
+
+        threading.Thread.__init__(self, name='CDER job')
+        self.daemon = True
+
+        self.function = function
+        self.args     = args
+        self.progress = Progress()
+
+        ## Outcome, only meaningful once done is True
+        self.result = None
+        self.error  = None
+        self.done   = False
+
+
+
+    ## --------------------------------------- ##
+    def run(self):
+        """
+        Run the function, keeping its result or error
+        """
+
+        try:
+            self.result = self.function(*self.args, progress=self.progress)
+        except Cancelled:
+            pass
+        except Exception, error:
+            self.error = error
+
+        self.done = True
+
+
+
+    ## --------------------------------------- ##
+    def cancel(self):
+        """
+        Ask the job to stop, its result is then discarded
+        """
+
+        self.progress.cancel()
+
+
+
+    ## --------------------------------------- ##
+    def cancelled(self):
+        """
+        Was the job asked to stop?
+        """
+
+        return self.progress.cancelled
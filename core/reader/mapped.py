@@ -0,0 +1,289 @@
+#**************************************************#
+# file   : core/reader/mapped.py                   #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Columnar event cache on disk, flat little-endian #
+# arrays read back through numpy.memmap            #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import os, json
+
+## numpy imports
+import numpy
+
+## CDER imports
+from columnar import ColumnarStore, take_rows
+from inputs import file_identity
+
+## Identification of the format in the header, the version changes
+## whenever older caches cannot be read anymore
+FORMAT  = 'cder-columnar'
+VERSION = 1
+
+## A cache is a directory holding the header and two files per column
+HEADER    = 'header.json'
+EXTENSION = '.cder'
+
+## On-disk types, independent of the machine
+VALUES_TYPE  = '<f8'
+OFFSETS_TYPE = '<i8'
+
+
+## --------------------------------------- ##
+def is_cache(path):
+    """
+    Is the path a columnar cache directory?
+    """
+
+    return os.path.isfile(os.path.join(path, HEADER))
+
+
+
+## --------------------------------------- ##
+def column_paths(path, index):
+    """
+    Values and offsets files of the column of a given index
+    """
+
+    base = os.path.join(path, 'column%d' % index)
+    return base + '.values', base + '.offsets'
+
+
+
+## --------------------------------------- ##
+def skim_output(file_path):
+    """
+    First unused path of a skim next to the input, wildcards left out
+    """
+
+    base = os.path.splitext(file_path.rstrip('/').replace('*', ''))[0].rstrip('._-')
+
+    number = 1
+    while os.path.exists('%s.skim%d%s' % (base, number, EXTENSION)):
+        number += 1
+
+    return '%s.skim%d%s' % (base, number, EXTENSION)
+
+
+
+## --------------------------------------- ##
+def read_header(path):
+    """
+    Content of the header of a cache, checking it can be read
+    """
+
+    with open(os.path.join(path, HEADER)) as header_file:
+        header = json.load(header_file)
+
+    if header.get('format') != FORMAT or header.get('version') != VERSION:
+        raise ValueError('%s is not a version %d columnar cache' % (path, VERSION))
+
+    return header
+
+
+
+## --------------------------------------- ##
+def write_cache(store, path, reader='', tree_name='', source=(), progress=None, entries=None, cut=''):
+    """
+    Write all the columns of a columnar store to a cache directory, one
+    chunk at a time. The values of every column go to a flat array, and
+    the offsets of entry i are at positions i and i+1 of a second array.
+    Only the given sorted entries are written if any, cut telling how
+    they were selected. The header is written last, an interrupted
+    conversion leaves no cache.
+    """
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    ## A previous cache in the same place is not valid anymore
+    header_path = os.path.join(path, HEADER)
+    if os.path.exists(header_path):
+        os.remove(header_path)
+
+    files = []
+    for index in range(len(store.expressions)):
+        values_path, offsets_path = column_paths(path, index)
+        files.append((open(values_path, 'wb'), open(offsets_path, 'wb')))
+
+    n_values  = [0]*len(store.expressions)
+    n_entries = 0
+
+    try:
+        for values_file, offsets_file in files:
+            numpy.zeros(1, dtype=OFFSETS_TYPE).tofile(offsets_file)
+
+        for chunk in store.iter_chunks(entries):
+
+            ## Rows of this chunk to keep
+            rows = None
+            if entries is not None:
+                first, last = numpy.searchsorted(entries, [chunk.first_entry,
+                                                           chunk.first_entry + chunk.n_entries])
+                rows = entries[first:last] - chunk.first_entry
+
+            for i, expression in enumerate(store.expressions):
+                values, offsets = chunk.columns[expression]
+                if rows is not None:
+                    values, offsets = take_rows(values, offsets, rows)
+                values_file, offsets_file = files[i]
+                values.astype(VALUES_TYPE).tofile(values_file)
+                (offsets[1:] + n_values[i]).astype(OFFSETS_TYPE).tofile(offsets_file)
+                n_values[i] += len(values)
+
+            n_written = chunk.n_entries
+            if rows is not None:
+                n_written = len(rows)
+            n_entries += n_written
+            if progress is not None:
+                progress.advance(n_written)
+
+    finally:
+        for values_file, offsets_file in files:
+            values_file.close()
+            offsets_file.close()
+
+    scalars = store.scalars(store.expressions)
+    columns = []
+    for expression, count in zip(store.expressions, n_values):
+        columns.append({'expression' : expression,
+                        'values'     : count,
+                        'type'       : VALUES_TYPE,
+                        'scalar'     : expression in scalars})
+
+    header = {'format'    : FORMAT,
+              'version'   : VERSION,
+              'reader'    : reader,
+              'tree'      : tree_name,
+              'entries'   : n_entries,
+              'source'    : [list(identity) for identity in source],
+              'cut'       : cut,
+              'columns'   : columns}
+
+    with open(header_path + '.tmp', 'w') as header_file:
+        json.dump(header, header_file, indent=1)
+    os.rename(header_path + '.tmp', header_path)
+
+    return n_entries
+
+
+
+####################################################
+class MappedStore(ColumnarStore):
+
+    ## --------------------------------------- ##
+    def __init__(self, path, chunk_size=0, max_chunks=2, lock=None):
+        """
+        Constructor. Same interface as ColumnarStore, the columns are
+        memory-mapped from a cache directory instead of read from a tree.
+        Only the expressions stored in the cache are available.
+        """
+
+        header = read_header(path)
+        expressions = [column['expression'] for column in header['columns']]
+
+        ColumnarStore.__init__(self, None, expressions, chunk_size, max_chunks, lock)
+
+        self.path      = path
+        self.header    = header
+        self.n_entries = header['entries']
+
+        ## expression : (values, offsets), pages are only read when touched
+        ## and the OS shares them between sessions
+        self.mapped = {}
+        for index, column in enumerate(header['columns']):
+            values_path, offsets_path = column_paths(path, index)
+            if column['values'] > 0:
+                values = numpy.memmap(values_path, dtype=column['type'], mode='r',
+                                      shape=(column['values'],))
+            else:
+                values = numpy.zeros(0, dtype=column['type'])
+            offsets = numpy.memmap(offsets_path, dtype=OFFSETS_TYPE, mode='r',
+                                   shape=(self.n_entries+1,))
+            self.mapped[column['expression']] = (values, offsets)
+
+
+
+    ## --------------------------------------- ##
+    def read_column(self, expression, first_entry, n_entries):
+        """
+        View of one column over a range of entries as a (values, offsets) pair
+        """
+
+        if expression not in self.mapped:
+            raise ValueError('Column "%s" is not in the cache %s' % (expression, self.path))
+
+        values, offsets = self.mapped[expression]
+
+        last_entry  = min(first_entry + n_entries, self.n_entries)
+        first_entry = min(first_entry, last_entry)
+
+        ## Only the offsets of the range are copied, to start at 0
+        offsets = numpy.array(offsets[first_entry:last_entry+1], dtype=numpy.int64)
+        values  = values[offsets[0]:offsets[-1]]
+        offsets -= offsets[0]
+
+        return values, offsets
+
+
+
+    ## --------------------------------------- ##
+    def is_scalar(self, expression):
+        """
+        Does a column have one value per event? Caches written before this
+        was recorded only tell it from the number of values of each event.
+        """
+
+        for column in self.header['columns']:
+            if column['expression'] == expression and 'scalar' in column:
+                return column['scalar']
+
+        if expression not in self.mapped:
+            raise ValueError('Column "%s" is not in the cache %s' % (expression, self.path))
+        values, offsets = self.mapped[expression]
+        return len(values) == self.n_entries and bool(numpy.all(numpy.diff(offsets) == 1))
+
+
+
+    ## --------------------------------------- ##
+    def identity(self):
+        """
+        Identity of the cache, changes whenever it is rewritten
+        """
+
+        return (file_identity(os.path.join(self.path, HEADER)),)
+
+
+
+    ## --------------------------------------- ##
+    def stale(self):
+        """
+        Have the files the cache was made from changed since?
+        """
+
+        for identity in self.header['source']:
+            current = file_identity(identity[0])
+            if current[1] is not None and list(current) != identity:
+                return True
+        return False
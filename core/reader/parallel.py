@@ -0,0 +1,222 @@
+#**************************************************#
+# file   : core/reader/parallel.py                 #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Evaluate cuts on the files of a chain in         #
+# parallel with a pool of processes                #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import glob, multiprocessing
+
+## numpy imports
+import numpy
+
+## CDER imports
+from selection import select_entries
+from jobs import Progress, Cancelled
+from dictionary import load_vector_dictionary
+
+## Pool of worker processes shared by the readers, see start_pool
+pool = None
+
+## Number of the latest scan, and the numbers of the cancelled ones, each
+## in the slot of its number modulo CANCELLED_SLOTS
+CANCELLED_SLOTS = 64
+scan_number     = None
+cancelled_scans = None
+
+## Has this worker loaded the std::vector dictionary yet?
+dictionary_loaded = False
+
+
+## --------------------------------------- ##
+def needs_pool(file_path, processes):
+    """
+    Are cuts on file_path worth scanning in parallel: several files and
+    more than one process asked for? Decided without ROOT, from the files
+    a wildcard matches.
+    """
+
+    return processes != 1 and len(glob.glob(file_path)) > 1
+
+
+
+## --------------------------------------- ##
+def start_pool(processes):
+    """
+    Start the pool of worker processes cuts are scanned with, processes <= 0
+    meaning one per core. Call it once, before any other thread is started
+    or ROOT is imported: the workers are forked from the current process,
+    locks held by other threads would stay locked in them.
+    """
+
+    global pool, scan_number, cancelled_scans
+
+    if processes <= 0:
+        processes = multiprocessing.cpu_count()
+
+    ## Created first to be inherited by the workers
+    scan_number = multiprocessing.Value('l', 0)
+    cancelled_scans = multiprocessing.Array('l', [-1]*CANCELLED_SLOTS)
+    pool = multiprocessing.Pool(processes)
+
+
+
+## --------------------------------------- ##
+def shared_pool():
+    """
+    Pool started by start_pool, None if there is none
+    """
+
+    return pool
+
+
+
+## --------------------------------------- ##
+def new_scan():
+    """
+    Number identifying a new scan, to cancel it with cancel_scan
+    """
+
+    with scan_number.get_lock():
+        scan_number.value += 1
+        return scan_number.value
+
+
+
+## --------------------------------------- ##
+def cancel_scan(scan):
+    """
+    Make the workers drop the tasks of a scan, other scans go on
+    """
+
+    cancelled_scans[scan % CANCELLED_SLOTS] = scan
+
+
+
+## --------------------------------------- ##
+def is_cancelled(scan):
+    """
+    Was a scan cancelled?
+    """
+
+    return cancelled_scans[scan % CANCELLED_SLOTS] == scan
+
+
+
+####################################################
+class ScanProgress(Progress):
+
+    ## --------------------------------------- ##
+    def __init__(self, scan):
+        """
+        Constructor. Progress of a worker on a task of a given scan,
+        cancelled with the scan.
+        """
+
+        Progress.__init__(self)
+        self.scan = scan
+
+
+
+    ## --------------------------------------- ##
+    def advance(self, scanned, passing=0):
+        """
+        Record work done, bail out if the scan was cancelled
+        """
+
+        if is_cancelled(self.scan):
+            self.cancel()
+        Progress.advance(self, scanned, passing)
+
+
+
+## --------------------------------------- ##
+def select_file_entries(task):
+    """
+    Runs in a worker process. Returns the entries of one file passing a
+    cut, numbered from the start of the file, and the number of entries
+    in the file. The entries are None if the file could not be scanned.
+    """
+
+    global dictionary_loaded
+
+    from ROOT import TFile
+
+    path, tree_name, cut_string, chunk_size, scan = task
+
+    ## Tasks of a cancelled scan still waiting in the queue
+    if is_cancelled(scan):
+        return None, 0
+
+    ## Loaded at the first task rather than when forked, the display has
+    ## compiled the dictionary by the time it applies a cut
+    if not dictionary_loaded:
+        load_vector_dictionary()
+        dictionary_loaded = True
+
+    input_file = TFile.Open(path)
+    if not input_file or input_file.IsZombie():
+        raise IOError('Cannot open %s' % path)
+
+    try:
+        tree = input_file.Get(tree_name)
+        if not tree:
+            raise IOError('No tree %s in %s' % (tree_name, path))
+        return select_entries(tree, cut_string, chunk_size, progress=ScanProgress(scan)), tree.GetEntries()
+    except Cancelled:
+        return None, 0
+    finally:
+        input_file.Close()
+
+
+
+## --------------------------------------- ##
+def select_entries_parallel(pool, files, tree_name, cut_string, chunk_size, progress, scan):
+    """
+    Same as select_entries over a whole chain, each file being scanned by
+    one of the processes of the pool. The results are merged in chain order.
+    The pool must come from start_pool, scan from new_scan: call cancel_scan
+    with it to stop the workers if the results are not waited for. None if
+    a file could not be scanned, the chain is then to be scanned serially.
+    """
+
+    tasks = [(path, tree_name, cut_string, chunk_size, scan) for path in files]
+
+    selected = []
+    offset = 0
+    for selection, n_entries in pool.imap(select_file_entries, tasks):
+
+        ## ROOT does not understand the cut, or the file could not be read
+        if selection is None:
+            return None
+
+        selected.append(selection + offset)
+        offset += n_entries
+        progress.advance(n_entries, len(selection))
+
+    if len(selected) == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+
+    return numpy.concatenate(selected)
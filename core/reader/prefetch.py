@@ -0,0 +1,195 @@
+#**************************************************#
+# file   : core/reader/prefetch.py                 #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Background read-ahead of the events surrounding  #
+# the one currently displayed                      #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import threading, atexit
+from collections import OrderedDict
+
+
+####################################################
+class Prefetcher(threading.Thread):
+
+    ## --------------------------------------- ##
+    def __init__(self, decode, depth):
+        """
+        Constructor. decode is a function taking a tree entry and returning
+        the decoded kinematics of that entry, depth is the number of events
+        to read ahead in each direction
+        """
+
+        ## Base class constructor
+        threading.Thread.__init__(self, name='CDER prefetcher')
+
+        ## Do not keep CDER alive once the window is closed
+        self.daemon = True
+
+        ## Function doing the actual reading
+        self.decode = decode
+
+        ## Maximum number of decoded events held at any time
+        self.depth    = depth
+        self.capacity = 2*depth + 1
+
+        ## Entries to read, in order of priority
+        self.wanted     = []
+        self.wanted_set = set()
+
+        ## Ring buffer of decoded events, keyed by tree entry
+        self.buffer = OrderedDict()
+
+        ## Incremented whenever buffered events become invalid
+        self.generation = 0
+
+        ## Protects everything above, wakes the worker up
+        self.condition = threading.Condition()
+
+        ## Leave the worker loop before the interpreter tears modules down
+        self.stopped = False
+        atexit.register(self.stop)
+
+        self.start()
+
+
+
+    ## --------------------------------------- ##
+    def center(self, wanted):
+        """
+        Re-center the read-ahead window. wanted is the list of entries
+        to have ready, the most likely to be requested first
+        """
+
+        with self.condition:
+            self.wanted     = list(wanted)[:self.capacity]
+            self.wanted_set = set(self.wanted)
+
+            ## Forget about events that fell out of the window
+            for entry in self.buffer.keys():
+                if entry not in self.wanted_set:
+                    del self.buffer[entry]
+
+            self.condition.notify()
+
+
+
+    ## --------------------------------------- ##
+    def get(self, entry):
+        """
+        Return the decoded event for entry if it is ready, None otherwise
+        """
+
+        with self.condition:
+            return self.buffer.get(entry)
+
+
+
+    ## --------------------------------------- ##
+    def put(self, entry, snapshot):
+        """
+        Store an event decoded outside of the worker
+        """
+
+        with self.condition:
+            self.buffer[entry] = snapshot
+            while len(self.buffer) > self.capacity:
+                self.buffer.popitem(last=False)
+
+
+
+    ## --------------------------------------- ##
+    def clear(self):
+        """
+        Drop all decoded events, including the one being decoded
+        """
+
+        with self.condition:
+            self.buffer.clear()
+            self.wanted     = []
+            self.wanted_set = set()
+            self.generation += 1
+
+
+
+    ## --------------------------------------- ##
+    def stop(self):
+        """
+        Ask the worker to terminate and wait briefly for it
+        """
+
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.join(1.0)
+
+
+
+    ## --------------------------------------- ##
+    def next_missing(self):
+        """
+        Highest priority entry in the window not decoded yet
+        """
+
+        for entry in self.wanted:
+            if entry not in self.buffer:
+                return entry
+        return None
+
+
+
+    ## --------------------------------------- ##
+    def run(self):
+        """
+        Worker loop: decode the missing entries of the window one at a time
+        """
+
+        while True:
+
+            ## Sleep until there is something to read
+            with self.condition:
+                entry = self.next_missing()
+                while entry is None and not self.stopped:
+                    self.condition.wait()
+                    entry = self.next_missing()
+                if self.stopped:
+                    return
+                generation = self.generation
+
+            ## Decode outside of the lock so the display can keep serving events
+            try:
+                snapshot = self.decode(entry)
+            except Exception, error:
+                print 'WARNING : could not read ahead entry %d (%s)' % (entry, error)
+                with self.condition:
+                    if entry in self.wanted_set:
+                        self.wanted.remove(entry)
+                        self.wanted_set.discard(entry)
+                continue
+
+            ## Only keep the result if the window still wants it
+            with self.condition:
+                if generation == self.generation and entry in self.wanted_set:
+                    self.buffer[entry] = snapshot
@@ -27,12 +27,31 @@
 #   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
 #############################################################################
 
-## ROOT imports
-from ROOT import TChain, TFile
-
 ## Basic python imports
-import random as rand
-import copy
+import os, copy, threading
+
+## numpy imports
+import numpy
+
+## CDER imports
+from .. import config
+from prefetch import Prefetcher
+from shuffle import Shuffle
+from index import build_index, open_index, save_index, index_paths
+from columnar import ColumnarStore, FormulaStore, draw
+from schema import Schema
+from mapped import MappedStore, is_cache, write_cache, skim_output
+from branches import BranchPruner, BranchRecorder, formula_branches
+from selection import select_entries, select_entries_columnar, extra_clauses, is_per_event, SelectionCache, SelectionStore
+from expression import ExpressionError
+from weights import event_weights, event_weights_columnar, AliasTable
+from tags import TagSets, tags_path, is_tagged_cut, DEFAULT_TAG_SET
+from derived import DerivedStore, derived_inputs
+from bitmap import from_entries, uses_selections, combine_selections
+from jobs import Job, Progress, Cancelled
+from parallel import shared_pool, new_scan, cancel_scan, select_entries_parallel
+from inputs import chain_files, chain_identity, count_entries, EntryCounts, user_cache_directory
+from dictionary import load_vector_dictionary
 
 ## CDER particle types imports
 from ..particle.jet import Jet
@@ -46,37 +65,181 @@ from ..particle.met import MET
 CUT_NO_SELECTION = 'No selection'
 
 
+
+## --------------------------------------- ##
+def open_chain(file_path, tree_name, entry_counts=None):
+    """
+    TChain over the input files. ROOT is only imported here, displaying
+    a columnar cache does not need it. Files are only opened when needed,
+    the ones with known numbers of entries (EntryCounts) are not opened
+    to find where their entries start.
+    """
+
+    from ROOT import TChain, TTree
+
+    load_vector_dictionary()
+
+    ## Let PyROOT release the GIL while reading entries, so that reading ahead
+    ## in the background does not freeze the window (flag name depends on the
+    ## PyROOT flavour)
+    for tree_class in (TChain, TTree):
+        for flag in ('_threaded', '__release_gil__'):
+            try:
+                setattr(tree_class.GetEntry, flag, True)
+            except AttributeError:
+                pass
+
+    chain = TChain(tree_name)
+    chain.Add(file_path)
+
+    ## Add the files again one by one, with their numbers of entries
+    if entry_counts is not None:
+        files = chain_files(chain)
+        chain = TChain(tree_name)
+        for path in files:
+            entries = entry_counts.get(path, tree_name)
+            if entries is None:
+                chain.Add(path)
+            else:
+                chain.Add(path, entries)
+
+    return chain
+
+
+
+## --------------------------------------- ##
+def reader_schema(reader_class):
+    """
+    Compiled schema of a reader class, None if the reader uses getters
+    """
+
+    extra = dict((name, (expression, format)) for name, (expression, format)
+                 in reader_class.extra_schema.iteritems() if expression not in reader_class.derived)
+
+    if len(reader_class.schema) == 0 and len(extra) == 0:
+        return None
+    return Schema(reader_class.schema, extra)
+
+
+
+## --------------------------------------- ##
+def derived_extra(reader_class):
+    """
+    Extra information of a reader class showing derived columns
+    """
+
+    return dict((name, (expression, format)) for name, (expression, format)
+                in reader_class.extra_schema.iteritems() if expression in reader_class.derived)
+
+
+
 ####################################################
 class Reader():
 
+    ## Objects to display, container : list of sources (see schema.Schema).
+    ## Leave empty to fill the containers with the get_* methods instead.
+    schema = {}
+
+    ## Extra information, name : (expression, format)
+    extra_schema = {}
+
+    ## Columns computed from the branches, name : definition (see
+    ## derived.compile_definition). They are computed for many events at
+    ## once, stored next to the input, and can be used in cuts and, by
+    ## their name alone, as expressions of extra_schema.
+    derived = {}
+
+    ## Branches read by the kinematic getters. Branches missing here are
+    ## discovered while reading events, leave empty to discover them all.
+    used_branches = ()
+
+    ## Read the events around the current one in the background. Readers
+    ## of events that are not known in advance switch it off.
+    read_ahead = True
+
     ## --------------------------------------- ##
     def __init__(self, file_path, tree_name, initial_cut_string=CUT_NO_SELECTION):
         """
         Constructor
         """
 
-        ## Load the file
-        self.chain = TChain(tree_name)
-        self.chain.Add(file_path)
+        ## Serialize access to the ROOT trees between the display and the prefetcher
+        self.tree_lock = threading.RLock()
+
+        ## Expressions to read for each event, None if the getters are used
+        self.compiled_schema = reader_schema(self)
+
+        ## Load the file, columnar caches are memory-mapped without ROOT
+        self.file_path = file_path
+        self.tree_name = tree_name
+        self.chain = None
+        self.counter = None
+        self.columns = self.open_store(file_path)
+        if self.columns is not None:
+            self.total_entries = self.columns.n_entries
+        else:
+            self.entry_counts = EntryCounts()
+            self.chain = open_chain(file_path, tree_name, self.entry_counts)
+
+            ## Entries of each file, None until counted. Only the first file
+            ## needs to be counted to show an event, the others are counted
+            ## in the background.
+            self.file_entries = [self.entry_counts.get(path, tree_name) for path in chain_files(self.chain)]
+            if len(self.file_entries) > 0 and self.file_entries[0] is None:
+                self.count_file(0)
+            self.total_entries = self.known_entries()
 
         ## tree to keep all events
         self.full_tree = self.chain
 
-        ## tree to keep inly events surviving cut
-        self.cut_tree = self.full_tree
-
         ## Main tree reference
         self.tree = self.full_tree
 
+        ## Entries of the full tree surviving the cut, None if no cut is applied
+        self.selection = None
 
-        ## Tree navigation
-        self.entries = self.tree.GetEntries()
+
+        ## Tree navigation, event is the position in the selection
+        self.entries = self.total_entries
         self.event = -1
 
+        ## Random browsing walks a permutation of the selection, drawn on demand
+        self.shuffle = None
+        self.shuffle_position = -1
+        self.browsing_random = False
+
+        ## Weighted random browsing: weight of every entry, and the alias table
+        ## drawing from the selection, built again when the selection changes
+        self.weight = None
+        self.weights = None
+        self.alias = None
+        self.alias_selection = None
+        self.weighted_trail = []
+        self.weighted_position = -1
+
         ## Cuts
         self.current_cut = initial_cut_string
         self.history = []
 
+        ## Applied selections as (cut string, bitmap), @N being the N-th one
+        self.bitmaps = []
+
+        ## Recently computed selections, to re-apply cuts from the history for
+        ## free, and the ones of previous sessions
+        selection_store = None
+        if config.cut_cache_disk_mb > 0:
+            selection_store = SelectionStore(os.path.join(user_cache_directory(), 'selections'),
+                                             config.cut_cache_disk_mb*1024*1024)
+        self.selection_cache = SelectionCache(config.cut_cache_mb*1024*1024, selection_store)
+
+        ## Tree entries by (run, event), opened or built when first needed
+        self.event_index = None
+
+        ## Named sets of tagged entries, opened when first needed, and the
+        ## one new tags go to
+        self.tags = None
+        self.tag_set = DEFAULT_TAG_SET
+
         ## Particles to display
         self.event_particles = []
 
@@ -94,16 +257,145 @@ class Reader():
         ## Set teminal height for nice output
         self.terminal_adjust_height = 1
 
+        ## Columnar mode, events are sliced out of preloaded arrays
+        if config.columnar and self.chain is not None:
+            if self.compiled_schema is not None:
+                self.columns = self.make_columns(self.tree)
+            else:
+                print 'WARNING : columnar mode not supported by current Reader, reading events one by one'
+
+        ## Evaluate the schema entry by entry
+        self.formulas = None
+        if self.compiled_schema is not None and self.chain is not None and self.columns is None:
+            self.formulas = FormulaStore(self.chain, self.compiled_schema.expressions, self.tree_lock)
+
+        ## Derived columns, read from the columns or from the tree
+        self.derived_columns = None
+        self.derived_extra = derived_extra(self)
+        if len(self.derived) > 0:
+            self.derived_columns = self.make_derived()
+
+        ## Only keep the branches read by the getters and the current cut active
+        self.pruner = None
+        if config.prune_branches and self.chain is not None and self.columns is None:
+            used_branches = set(self.used_branches)
+            if self.formulas is not None:
+                for expression in self.formulas.expressions:
+                    used_branches.update(formula_branches(self.chain, expression))
+            if self.derived_columns is not None:
+                for expression in derived_inputs(self.derived):
+                    used_branches.update(formula_branches(self.chain, expression))
+            self.pruner = BranchPruner(self.chain, used_branches)
+
+        ## Processes scanning the files of a chain in parallel when applying cuts,
+        ## started by CDER.py before any thread or ROOT (see parallel.start_pool)
+        self.pool = None
+        if self.chain is not None and len(chain_files(self.chain)) > 1:
+            self.pool = shared_pool()
+
+        ## Count the entries of the other files
+        if self.chain is not None and None in self.file_entries:
+            self.counter = threading.Thread(target=self.count_files, name='CDER entry counter')
+            self.counter.daemon = True
+            self.counter.start()
+
+        ## Read-ahead of the events around the current one
+        self.prefetcher = None
+        if config.prefetch_depth > 0 and self.read_ahead:
+            self.prefetcher = Prefetcher(self.decode, config.prefetch_depth)
+
         if not (initial_cut_string == CUT_NO_SELECTION):
             print 'Applying cut string from config.ini:', initial_cut_string
             print 'Please wait ...'
-            if self.cut(initial_cut_string):
+            try:
+                cut_applied = self.cut(initial_cut_string)
+            except IOError, error:
+                print 'Cannot read the input files (%s)' % error
+                cut_applied = False
+            if cut_applied:
                 print 'Successful.'
             else:
                 print 'There is something wrong with the provided cut string. Please check.'
 
 
 
+    ## --------------------------------------- ##
+    def count_file(self, index):
+        """
+        Count the entries of one file of the chain and remember them
+        """
+
+        path = chain_files(self.chain)[index]
+
+        with self.tree_lock:
+            try:
+                entries = count_entries(path, self.tree_name)
+                self.entry_counts.put(path, self.tree_name, entries)
+            except IOError, error:
+                print 'WARNING : %s, skipping it' % error
+                entries = 0
+
+        self.file_entries[index] = entries
+
+
+
+    ## --------------------------------------- ##
+    def count_files(self):
+        """
+        Count the entries of all the files not counted yet, making them
+        available to navigation as they are counted. Runs in the background,
+        the random permutation grows at the next step through it.
+        """
+
+        for index, entries in enumerate(self.file_entries):
+            if entries is None:
+                self.count_file(index)
+
+                with self.tree_lock:
+                    self.total_entries = self.known_entries()
+                    if self.selection is None:
+                        self.entries = self.total_entries
+
+        self.entry_counts.save()
+
+
+
+    ## --------------------------------------- ##
+    def known_entries(self):
+        """
+        Number of entries of the files counted before the first one not
+        counted yet
+        """
+
+        total = 0
+        for entries in self.file_entries:
+            if entries is None:
+                break
+            total += entries
+        return total
+
+
+
+    ## --------------------------------------- ##
+    def counting(self):
+        """
+        Are the entries still being counted?
+        """
+
+        return self.counter is not None and self.counter.is_alive()
+
+
+
+    ## --------------------------------------- ##
+    def live(self):
+        """
+        Can new events still arrive after the last one?
+        """
+
+        return False
+
+
+
     ## --------------------------------------- ##
     def reset(self):
         """
@@ -123,12 +415,247 @@ class Reader():
 
 
 
+    ## --------------------------------------- ##
+    def decode(self, entry):
+        """
+        Read the kinematics of a tree entry without touching the local
+        containers. Safe to call from the prefetcher thread.
+        """
+
+        ## Getters fill the containers of a shallow copy of the reader
+        scratch = copy.copy(self)
+        scratch.reset()
+        scratch.extra_information = {}
+
+        with self.tree_lock:
+
+            ## Slice preloaded columns
+            if self.columns is not None:
+                self.compiled_schema.fill(scratch, self.columns.event(entry))
+
+            ## Evaluate the schema on this entry
+            elif self.formulas is not None:
+                self.compiled_schema.fill(scratch, self.formulas.event(entry))
+
+            ## Set tree pointer to retrieve desired event data
+            else:
+                self.read_entry(scratch, entry)
+
+            ## Extra information of the derived columns
+            if self.derived_columns is not None:
+                for name, (expression, format) in self.derived_extra.iteritems():
+                    value = self.derived_columns.value(expression, entry)
+                    if numpy.isnan(value):
+                        continue
+                    value = value.item()
+                    if format.endswith('d'):
+                        value = int(value)
+                    scratch.extra_information[name] = (value, format)
+
+        return (scratch.event_jets,
+                scratch.event_taus,
+                scratch.event_electrons,
+                scratch.event_muons,
+                scratch.event_photons,
+                scratch.event_met,
+                scratch.extra_information)
+
+
+
+    ## --------------------------------------- ##
+    def read_entry(self, scratch, entry):
+        """
+        Read a tree entry and run the getters of scratch over it, reading
+        it again if the getters turn out to need inactive branches
+        """
+
+        while True:
+            self.tree.GetEntry(entry)
+            if self.pruner is None:
+                scratch.get_particles()
+                return
+
+            recorder = BranchRecorder(self.tree, self.pruner.names)
+            scratch.tree = recorder
+            scratch.get_particles()
+            if not self.pruner.record(recorder.touched):
+                return
+
+            scratch.reset()
+            scratch.extra_information = {}
+
+
+
+    ## --------------------------------------- ##
+    def entry(self, position):
+        """
+        Tree entry at a given position in the current selection
+        """
+
+        if self.selection is None:
+            return position
+        return int(self.selection[position])
+
+
+
+    ## --------------------------------------- ##
+    def make_columns(self, tree):
+        """
+        Columnar store for all the expressions declared by the reader
+        """
+
+        return ColumnarStore(tree,
+                             self.compiled_schema.expressions,
+                             chunk_size=config.columnar_chunk_size,
+                             lock=self.tree_lock)
+
+
+
+    ## --------------------------------------- ##
+    def make_derived(self):
+        """
+        Store of the derived columns declared by the reader, None if they
+        cannot be computed from the input
+        """
+
+        if isinstance(self.columns, ColumnarStore):
+            source = self.columns
+        elif self.chain is not None:
+            source = ColumnarStore(self.chain, [], lock=self.tree_lock)
+        else:
+            print 'WARNING : derived columns not supported by current Reader'
+            return None
+
+        return DerivedStore(source, self.derived, self.identity(), lock=self.tree_lock)
+
+
+
+    ## --------------------------------------- ##
+    @classmethod
+    def needs_root(cls, file_path):
+        """
+        Does reading file_path go through ROOT?
+        """
+
+        return not is_cache(file_path)
+
+
+
+    ## --------------------------------------- ##
+    def open_store(self, file_path):
+        """
+        Columns to read the events from instead of a TChain, None to open
+        file_path with ROOT. Readers not reading ROOT files override this.
+        """
+
+        if is_cache(file_path):
+            return self.open_cache(file_path)
+        return None
+
+
+
+    ## --------------------------------------- ##
+    def open_cache(self, path):
+        """
+        Memory-mapped columns of a cache written by core.reader.convert
+        """
+
+        if self.compiled_schema is None:
+            raise ValueError('The current Reader has no schema, it cannot display %s' % path)
+
+        store = MappedStore(path, chunk_size=config.columnar_chunk_size, lock=self.tree_lock)
+
+        reader_name = self.__module__.split('.')[-1]
+        if store.header['reader'] != reader_name:
+            print 'WARNING : %s was written for %s, not %s' % (path, store.header['reader'], reader_name)
+        if store.stale():
+            print 'WARNING : the input files of %s changed since it was written' % path
+
+        return store
+
+
+
+    ## --------------------------------------- ##
+    def window(self):
+        """
+        Entries surrounding the current event, closest first
+        """
+
+        positions = [self.event]
+        for step in range(1, config.prefetch_depth+1):
+
+            ## The neighbours among the events drawn by weight, the next
+            ## ones are drawn ahead of time
+            if self.browsing_random and self.weighted_selection():
+                for index in (self.weighted_position + step,
+                              self.weighted_position - step):
+                    if 0 <= index < len(self.weighted_trail):
+                        positions.append(self.weighted_trail[index])
+
+            ## The neighbours in the random permutation
+            elif self.browsing_random and self.shuffle is not None:
+                for neighbour in (self.shuffle[self.shuffle_position + step],
+                                  self.shuffle[self.shuffle_position - step]):
+                    if neighbour is not None:
+                        positions.append(neighbour)
+
+            else:
+                if self.event + step < self.entries:
+                    positions.append(self.event + step)
+                if self.event - step >= 0:
+                    positions.append(self.event - step)
+
+        return [self.entry(position) for position in positions]
+
+
+
+    ## --------------------------------------- ##
+    def load(self):
+        """
+        Fill the local containers with the current event, served from the
+        read-ahead buffer when possible, and convert them into particles
+        """
+
+        ## Empty local containers
+        self.reset()
+
+        ## Decode on the spot if the prefetcher did not get to it yet
+        entry = self.entry(self.event)
+        snapshot = None
+        if self.prefetcher is not None:
+            snapshot = self.prefetcher.get(entry)
+        if snapshot is None:
+            snapshot = self.decode(entry)
+            if self.prefetcher is not None:
+                self.prefetcher.put(entry, snapshot)
+
+        (self.event_jets,
+         self.event_taus,
+         self.event_electrons,
+         self.event_muons,
+         self.event_photons,
+         self.event_met,
+         self.extra_information) = snapshot
+
+        ## Convert these kinematics into particle objects
+        self.make_particles()
+
+        ## Start reading the neighbours of the new event
+        if self.prefetcher is not None:
+            self.prefetcher.center(self.window())
+
+        return self.event_particles
+
+
+
     ## --------------------------------------- ##
     def next(self):
         """
         Fetch next event into local containers
         """
 
+        self.browsing_random = False
+
         ## Increment local event iterator
         if self.event <= (self.entries-1):
             self.event += 1
@@ -139,19 +666,8 @@ class Reader():
             ## No new event is selected, tell Display
             return None
 
-        ## Empty local containers
-        self.reset()
-
-        ## Set tree pointer to retrieve desired event data
-        self.tree.GetEntry(self.event)
-
-        ## Get new particle kinematics
-        self.get_particles()
-
-        ## Convert these kinematics into particle objects
-        self.make_particles()
-
-        return self.event_particles
+        ## Fill local containers and convert into particle objects
+        return self.load()
 
 
 
@@ -161,6 +677,8 @@ class Reader():
         Fetch previous event into local containers
         """
 
+        self.browsing_random = False
+
         ## Decrement local event iterator
         if self.event >= 0:
             self.event -= 1
@@ -171,44 +689,393 @@ class Reader():
             ## No new event is selected, tell Display
             return None
 
-        ## Empty local containers
-        self.reset()
+        ## Fill local containers and convert into particle objects
+        return self.load()
 
-        ## Set tree pointer to retrieve desired event data
-        self.tree.GetEntry(self.event)
 
-        ## Get new particle kinematics
-        self.get_particles()
 
-        ## Convert these kinematics
-        self.make_particles()
+    ## --------------------------------------- ##
+    def random(self):
+        """
+        Fetch the next event of the random permutation of the selection
+        into local containers, or a random event drawn in proportion to
+        the weight if one is set
+        """
 
-        return self.event_particles
+        if self.weights is not None:
+            return self.walk_weighted(1)
+        return self.walk_shuffle(1)
 
 
 
     ## --------------------------------------- ##
-    def random(self):
+    def random_previous(self):
         """
-        Fetch random event into local containers
+        Fetch back the previous random event
         """
 
-        ## Empty local containers
-        self.reset()
+        if self.weights is not None:
+            return self.walk_weighted(-1)
+        return self.walk_shuffle(-1)
 
-        ## Set local iterator to random value in allowed range
-        self.event = rand.randint(0, (self.entries-1))
 
-        ## Set tree pointer to retrieve desired event data
-        self.tree.GetEntry(self.event)
 
-        ## Get new particle kinematics
-        self.get_particles()
+    ## --------------------------------------- ##
+    def walk_shuffle(self, step):
+        """
+        Move by step in the random permutation of the selection, events
+        are not shown twice before all of them have been
+        """
 
-        ## Convert these kinematics
-        self.make_particles()
+        if self.shuffle is None:
+            seed = None
+            if config.shuffle_seed != 0:
+                seed = config.shuffle_seed
+            self.shuffle = Shuffle(self.entries, seed)
+            self.shuffle_position = -1
+
+        ## Entries counted since, added to the events not shown yet
+        entries = self.entries
+        if entries > self.shuffle.n:
+            self.shuffle.grow(entries)
+
+        ## Start over once the whole permutation was walked
+        position = self.shuffle_position + step
+        if position >= self.shuffle.n:
+            position = 0
+
+        ## Beginning of the permutation, no new event is selected, tell Display
+        if self.shuffle[position] is None:
+            return None
+
+        self.shuffle_position = position
+        self.event = self.shuffle[position]
+        self.browsing_random = True
+
+        ## Fill local containers and convert into particle objects,
+        ## the read-ahead window follows to the new position
+        return self.load()
+
+
+
+    ## --------------------------------------- ##
+    def weighted_selection(self):
+        """
+        Were the events drawn by weight drawn from the current selection?
+        """
+
+        return (self.weights is not None and self.alias is not None and
+                self.alias_selection is self.selection)
+
+
+
+    ## --------------------------------------- ##
+    def walk_weighted(self, step):
+        """
+        Move by step in the events drawn in proportion to the weight, new
+        ones are drawn prefetch_depth events ahead of the current one
+        """
+
+        ## The alias table follows the selection
+        if not self.weighted_selection():
+            weights = self.weights
+            if self.selection is not None:
+                weights = weights[self.selection]
+            seed = None
+            if config.shuffle_seed != 0:
+                seed = config.shuffle_seed
+            try:
+                self.alias = AliasTable(weights, seed)
+            except ValueError:
+                print 'No selected event has a positive weight "%s"' % self.weight
+                return None
+            self.alias_selection = self.selection
+            self.weighted_trail = []
+            self.weighted_position = -1
+
+        position = self.weighted_position + step
+        if position < 0:
+            return None
+
+        ## Keep the next draws queued so they can be read ahead
+        while len(self.weighted_trail) <= position + config.prefetch_depth:
+            self.weighted_trail.append(self.alias.draw())
+
+        self.weighted_position = position
+        self.event = self.weighted_trail[position]
+        self.browsing_random = True
+
+        return self.load()
 
-        return self.event_particles
+
+
+    ## --------------------------------------- ##
+    def weight_async(self, expression):
+        """
+        Start evaluating a weight for all entries in the background and
+        return the running job. Once the job is done, pass its result to
+        set_weights.
+        """
+
+        job = Job(self.evaluate_weights, expression)
+        job.expression = expression
+        job.start()
+
+        return job
+
+
+
+    ## --------------------------------------- ##
+    def evaluate_weights(self, expression, progress=None):
+        """
+        Weight of every tree entry, negative ones counting as 0. Safe to
+        call from a background thread.
+        """
+
+        if progress is None:
+            progress = Progress()
+
+        ## All the entries are needed
+        if self.counter is not None:
+            self.counter.join()
+        progress.total = self.total_entries
+
+        ## Vectorized evaluation over the preloaded columns
+        if isinstance(self.columns, ColumnarStore):
+            try:
+                return event_weights_columnar(self.columns, expression, progress)
+            except (ExpressionError, ValueError), error:
+                if self.full_tree is None:
+                    raise ValueError('Cannot evaluate the weight on the cached columns (%s)' % error)
+                print 'Cannot evaluate the weight on columns (%s), using ROOT' % error
+                progress.scanned = 0
+
+        if self.full_tree is None:
+            raise ValueError('The events of the current Reader cannot be weighted')
+
+        branches = self.hold_branches([expression])
+        try:
+            return event_weights(self.full_tree, expression, self.total_entries,
+                                 config.cut_chunk_size, progress, self.tree_lock)
+        finally:
+            self.release_branches(branches)
+
+
+
+    ## --------------------------------------- ##
+    def set_weights(self, expression, weights):
+        """
+        Draw random events in proportion to weights from now on, or
+        uniformly again if expression is None
+        """
+
+        self.weight = expression
+        self.weights = weights
+        if expression is None:
+            self.weights = None
+
+        ## Built at the next draw
+        self.alias = None
+        self.alias_selection = None
+        self.weighted_trail = []
+        self.weighted_position = -1
+        self.restart_prefetch()
+
+
+
+    ## --------------------------------------- ##
+    def goto_entry(self, entry):
+        """
+        Fetch a given tree entry into local containers, removing the cut
+        if the entry does not pass it
+        """
+
+        if self.selection is not None:
+            position = int(numpy.searchsorted(self.selection, entry))
+            if position == self.entries or self.selection[position] != entry:
+                print 'Entry %d does not pass "%s". Resetting the full tree' % (entry, self.current_cut)
+                self.reset_cut()
+
+        if self.selection is None:
+            position = entry
+
+        self.event = position
+        self.browsing_random = False
+
+        return self.load()
+
+
+
+    ## --------------------------------------- ##
+    def find_event(self, run, event):
+        """
+        Tree entry of an event given its run and event numbers, None if it is
+        not in the tree. The index must have been opened or built first.
+        """
+
+        return self.event_index.find(run, event)
+
+
+
+    ## --------------------------------------- ##
+    def open_index(self):
+        """
+        Open the event index stored by a previous session, returns True if
+        there is one
+        """
+
+        if self.event_index is None:
+            self.event_index = open_index(self.index_paths())
+        return self.event_index is not None
+
+
+
+    ## --------------------------------------- ##
+    def index_async(self):
+        """
+        Start building the event index in the background and return the
+        running job
+        """
+
+        job = Job(self.build_index)
+        job.start()
+
+        return job
+
+
+
+    ## --------------------------------------- ##
+    def build_index(self, progress=None):
+        """
+        Read the run and event numbers of all entries, index them and store
+        the index for the next sessions. Safe to call from a background thread.
+        """
+
+        if progress is None:
+            progress = Progress()
+
+        columns = self.read_index_columns(progress)
+        index = build_index(*columns)
+
+        if save_index(index, self.index_paths()) is None:
+            print 'WARNING : cannot store the event index, it will be built again next time'
+
+        self.event_index = index
+        return index
+
+
+
+    ## --------------------------------------- ##
+    def index_paths(self):
+        """
+        Places where the event index of the input files is stored
+        """
+
+        return index_paths(self.identity(), (config.run_branch, config.event_branch))
+
+
+
+    ## --------------------------------------- ##
+    def read_index_columns(self, progress):
+        """
+        Run and event numbers of all entries, in tree order
+        """
+
+        branches = (config.run_branch, config.event_branch)
+
+        ## All the entries are needed
+        if self.counter is not None:
+            self.counter.join()
+        progress.total = len(branches)*self.total_entries
+
+        ## Without a tree, only the branches of the columns are there
+        if self.chain is None:
+            columns = []
+            for branch in branches:
+                values, offsets = self.columns.read_column(branch, 0, self.total_entries)
+                if len(values) != self.total_entries:
+                    raise ValueError('%s is not one value per event' % branch)
+                columns.append(values)
+                progress.advance(self.total_entries)
+            return columns
+
+        chunk_size = config.cut_chunk_size
+        if chunk_size <= 0:
+            chunk_size = max(self.total_entries, 1)
+
+        held = self.hold_branches(branches)
+        try:
+            columns = []
+            for branch in branches:
+                chunks = []
+                for first_entry in xrange(0, self.total_entries, chunk_size):
+                    n_entries = min(chunk_size, self.total_entries - first_entry)
+                    with self.tree_lock:
+                        values = draw(self.full_tree, branch, first_entry, n_entries)
+                    if values is None:
+                        raise ValueError('Cannot read %s' % branch)
+                    if len(values) != n_entries:
+                        raise ValueError('%s is not one value per event' % branch)
+                    chunks.append(values)
+                    progress.advance(n_entries)
+                columns.append(numpy.concatenate(chunks))
+        finally:
+            self.release_branches(held)
+
+        return columns
+
+
+
+    ## --------------------------------------- ##
+    def tag_sets(self):
+        """
+        Tag sets of the input files, None if they cannot be opened
+        """
+
+        if self.tags is None:
+            try:
+                self.tags = TagSets(tags_path(self.identity()))
+            except (IOError, OSError), error:
+                print 'WARNING : cannot open the tags (%s)' % error
+        return self.tags
+
+
+
+    ## --------------------------------------- ##
+    def toggle_tag(self):
+        """
+        Add the current entry to the current tag set, or remove it if it
+        is there already
+        """
+
+        tags = self.tag_sets()
+        if tags is None or not 0 <= self.event < self.entries:
+            return
+
+        entry = self.entry(self.event)
+        try:
+            tagged = tags.toggle(self.tag_set, entry)
+        except (IOError, OSError), error:
+            print 'WARNING : cannot write the tags (%s)' % error
+            return
+        if tagged:
+            print 'Entry %d tagged %s' % (entry, self.tag_set)
+        else:
+            print 'Entry %d no longer tagged %s' % (entry, self.tag_set)
+
+
+
+    ## --------------------------------------- ##
+    def tag_selection(self, name):
+        """
+        Sorted array of the entries of a tag set, None if the tags cannot
+        be opened
+        """
+
+        tags = self.tag_sets()
+        if tags is None:
+            return None
+        return tags.entries(name)
 
 
 
@@ -219,46 +1086,429 @@ class Reader():
         on an existing variable in the tree
         """
 
-        ## Flag for sucessful cut
-        cut_applied = False
-        
         ## Do not cut if nothing is entered
-        if cut_string != '':
+        if cut_string == '':
+            return False
 
-            ## Apply the cut by copying a subset of the full tree
-            self.cut_tree = self.full_tree.CopyTree(cut_string)
-            self.tree     = self.cut_tree
+        ## Entries passing the cut
+        selection = self.evaluate_cut(cut_string)
 
-            ## Do not let CDER crash if the cut is not valid, jusr do nothing
-            try:
-                self.entries = self.cut_tree.GetEntries()
-                self.current_cut = cut_string
-                cut_applied = True
-            except TypeError:
-                self.tree = self.full_tree
-                print 'Bad cut expression : "%s". Resetting the full tree' % cut_string
-                self.current_cut = CUT_NO_SELECTION
-                cut_applied = False
+        ## Store the cut string in the cut history
+        self.remember(cut_string)
+
+        return self.apply_cut(cut_string, selection)
+
+
+
+    ## --------------------------------------- ##
+    def cut_async(self, cut_string):
+        """
+        Start evaluating a cut in the background and return the running job.
+        Once the job is done, pass its result to apply_cut, the current
+        selection stays in place until then.
+        """
 
-            ## Store the cut string in the cut history
-            self.history.reverse()
-            self.history.append(cut_string)
-            self.history.reverse()
+        ## Store the cut string in the cut history
+        self.remember(cut_string)
+
+        job = Job(self.evaluate_cut, cut_string, (self.current_cut, self.selection))
+        job.cut_string = cut_string
+        job.start()
+
+        return job
+
+
+
+    ## --------------------------------------- ##
+    def apply_cut(self, cut_string, selection):
+        """
+        Make a selection computed for cut_string the current one
+        """
+
+        ## Flag for sucessful cut
+        cut_applied = False
+
+        ## Do not let CDER crash if the cut is not valid, jusr do nothing
+        if selection is None:
+            print 'Bad cut expression : "%s". Resetting the full tree' % cut_string
+            self.selection = None
+            self.entries = self.total_entries
+            self.current_cut = CUT_NO_SELECTION
+            self.shuffle = None
+            self.prune_branches()
+
+        ## There would be nothing to display, keep the current selection
+        elif len(selection) == 0:
+            print 'No event passes "%s". Keeping the current selection' % cut_string
+
+        else:
+            self.selection = selection
+            self.entries = len(selection)
+            self.current_cut = cut_string
+            self.shuffle = None
+            self.prune_branches()
+            cut_applied = True
+
+            ## Keep it to be combined with the next ones
+            self.bitmaps.append((cut_string, from_entries(selection, self.total_entries)))
+            print 'Selection @%d : %d events' % (len(self.bitmaps), self.entries)
+
+        ## Start reading around the current position in the new selection
+        self.restart_prefetch()
 
         return cut_applied
 
 
 
+    ## --------------------------------------- ##
+    def restart_prefetch(self):
+        """
+        Drop the read-ahead window, including the entry being decoded, when
+        the events to browse change, and start over around the current one
+        """
+
+        if self.prefetcher is None:
+            return
+
+        self.prefetcher.clear()
+        if 0 <= self.event < self.entries:
+            self.prefetcher.center(self.window())
+
+
+
+    ## --------------------------------------- ##
+    def remember(self, cut_string):
+        """
+        Store a cut string in the cut history, most recent first
+        """
+
+        self.history.reverse()
+        self.history.append(cut_string)
+        self.history.reverse()
+
+
+
+    ## --------------------------------------- ##
+    def evaluate_cut(self, cut_string, base=None, progress=None):
+        """
+        Sorted array of the tree entries passing a cut, None if the cut is
+        not valid. Selections already computed on the same input files are
+        reused. base is the (cut string, selection) pair the cut may refine,
+        the current ones by default. Safe to call from a background thread.
+        """
+
+        if base is None:
+            base = (self.current_cut, self.selection)
+        if progress is None:
+            progress = Progress()
+
+        ## Combination of previous selections, only valid in this session
+        if uses_selections(cut_string):
+            return self.combine_selections(cut_string)
+
+        key = self.selection_cache.key(cut_string, self.identity())
+        if self.derived_columns is not None and self.derived_columns.used_by(cut_string):
+            key += self.derived_columns.definition_keys(cut_string)
+        selection = self.selection_cache.get(key)
+
+        if selection is None:
+
+            ## Tightening the current cut, only look at the entries it selected
+            with self.tree_lock:
+                extra = self.refinement(cut_string, base)
+            if extra is not None:
+                cut_string, entries = extra, base[1]
+                progress.total = len(entries)
+            else:
+                entries = None
+                progress.total = self.total_entries
+
+            ## Derived columns are only known to numpy
+            if self.derived_columns is not None and self.derived_columns.used_by(cut_string):
+                branches = self.hold_branches(self.derived_columns.branches(cut_string))
+                try:
+                    selection = select_entries_columnar(self.derived_columns, cut_string, entries, progress)
+                except (ExpressionError, ValueError), error:
+                    print 'Cannot evaluate the cut on derived columns (%s)' % error
+                    return None
+                finally:
+                    self.release_branches(branches)
+
+            ## Vectorized evaluation over the preloaded columns
+            elif self.columns is not None:
+                try:
+                    selection = select_entries_columnar(self.columns, cut_string, entries, progress)
+                except (ExpressionError, ValueError), error:
+                    if self.full_tree is None:
+                        print 'Cannot evaluate the cut on the cached columns (%s)' % error
+                        return None
+                    print 'Cannot evaluate the cut on columns (%s), using ROOT' % error
+                    progress.scanned = progress.passing = 0
+
+            ## Scan all the files of the chain at once
+            if selection is None and self.pool is not None and entries is None:
+                selection = self.evaluate_cut_parallel(cut_string, progress)
+                if selection is None:
+                    progress.scanned = progress.passing = 0
+
+            ## Scan the tree for entries passing the cut
+            if selection is None:
+                branches = self.hold_branches([cut_string])
+                try:
+                    selection = select_entries(self.full_tree, cut_string, config.cut_chunk_size, entries,
+                                               progress, self.tree_lock)
+                finally:
+                    self.release_branches(branches)
+
+        if selection is not None:
+            self.selection_cache.put(key, selection)
+
+        return selection
+
+
+
+    ## --------------------------------------- ##
+    def combine_selections(self, cut_string):
+        """
+        Sorted array of the tree entries of a combination of previous
+        selections, such as "@1 && !@3", None if it is not valid
+        """
+
+        ## Complements need the full number of entries
+        if self.counter is not None:
+            self.counter.join()
+
+        try:
+            return combine_selections(cut_string, [bitmap for cut, bitmap in self.bitmaps],
+                                      self.total_entries)
+        except ExpressionError, error:
+            print error
+            return None
+
+
+
+    ## --------------------------------------- ##
+    def export_async(self, path=None):
+        """
+        Start writing the selected events to a columnar cache in the
+        background and return the running job, its path being job.path
+        """
+
+        if path is None:
+            path = skim_output(self.file_path)
+
+        job = Job(self.export_selection, path, self.selection, self.current_cut)
+        job.path = path
+        job.start()
+
+        return job
+
+
+
+    ## --------------------------------------- ##
+    def export_selection(self, path, selection, cut_string, progress=None):
+        """
+        Write the entries of a selection (all of them if None) to a columnar
+        cache, only with the columns the reader displays. Returns the number
+        of events written. Safe to call from a background thread.
+        """
+
+        if progress is None:
+            progress = Progress()
+
+        if selection is None:
+            if self.counter is not None:
+                self.counter.join()
+            progress.total = self.total_entries
+        else:
+            progress.total = len(selection)
+
+        store = self.export_store()
+        reader_name = self.__module__.split('.')[-1]
+
+        branches = self.hold_branches(store.expressions)
+        try:
+            return write_cache(store, path, reader_name, self.tree_name, self.identity(),
+                               progress, selection, cut_string)
+        finally:
+            self.release_branches(branches)
+
+
+
+    ## --------------------------------------- ##
+    def export_store(self):
+        """
+        Columns to export: the expressions of the schema, the inputs of the
+        derived columns, and the run and event branches when the input has them
+        """
+
+        if self.compiled_schema is None:
+            raise ValueError('The current Reader has no schema, its events cannot be exported')
+
+        if self.chain is None:
+            if not isinstance(self.columns, ColumnarStore):
+                raise ValueError('The events of the current Reader cannot be exported')
+            expressions = list(derived_inputs(self.derived)) + [config.run_branch, config.event_branch]
+            return self.columns.extended([expression for expression in expressions
+                                          if self.columns.has_column(expression)])
+
+        expressions = list(self.compiled_schema.expressions)
+        for expression in derived_inputs(self.derived):
+            if expression not in expressions:
+                expressions.append(expression)
+        with self.tree_lock:
+            for branch in (config.run_branch, config.event_branch):
+                if self.full_tree.GetBranch(branch) and branch not in expressions:
+                    expressions.append(branch)
+
+        return ColumnarStore(self.full_tree, expressions,
+                             chunk_size=config.columnar_chunk_size,
+                             lock=self.tree_lock)
+
+
+
+    ## --------------------------------------- ##
+    def identity(self):
+        """
+        Identity of the input files, to recognize selections made on them
+        """
+
+        if self.chain is None:
+            return self.columns.identity()
+        return chain_identity(self.chain)
+
+
+
+    ## --------------------------------------- ##
+    def evaluate_cut_parallel(self, cut_string, progress):
+        """
+        Evaluate a cut over the full tree, one file per process. None if
+        the files could not all be scanned, they are then scanned serially.
+        """
+
+        scan = new_scan()
+        try:
+            return select_entries_parallel(self.pool,
+                                           chain_files(self.full_tree),
+                                           self.tree_name,
+                                           cut_string,
+                                           config.cut_chunk_size,
+                                           progress,
+                                           scan)
+
+        ## Do not let the workers finish a cancelled cut, a cut started
+        ## since goes on
+        except Cancelled:
+            cancel_scan(scan)
+            raise
+
+
+
+    ## --------------------------------------- ##
+    def refinement(self, cut_string, base):
+        """
+        Clauses to evaluate over the base selection if cut_string is the
+        base cut and-ed with more clauses, None if the full tree must be
+        scanned. Selections and tag sets are not formulas to refine.
+        """
+
+        base_cut, base_selection = base
+        if base_selection is None or self.full_tree is None:
+            return None
+        if self.session_cut(base_cut) or self.session_cut(cut_string):
+            return None
+
+        extra = extra_clauses(cut_string, base_cut)
+        if extra is None:
+            return None
+
+        ## Clauses looping over the same vector branch are evaluated object by
+        ## object by ROOT, splitting them is only exact if one side is per-event
+        if not (is_per_event(self.full_tree, base_cut) or is_per_event(self.full_tree, extra)):
+            return None
+
+        return extra
+
+
+
     ## --------------------------------------- ##
     def reset_cut(self):
         """
         Remove the currently applied cut
         """
-        
-        self.tree     = self.full_tree
-        self.cut_tree = self.full_tree
-        self.entries = self.full_tree.GetEntries()
+
+        self.selection = None
+        self.entries = self.total_entries
         self.current_cut = CUT_NO_SELECTION
+        self.shuffle = None
+        self.prune_branches()
+        self.restart_prefetch()
+
+
+
+    ## --------------------------------------- ##
+    def session_cut(self, cut_string):
+        """
+        Is a cut made of previous selections or tags rather than branches?
+        """
+
+        return uses_selections(cut_string) or is_tagged_cut(cut_string)
+
+
+
+    ## --------------------------------------- ##
+    def hold_branches(self, expressions):
+        """
+        Keep the branches read by expressions active while a job scans the
+        tree, whatever the cut applied in the meantime. Returns the branches
+        to give to release_branches once done.
+        """
+
+        if self.pruner is None:
+            return set()
+
+        with self.tree_lock:
+            branches = set()
+            for expression in expressions:
+                branches.update(formula_branches(self.full_tree, expression))
+            self.pruner.hold(branches)
+
+        return branches
+
+
+
+    ## --------------------------------------- ##
+    def release_branches(self, branches):
+        """
+        Let branches held by a finished job be switched off again
+        """
+
+        if self.pruner is None:
+            return
+
+        with self.tree_lock:
+            self.pruner.release(branches)
+        self.prune_branches()
+
+
+
+    ## --------------------------------------- ##
+    def prune_branches(self):
+        """
+        Keep the branches of the current cut active, and only those
+        """
+
+        if self.pruner is None:
+            return
+
+        with self.tree_lock:
+            if self.current_cut == CUT_NO_SELECTION or self.session_cut(self.current_cut):
+                branches = set()
+            elif self.derived_columns is not None and self.derived_columns.used_by(self.current_cut):
+                branches = self.derived_columns.branches(self.current_cut)
+            else:
+                branches = formula_branches(self.full_tree, self.current_cut)
+            self.pruner.prune(branches)
 
 
 
@@ -419,7 +1669,7 @@ class Reader():
         
         ## Print header and legend
         print '===='*14
-        print '| Event      | {:<40d}|'.format(self.event)
+        print '| Event      | {:<40d}|'.format(self.entry(self.event))
         
         print '----'*14
         print '| object     | {:<12}| {:<12}| {:<12}|'.format('pt [GeV]', 'eta', 'phi')
@@ -519,5 +1769,12 @@ class Reader():
 
         ## Print Number of events available for display and current cut applied
         print '\n'*(self.terminal_adjust_height)
-        print '\033[31mEvents :\033[0m %d   \033[31mselection :\033[0m %s' % (self.entries, self.current_cut)
+        counting = ''
+        if self.counting() and self.selection is None:
+            counting = ' (counting ...)'
+        ## Tags are only looked up once opened by a tag command or B
+        tagged = ''
+        if self.tags is not None and len(self.tags.names(self.entry(self.event))) > 0:
+            tagged = '   \033[31mtags :\033[0m %s' % ', '.join(self.tags.names(self.entry(self.event)))
+        print '\033[31mEvents :\033[0m %d%s   \033[31mselection :\033[0m %s%s' % (self.entries, counting, self.current_cut, tagged)
 
@@ -0,0 +1,158 @@
+#**************************************************#
+# file   : core/reader/schema.py                   #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Declarative description of the objects a reader  #
+# displays, compiled into one extraction routine   #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Containers of the reader a schema can fill
+CONTAINERS = ('jets', 'taus', 'electrons', 'muons', 'photons', 'met')
+
+## Optional keys of a source and their default values
+SOURCE_DEFAULTS = {'unit'     : 1.0,
+                   'btag'     : None,
+                   'btag_cut' : 0.0,
+                   'select'   : None}
+
+
+## --------------------------------------- ##
+def compile_source(container, source):
+    """
+    Complete a source with the default values, checking it has everything needed
+    """
+
+    required = ('pt', 'phi') if container == 'met' else ('pt', 'eta', 'phi')
+    for key in required:
+        if key not in source:
+            raise ValueError('Missing "%s" in a %s source of the schema' % (key, container))
+
+    compiled = dict(SOURCE_DEFAULTS)
+    compiled.update(source)
+    return compiled
+
+
+
+####################################################
+class Schema():
+
+    ## --------------------------------------- ##
+    def __init__(self, objects, extra={}):
+        """
+        Constructor. objects maps a container (jets, taus, electrons, muons,
+        photons, met) to a list of sources, each a dictionary of expressions:
+
+            pt, eta, phi : kinematics, one value per object (no eta for met)
+            unit         : factor bringing pt to MeV (1.0)
+            btag, btag_cut : the object is b-tagged if btag > btag_cut (jets)
+            select       : only keep the objects, or the whole source if it
+                           is one value per event, for which select is true
+
+        extra maps the names of the extra information to (expression, format).
+        Expressions are branch names or any TTreeFormula expression.
+        """
+
+        self.sources = {}
+        for container, sources in objects.iteritems():
+            if container not in CONTAINERS:
+                raise ValueError('Unknown object type "%s" in the schema' % container)
+            if isinstance(sources, dict):
+                sources = [sources]
+            self.sources[container] = [compile_source(container, source) for source in sources]
+
+        self.extra = dict(extra)
+
+        ## Everything to read for one event
+        expressions = set()
+        for sources in self.sources.itervalues():
+            for source in sources:
+                for key in ('pt', 'eta', 'phi', 'btag', 'select'):
+                    if source.get(key) is not None:
+                        expressions.add(source[key])
+        for expression, format in self.extra.itervalues():
+            expressions.add(expression)
+        self.expressions = sorted(expressions)
+
+
+
+    ## --------------------------------------- ##
+    def objects(self, container, source, event):
+        """
+        Tuples of the objects of a source in an event, event mapping every
+        expression to a numpy array of its values
+        """
+
+        columns = [event[source['pt']]*source['unit']]
+        if container != 'met':
+            columns.append(event[source['eta']])
+        columns.append(event[source['phi']])
+        if source['btag'] is not None:
+            columns.append(event[source['btag']] > source['btag_cut'])
+
+        n_objects = min(len(column) for column in columns)
+        columns = [column[:n_objects] for column in columns]
+
+        if source['select'] is not None:
+            select = event[source['select']] != 0
+
+            ## One condition for the whole source
+            if len(select) == 1:
+                if not select[0]:
+                    return []
+
+            else:
+                n_objects = min(n_objects, len(select))
+                columns = [column[:n_objects][select[:n_objects]] for column in columns]
+
+        return zip(*[column.tolist() for column in columns])
+
+
+
+    ## --------------------------------------- ##
+    def fill(self, reader, event):
+        """
+        Fill the containers and the extra information of a reader
+        with the content of one event
+        """
+
+        for container, sources in self.sources.iteritems():
+            for source in sources:
+                objects = self.objects(container, source, event)
+
+                ## MET is a single 2-tuple, the first source with a value wins
+                if container == 'met':
+                    if reader.event_met is None and len(objects) > 0:
+                        reader.event_met = objects[0]
+
+                ## Other containers get one tuple per object
+                else:
+                    getattr(reader, 'event_%s' % container).extend(objects)
+
+        for name, (expression, format) in self.extra.iteritems():
+            values = event[expression]
+            if len(values) == 0:
+                continue
+            value = values[0].item()
+            if format.endswith('d'):
+                value = int(value)
+            reader.extra_information[name] = (value, format)
@@ -0,0 +1,532 @@
+#**************************************************#
+# file   : core/reader/selection.py                #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Evaluate cuts into sorted arrays of passing      #
+# entry numbers instead of copies of the tree      #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import os, hashlib, itertools, threading, zipfile
+from collections import OrderedDict
+
+## numpy imports
+import numpy
+
+## CDER imports
+from columnar import draw, is_per_event, take_rows
+from expression import parse, names, evaluate
+from jobs import Progress
+
+## Bump to forget the selections stored on disk by earlier versions
+STORE_VERSION = 2
+
+
+## --------------------------------------- ##
+def normalize_cut(cut_string):
+    """
+    Remove the whitespace not part of a string literal, so that
+    equivalent ways of typing a cut compare equal
+    """
+
+    normalized = []
+    quote = None
+    for character in cut_string:
+        if quote is None and character.isspace():
+            continue
+        if character in '"\'':
+            if quote is None:
+                quote = character
+            elif quote == character:
+                quote = None
+        normalized.append(character)
+
+    return ''.join(normalized)
+
+
+
+## --------------------------------------- ##
+def strip_parentheses(clause):
+    """
+    Remove parentheses enclosing a whole clause
+    """
+
+    while clause.startswith('(') and clause.endswith(')'):
+        depth = 0
+        for i, character in enumerate(clause):
+            if character == '(':
+                depth += 1
+            elif character == ')':
+                depth -= 1
+            ## The first parenthesis closes before the end
+            if depth == 0 and i < len(clause)-1:
+                return clause
+        clause = clause[1:-1]
+
+    return clause
+
+
+
+## --------------------------------------- ##
+def split_conjunction(cut_string):
+    """
+    Normalized clauses of a cut joined by top-level &&, nested conjunctions
+    being flattened. A cut with a top-level || is a single clause, since
+    && binds tighter.
+    """
+
+    cut_string = strip_parentheses(normalize_cut(cut_string))
+
+    clauses = []
+    depth = 0
+    quote = None
+    start = 0
+    i = 0
+    disjunction = False
+    while i < len(cut_string):
+        character = cut_string[i]
+        if quote is not None:
+            if character == quote:
+                quote = None
+        elif character in '"\'':
+            quote = character
+        elif character == '(':
+            depth += 1
+        elif character == ')':
+            depth -= 1
+        elif depth == 0 and cut_string.startswith('&&', i):
+            clauses.append(cut_string[start:i])
+            start = i+2
+            i += 1
+        elif depth == 0 and cut_string.startswith('||', i):
+            disjunction = True
+            i += 1
+        i += 1
+    clauses.append(cut_string[start:])
+
+    ## A single clause cannot be split further
+    if disjunction:
+        return [cut_string]
+    if len(clauses) == 1:
+        return clauses
+
+    flattened = []
+    for clause in clauses:
+        flattened += split_conjunction(clause)
+    return flattened
+
+
+
+## --------------------------------------- ##
+def extra_clauses(cut_string, base_cut):
+    """
+    If cut_string is base_cut and-ed with more clauses, return these
+    clauses as a cut string, None otherwise
+    """
+
+    extra = split_conjunction(cut_string)
+    for clause in split_conjunction(base_cut):
+        if clause not in extra:
+            return None
+        extra.remove(clause)
+
+    if len(extra) == 0:
+        return None
+
+    return '&&'.join('(%s)' % clause for clause in extra)
+
+
+
+## --------------------------------------- ##
+def select_entries(tree, cut_string, chunk_size=0, entries=None, progress=None, lock=None):
+    """
+    Sorted numpy array of the tree entries passing cut_string, None if ROOT
+    cannot make sense of the cut. The tree is scanned chunk_size entries at
+    a time (0 to scan it in one go) to bound the memory used by ROOT. If a
+    sorted array of entries is given, only these entries are looked at.
+    The lock protecting the tree is only held while scanning a chunk.
+    """
+
+    from ROOT import TEntryList
+
+    if progress is None:
+        progress = Progress()
+    if lock is None:
+        lock = threading.RLock()
+
+    if entries is not None:
+        n_entries = len(entries)
+    else:
+        with lock:
+            n_entries = tree.GetEntries()
+    progress.total = n_entries
+
+    if chunk_size <= 0:
+        chunk_size = n_entries
+
+    selected = []
+    for first_entry in xrange(0, n_entries, max(chunk_size, 1)):
+        n_chunk = min(chunk_size, n_entries - first_entry)
+
+        with lock:
+
+            ## Entry$ is the entry number in the whole chain, it appears once per
+            ## passing object when the cut runs over vector branches
+            if entries is None:
+                rows = draw(tree, 'Entry$', first_entry, n_chunk, selection=cut_string)
+
+            ## Restrict the scan to the given entries of this chunk
+            else:
+                entry_list = TEntryList('cder_entries', '', tree)
+                for entry in entries[first_entry:first_entry+n_chunk]:
+                    entry_list.Enter(int(entry), tree)
+                tree.SetEntryList(entry_list)
+                try:
+                    rows = draw(tree, 'Entry$', selection=cut_string)
+                finally:
+                    tree.SetEntryList(0)
+
+        if rows is None:
+            return None
+
+        passing = numpy.unique(rows.astype(numpy.int64))
+        selected.append(passing)
+        progress.advance(n_chunk, len(passing))
+
+    if len(selected) == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+
+    return numpy.concatenate(selected)
+
+
+
+## --------------------------------------- ##
+def entry_chunks(store, expressions, entries=None):
+    """
+    (chunk, rows) pairs of a columnar store with the given expressions.
+    All the chunks in order with rows None, or only the chunks holding
+    some of the given sorted entries, rows being their positions in it.
+    """
+
+    chunk_size = store.chunk_size
+    if entries is None:
+        indices = itertools.count()
+    elif chunk_size <= 0:
+        indices = [0]
+    else:
+        indices = numpy.unique(entries / chunk_size)
+
+    for index in indices:
+        chunk = store.load(int(index), expressions)
+        if chunk.n_entries == 0:
+            return
+
+        if entries is None:
+            yield chunk, None
+            if store.last_chunk(chunk):
+                return
+            continue
+
+        first, last = numpy.searchsorted(entries, [chunk.first_entry,
+                                                   chunk.first_entry + chunk.n_entries])
+        yield chunk, entries[first:last] - chunk.first_entry
+
+
+
+## --------------------------------------- ##
+def select_entries_columnar(store, cut_string, entries=None, progress=None):
+    """
+    Same as select_entries, evaluating the cut with numpy over the columns
+    of a columnar store, one chunk at a time. Raises ExpressionError if the
+    cut cannot be evaluated this way. Given sorted entries, only the chunks
+    holding some of them are loaded, and only these entries evaluated.
+    """
+
+    if progress is None:
+        progress = Progress()
+
+    node = parse(cut_string)
+    branches = sorted(names(node))
+    scalars = store.scalars(branches)
+
+    selected = []
+    for chunk, rows in entry_chunks(store, branches, entries):
+        columns, n_entries = chunk.columns, chunk.n_entries
+        if rows is not None:
+            columns = {}
+            for branch in branches:
+                values, offsets = chunk.columns[branch]
+                columns[branch] = take_rows(values, offsets, rows)
+            n_entries = len(rows)
+
+        passing = numpy.flatnonzero(evaluate(node, columns, n_entries, scalars))
+        if rows is not None:
+            passing = rows[passing]
+        passing = passing.astype(numpy.int64) + chunk.first_entry
+
+        selected.append(passing)
+        progress.advance(n_entries, len(passing))
+
+    if len(selected) == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+
+    return numpy.concatenate(selected)
+
+
+
+## --------------------------------------- ##
+def encode_selection(selection):
+    """
+    Sorted entries as the first one followed by the gaps between
+    neighbours, in the smallest unsigned type holding them all
+    """
+
+    deltas = numpy.diff(selection)
+    if len(selection) > 0:
+        deltas = numpy.concatenate(([selection[0]], deltas))
+
+    largest = 0
+    if len(deltas) > 0:
+        largest = deltas.max()
+
+    for dtype in (numpy.uint8, numpy.uint16, numpy.uint32, numpy.uint64):
+        if largest <= numpy.iinfo(dtype).max:
+            break
+
+    return deltas.astype(dtype)
+
+
+
+## --------------------------------------- ##
+def decode_selection(deltas):
+    """
+    Sorted entries back from encode_selection
+    """
+
+    return numpy.cumsum(deltas, dtype=numpy.int64)
+
+
+
+####################################################
+class SelectionStore():
+
+    ## --------------------------------------- ##
+    def __init__(self, directory, max_bytes):
+        """
+        Constructor. Selections are kept in a directory across sessions,
+        the least recently used files being removed once they take more
+        than max_bytes.
+        """
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+
+
+    ## --------------------------------------- ##
+    def path(self, key):
+        """
+        File of a selection, key being a (normalized cut, identity) pair
+        """
+
+        digest = hashlib.sha1(repr((STORE_VERSION, key))).hexdigest()
+        return os.path.join(self.directory, digest + '.npz')
+
+
+
+    ## --------------------------------------- ##
+    def persistent(self, key):
+        """
+        Can a selection be recognized next time? Not if the size of some
+        input file is unknown, it could change unnoticed.
+        """
+
+        for identity in key[1]:
+            if identity[1] is None:
+                return False
+        return True
+
+
+
+    ## --------------------------------------- ##
+    def get(self, key):
+        """
+        Stored selection for key, None if it is not known
+        """
+
+        path = self.path(key)
+        if not self.persistent(key) or not os.path.isfile(path):
+            return None
+
+        try:
+            with numpy.load(path) as stored:
+                selection = decode_selection(stored['deltas'])
+            os.utime(path, None)
+        except (IOError, OSError, ValueError, KeyError, zipfile.BadZipfile):
+            return None
+
+        return selection
+
+
+
+    ## --------------------------------------- ##
+    def put(self, key, selection):
+        """
+        Store a selection, then make room for it if needed
+        """
+
+        if not self.persistent(key):
+            return
+
+        path = self.path(key)
+        temporary = '%s.%d.%d.tmp' % (path, os.getpid(), threading.current_thread().ident)
+
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(temporary, 'wb') as output:
+                numpy.savez_compressed(output, deltas=encode_selection(selection))
+            os.rename(temporary, path)
+        except (IOError, OSError):
+            return
+
+        self.shrink()
+
+
+
+    ## --------------------------------------- ##
+    def shrink(self):
+        """
+        Remove the least recently used selections beyond max_bytes
+        """
+
+        files = []
+        try:
+            for name in os.listdir(self.directory):
+                if name.endswith('.npz'):
+                    path = os.path.join(self.directory, name)
+                    status = os.stat(path)
+                    files.append((status.st_mtime, status.st_size, path))
+        except OSError:
+            return
+
+        n_bytes = sum(size for time, size, path in files)
+        for time, size, path in sorted(files):
+            if n_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            n_bytes -= size
+
+
+
+####################################################
+class SelectionCache():
+
+    ## --------------------------------------- ##
+    def __init__(self, max_bytes, store=None):
+        """
+        Constructor. Least recently used selections are forgotten once
+        their total size exceeds max_bytes. Selections not in memory are
+        looked for in store (a SelectionStore) if given, and every new
+        selection is stored there too.
+        """
+
+        self.max_bytes = max_bytes
+        self.n_bytes   = 0
+        self.store     = store
+
+        ## Selections, least recently used first
+        self.selections = OrderedDict()
+
+        ## Cuts are evaluated in the background
+        self.lock = threading.Lock()
+
+
+
+    ## --------------------------------------- ##
+    def key(self, cut_string, identity):
+        """
+        Cache key for a cut applied on a chain of a given identity
+        """
+
+        return (normalize_cut(cut_string), identity)
+
+
+
+    ## --------------------------------------- ##
+    def get(self, key):
+        """
+        Cached selection for key, None if it is not known
+        """
+
+        with self.lock:
+            selection = self.selections.pop(key, None)
+            if selection is not None:
+                self.selections[key] = selection
+
+        ## Computed in a previous session
+        if selection is None and self.store is not None:
+            selection = self.store.get(key)
+            if selection is not None:
+                self.keep(key, selection)
+
+        return selection
+
+
+
+    ## --------------------------------------- ##
+    def put(self, key, selection):
+        """
+        Remember a selection, and store it for the next sessions
+        """
+
+        self.keep(key, selection)
+
+        if self.store is not None:
+            self.store.put(key, selection)
+
+
+
+    ## --------------------------------------- ##
+    def keep(self, key, selection):
+        """
+        Keep a selection in memory, making room for it if needed
+        """
+
+        ## Would not fit anyway
+        if selection.nbytes > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.selections:
+                self.n_bytes -= self.selections.pop(key).nbytes
+
+            self.selections[key] = selection
+            self.n_bytes += selection.nbytes
+
+            while self.n_bytes > self.max_bytes:
+                key, forgotten = self.selections.popitem(last=False)
+                self.n_bytes -= forgotten.nbytes
@@ -0,0 +1,97 @@
+#**************************************************#
+# file   : core/reader/shuffle.py                  #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Seeded random permutation of the selected        #
+# events, drawn lazily so that random browsing can #
+# be walked both ways and read ahead               #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import random
+
+
+####################################################
+class Shuffle():
+
+    ## --------------------------------------- ##
+    def __init__(self, n, seed=None):
+        """
+        Constructor. Random permutation of range(n), drawn with a
+        Fisher-Yates shuffle one step at a time, as it is walked.
+        """
+
+        self.n = n
+        self.random = random.Random(seed)
+
+        ## Values drawn so far, in permutation order
+        self.drawn = []
+
+        ## Positions not drawn yet whose value was swapped, position : value.
+        ## All other positions still hold their own index.
+        self.swapped = {}
+
+
+
+    ## --------------------------------------- ##
+    def draw(self):
+        """
+        Draw the next value of the permutation
+        """
+
+        i = len(self.drawn)
+        j = self.random.randint(i, self.n-1)
+
+        ## Position i is used up, its value moves to j
+        value = self.swapped.pop(j, j)
+        if j != i:
+            self.swapped[j] = self.swapped.pop(i, i)
+
+        self.drawn.append(value)
+        return value
+
+
+
+    ## --------------------------------------- ##
+    def grow(self, n):
+        """
+        Extend the permutation to range(n). The values drawn so far keep
+        their positions, the new ones are mixed with those not drawn yet.
+        """
+
+        self.n = max(self.n, n)
+
+
+
+    ## --------------------------------------- ##
+    def __getitem__(self, k):
+        """
+        Value at position k of the permutation, None outside of it
+        """
+
+        if k < 0 or k >= self.n:
+            return None
+
+        while len(self.drawn) <= k:
+            self.draw()
+        return self.drawn[k]
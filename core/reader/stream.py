@@ -0,0 +1,456 @@
+#**************************************************#
+# file   : core/reader/stream.py                   #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Follow a growing file, a named pipe or a local   #
+# socket of events, one JSON record per line, into #
+# a bounded buffer                                 #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import os, io, stat, json, time, random, socket, bisect, threading
+
+## numpy imports
+import numpy
+
+## CDER imports
+from columnar import evaluate_column
+
+## What to do with events arriving while the display is behind
+POLICIES = ('latest', 'sampled')
+
+## Seconds between two looks at a source with nothing new
+POLL_INTERVAL = 0.1
+
+## JSON values a branch can hold, alone or in a flat list
+NUMBERS = (int, long, float)
+
+
+## --------------------------------------- ##
+def open_source(source):
+    """
+    Binary file object over a source: unix:PATH or tcp:HOST:PORT for
+    a socket to connect to, otherwise the path of a file or named pipe
+    """
+
+    if source.startswith('unix:') or source.startswith('tcp:'):
+        kind, address = source.split(':', 1)
+        if kind == 'unix':
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            host, port = address.rsplit(':', 1)
+            address = (host, int(port))
+            connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        connection.connect(address)
+        return connection.makefile('rb')
+
+    ## Opening a named pipe waits for a writer
+    return io.open(source, 'rb')
+
+
+
+## --------------------------------------- ##
+def is_file(source):
+    """
+    Is the source a regular file, which may still grow once read to the end?
+    """
+
+    try:
+        return stat.S_ISREG(os.stat(source).st_mode)
+    except OSError:
+        return False
+
+
+
+####################################################
+class EventBuffer():
+
+    ## --------------------------------------- ##
+    def __init__(self, capacity, pending, policy='latest', seed=None):
+        """
+        Constructor. Keeps the capacity most recent events, every event
+        getting the serial number of its arrival. At most pending of them
+        wait to be shown, the others are dropped under the policy: latest
+        drops the oldest waiting event, sampled keeps a uniform sample of
+        all the events that arrived since the display fell behind.
+        """
+
+        if policy not in POLICIES:
+            raise ValueError('Unknown policy "%s", use one of %s' % (policy, ', '.join(POLICIES)))
+
+        self.capacity = max(capacity, 1)
+        self.pending  = max(min(pending, self.capacity), 1)
+        self.policy   = policy
+        self.random   = random.Random(seed)
+
+        ## Serial numbers in arrival order, and their records
+        self.serials = []
+        self.records = {}
+
+        ## Last event shown, the ones after it are waiting
+        self.shown = -1
+
+        ## Events received, dropped before being shown, not understood, and
+        ## arrived since the display fell behind
+        self.received  = 0
+        self.dropped   = 0
+        self.malformed = 0
+        self.overflow  = 0
+
+        ## Filled by the follower thread, read by the display
+        self.lock = threading.Lock()
+
+
+
+    ## --------------------------------------- ##
+    def waiting(self):
+        """
+        Number of events not shown yet
+        """
+
+        return len(self.serials) - bisect.bisect_right(self.serials, self.shown)
+
+
+
+    ## --------------------------------------- ##
+    def add(self, record):
+        """
+        Take in a new event, dropping one if the display is behind
+        """
+
+        with self.lock:
+            serial = self.received
+            self.received += 1
+
+            if self.waiting() >= self.pending:
+                first_waiting = bisect.bisect_right(self.serials, self.shown)
+                self.overflow += 1
+
+                ## Make room for the new event
+                if self.policy == 'latest':
+                    self.forget(first_waiting)
+
+                ## Reservoir sampling, the new event replaces a random one
+                elif self.random.random()*(self.pending + self.overflow) < self.pending:
+                    self.forget(self.random.randrange(first_waiting, len(self.serials)))
+
+                else:
+                    self.dropped += 1
+                    return
+
+                self.dropped += 1
+
+            self.serials.append(serial)
+            self.records[serial] = record
+
+            ## Forget the oldest events already shown, but the current one
+            while len(self.serials) > self.capacity and self.serials[0] < self.shown:
+                self.forget(0)
+
+
+
+    ## --------------------------------------- ##
+    def forget(self, index):
+        """
+        Remove the event at a given index of the buffer
+        """
+
+        serial = self.serials.pop(index)
+        del self.records[serial]
+
+
+
+    ## --------------------------------------- ##
+    def show(self, serial):
+        """
+        Record that an event is being shown
+        """
+
+        with self.lock:
+            self.shown = max(self.shown, serial)
+            if self.waiting() < self.pending:
+                self.overflow = 0
+
+
+
+    ## --------------------------------------- ##
+    def get(self, serial):
+        """
+        Record of an event, None if it is not buffered anymore
+        """
+
+        with self.lock:
+            return self.records.get(serial)
+
+
+
+    ## --------------------------------------- ##
+    def after(self, serial):
+        """
+        Buffered serial numbers after a given one, in order
+        """
+
+        with self.lock:
+            return self.serials[bisect.bisect_right(self.serials, serial):]
+
+
+
+    ## --------------------------------------- ##
+    def before(self, serial):
+        """
+        Buffered serial numbers before a given one, closest first
+        """
+
+        with self.lock:
+            return self.serials[:bisect.bisect_left(self.serials, serial)][::-1]
+
+
+
+    ## --------------------------------------- ##
+    def snapshot(self):
+        """
+        All buffered serial numbers and records, in order
+        """
+
+        with self.lock:
+            return list(self.serials), [self.records[serial] for serial in self.serials]
+
+
+
+####################################################
+class StreamFollower(threading.Thread):
+
+    ## --------------------------------------- ##
+    def __init__(self, source, buffer):
+        """
+        Constructor. Reads JSON records from a source into a buffer in the
+        background, call start() to run it. Files are followed as they
+        grow, pipes and sockets are opened again whenever they close.
+        """
+
+        threading.Thread.__init__(self, name='CDER stream follower')
+        self.daemon = True
+
+        self.source = source
+        self.buffer = buffer
+
+        ## Last problem with the source, reported once
+        self.error = None
+
+        self.stopped = False
+
+
+
+    ## --------------------------------------- ##
+    def run(self):
+        """
+        Read the source until stopped
+        """
+
+        while not self.stopped:
+            try:
+                self.follow()
+            except (IOError, OSError, socket.error, ValueError), error:
+                if str(error) != str(self.error):
+                    print 'WARNING : cannot read %s (%s), trying again' % (self.source, error)
+                self.error = error
+            time.sleep(POLL_INTERVAL)
+
+
+
+    ## --------------------------------------- ##
+    def follow(self):
+        """
+        Read records from the source until it closes
+        """
+
+        growing = is_file(self.source)
+        stream = open_source(self.source)
+        self.error = None
+
+        try:
+            partial = ''
+            while not self.stopped:
+                line = stream.readline()
+
+                ## Nothing new, files may still grow
+                if line == '':
+                    if not growing or self.truncated(stream):
+                        return
+                    time.sleep(POLL_INTERVAL)
+                    continue
+
+                ## The rest of the line is not written yet
+                partial += line
+                if not partial.endswith('\n'):
+                    continue
+
+                self.take(partial)
+                partial = ''
+
+        finally:
+            stream.close()
+
+
+
+    ## --------------------------------------- ##
+    def truncated(self, stream):
+        """
+        Was the file replaced or truncated, to be read again from the start?
+        """
+
+        try:
+            return os.stat(self.source).st_size < stream.tell()
+        except OSError:
+            return True
+
+
+
+    ## --------------------------------------- ##
+    def take(self, line):
+        """
+        Decode one line into the buffer
+        """
+
+        line = line.strip()
+        if len(line) == 0:
+            return
+
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError('not an object')
+            if not all(is_branch_value(value) for value in record.itervalues()):
+                raise ValueError('not numbers')
+        except ValueError:
+            with self.buffer.lock:
+                self.buffer.malformed += 1
+            return
+
+        self.buffer.add(record)
+
+
+
+    ## --------------------------------------- ##
+    def stop(self):
+        """
+        Stop reading. Pipes and sockets are only left once they have
+        something new, the thread does not keep CDER alive.
+        """
+
+        self.stopped = True
+
+
+
+## --------------------------------------- ##
+def is_branch_value(value):
+    """
+    Can a decoded JSON value be a branch: a number or a flat list of numbers?
+    """
+
+    if isinstance(value, list):
+        return all(isinstance(element, NUMBERS) for element in value)
+    return isinstance(value, NUMBERS)
+
+
+
+## --------------------------------------- ##
+def record_columns(records):
+    """
+    Columns of branches over records, as (values, offsets) pairs, and the
+    set of branches holding one value per event: those never given as a
+    list. Such a branch missing from a record is NaN for it, other
+    branches have no values.
+    """
+
+    names = set()
+    vectors = set()
+    for record in records:
+        names.update(record)
+        vectors.update(name for name, value in record.iteritems() if isinstance(value, list))
+    scalars = names - vectors
+
+    columns = {}
+    for name in names:
+        missing = []
+        if name in scalars:
+            missing = [numpy.nan]
+
+        values, counts = [], []
+        for record in records:
+            value = record.get(name, missing)
+            if not isinstance(value, list):
+                value = [value]
+            values.extend(value)
+            counts.append(len(value))
+
+        offsets = numpy.zeros(len(counts)+1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=offsets[1:])
+        columns[name] = (numpy.array(values, dtype=numpy.float64), offsets)
+
+    return columns, scalars
+
+
+
+####################################################
+class StreamStore():
+
+    ## --------------------------------------- ##
+    def __init__(self, buffer, expressions):
+        """
+        Constructor. Same event() as ColumnarStore, over the buffered
+        records, entries being serial numbers
+        """
+
+        self.buffer      = buffer
+        self.expressions = list(expressions)
+        self.n_entries   = 0
+
+
+
+    ## --------------------------------------- ##
+    def event(self, entry):
+        """
+        Dictionary of the values of all the expressions for one entry
+        """
+
+        record = self.buffer.get(entry)
+        if record is None:
+            raise IndexError('Event %d is not buffered anymore' % entry)
+
+        try:
+            columns, scalars = record_columns([record])
+        except ValueError:
+            columns, scalars = {}, set()
+
+        event = {}
+        for expression in self.expressions:
+            if expression in columns:
+                values, offsets = columns[expression]
+            else:
+                try:
+                    values, offsets = evaluate_column(expression, columns, 1, scalars)
+                except ValueError:
+                    values = numpy.zeros(0)
+            event[expression] = values
+        return event
@@ -0,0 +1,375 @@
+#**************************************************#
+# file   : core/reader/stream_reader.py            #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# A reader following a stream of events, one JSON  #
+# record of branch values per line                 #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import random
+
+## numpy imports
+import numpy
+
+## CDER imports
+from .. import config
+from reader import Reader, CUT_NO_SELECTION
+from stream import EventBuffer, StreamFollower, StreamStore, record_columns
+from expression import parse, evaluate, ExpressionError
+
+####################################################
+class Custom_Reader(Reader):
+
+    ## Objects to display. Records are JSON objects of branch values, a
+    ## number or a list of numbers each, for example
+    ## {"RunNumber": 1, "EventNumber": 7, "jet_pt": [45000.0], "jet_eta": [0.5],
+    ##  "jet_phi": [1.2], "jet_btag": [0.9], "MET": 20000.0, "MET_phi": -2.1}
+    ## Missing branches have no objects.
+    schema = {'jets'      : [{'pt'       : 'jet_pt',
+                              'eta'      : 'jet_eta',
+                              'phi'      : 'jet_phi',
+                              'btag'     : 'jet_btag',
+                              'btag_cut' : 0}],
+              'taus'      : [{'pt' : 'tau_pt', 'eta' : 'tau_eta', 'phi' : 'tau_phi'}],
+              'muons'     : [{'pt' : 'mu_pt',  'eta' : 'mu_eta',  'phi' : 'mu_phi'}],
+              'electrons' : [{'pt' : 'el_pt',  'eta' : 'el_eta',  'phi' : 'el_phi'}],
+              'photons'   : [{'pt' : 'ph_pt',  'eta' : 'ph_eta',  'phi' : 'ph_phi'}],
+              'met'       : [{'pt' : 'MET',    'phi' : 'MET_phi'}]}
+
+    ## Extra information
+    extra_schema = {'run'   : ('RunNumber', 'd'),
+                    'event' : ('EventNumber', 'd')}
+
+    ## The next events are not there yet
+    read_ahead = False
+
+    ## --------------------------------------- ##
+    def __init__(self, file_path, tree_name, initial_cut_string=CUT_NO_SELECTION):
+        """
+        Constructor. file_path is the source of the events, a file or a
+        named pipe, or unix:PATH or tcp:HOST:PORT for a socket to connect
+        to. tree_name is not used.
+        """
+
+        ## Current cut, and whether the events reached so far pass it
+        self.cut_node = None
+        self.passing = {}
+
+        ## Events left by random(), to walk back
+        self.random_trail = []
+
+        ## Execute the base class constructor
+        Reader.__init__(self, file_path, tree_name, initial_cut_string)
+
+
+
+    ## --------------------------------------- ##
+    @classmethod
+    def needs_root(cls, file_path):
+        """
+        Records are read without ROOT
+        """
+
+        return False
+
+
+
+    ## --------------------------------------- ##
+    def open_store(self, file_path):
+        """
+        Start following the source, events are taken from the buffer
+        """
+
+        self.buffer = EventBuffer(config.stream_buffer, config.stream_pending, config.stream_policy)
+
+        self.follower = StreamFollower(file_path, self.buffer)
+        self.follower.start()
+
+        return StreamStore(self.buffer, self.compiled_schema.expressions)
+
+
+
+    ## --------------------------------------- ##
+    def live(self):
+        """
+        Events keep arriving
+        """
+
+        return True
+
+
+
+    ## --------------------------------------- ##
+    def passes(self, serial):
+        """
+        Does a buffered event pass the current cut?
+        """
+
+        if self.cut_node is None:
+            return True
+
+        if serial not in self.passing:
+            record = self.buffer.get(serial)
+            if record is None:
+                return False
+            try:
+                with numpy.errstate(all='ignore'):
+                    columns, scalars = record_columns([record])
+                    passing = evaluate(self.cut_node, columns, 1, scalars)[0]
+            except (ExpressionError, ValueError):
+                passing = False
+
+            ## Forget the events gone from the buffer
+            if len(self.passing) > 2*self.buffer.capacity:
+                self.passing.clear()
+            self.passing[serial] = bool(passing)
+
+        return self.passing[serial]
+
+
+
+    ## --------------------------------------- ##
+    def show(self, serial):
+        """
+        Fill the local containers with a buffered event
+        """
+
+        self.event = serial
+        self.buffer.show(serial)
+        self.entries = len(self.buffer.serials)
+
+        return self.load()
+
+
+
+    ## --------------------------------------- ##
+    def first_passing(self, serials):
+        """
+        First serial number passing the current cut, None if there is none
+        """
+
+        for serial in serials:
+            if self.passes(serial):
+                return serial
+        return None
+
+
+
+    ## --------------------------------------- ##
+    def next(self):
+        """
+        Fetch the next buffered event into local containers
+        """
+
+        serial = self.first_passing(self.buffer.after(self.event))
+        if serial is None:
+            ## No new event yet, tell Display
+            return None
+
+        return self.show(serial)
+
+
+
+    ## --------------------------------------- ##
+    def previous(self):
+        """
+        Fetch the previous buffered event into local containers
+        """
+
+        serial = self.first_passing(self.buffer.before(self.event))
+        if serial is None:
+            return None
+
+        return self.show(serial)
+
+
+
+    ## --------------------------------------- ##
+    def random(self):
+        """
+        Fetch a random buffered event into local containers
+        """
+
+        serials = [serial for serial in self.buffer.snapshot()[0]
+                   if serial != self.event and self.passes(serial)]
+        if len(serials) == 0:
+            return None
+
+        if self.event >= 0:
+            self.random_trail.append(self.event)
+            del self.random_trail[:-self.buffer.capacity]
+
+        return self.show(random.choice(serials))
+
+
+
+    ## --------------------------------------- ##
+    def random_previous(self):
+        """
+        Go back to the event shown before the last random one
+        """
+
+        while len(self.random_trail) > 0:
+            serial = self.random_trail.pop()
+            if self.buffer.get(serial) is not None:
+                return self.show(serial)
+
+        return None
+
+
+
+    ## --------------------------------------- ##
+    def evaluate_cut(self, cut_string, base=None, progress=None):
+        """
+        Serial numbers of the buffered events passing a cut, None if the
+        cut is not valid. Events arriving later are checked when reached.
+        """
+
+        serials, records = self.buffer.snapshot()
+
+        try:
+            node = parse(cut_string)
+            passing = numpy.zeros(0, dtype=bool)
+            if len(records) > 0:
+                with numpy.errstate(all='ignore'):
+                    columns, scalars = record_columns(records)
+                    passing = evaluate(node, columns, len(records), scalars)
+        except (ExpressionError, ValueError), error:
+            print 'Cannot evaluate "%s" on the stream (%s)' % (cut_string, error)
+            return None
+
+        if progress is not None:
+            progress.total = len(records)
+            progress.advance(len(records), int(passing.sum()))
+
+        return numpy.array(serials, dtype=numpy.int64)[passing]
+
+
+
+    ## --------------------------------------- ##
+    def apply_cut(self, cut_string, selection):
+        """
+        Make a cut the current one, even if no buffered event passes it yet
+        """
+
+        if selection is None:
+            print 'Bad cut expression : "%s". Resetting the full stream' % cut_string
+            self.reset_cut()
+            return False
+
+        if len(selection) == 0:
+            print 'No buffered event passes "%s" yet, waiting for one' % cut_string
+
+        self.current_cut = cut_string
+        self.cut_node = parse(cut_string)
+        self.passing = dict((int(serial), True) for serial in selection)
+
+        return True
+
+
+
+    ## --------------------------------------- ##
+    def reset_cut(self):
+        """
+        Remove the currently applied cut
+        """
+
+        self.current_cut = CUT_NO_SELECTION
+        self.cut_node = None
+        self.passing = {}
+
+
+
+    ## --------------------------------------- ##
+    def open_index(self):
+        """
+        Buffered events are looked up directly
+        """
+
+        return True
+
+
+
+    ## --------------------------------------- ##
+    def find_event(self, run, event):
+        """
+        Serial number of a buffered event given its run and event numbers,
+        None if it is not buffered
+        """
+
+        serials, records = self.buffer.snapshot()
+        for serial, record in reversed(zip(serials, records)):
+            if record.get(config.run_branch) == run and record.get(config.event_branch) == event:
+                return serial
+        return None
+
+
+
+    ## --------------------------------------- ##
+    def tag_sets(self):
+        """
+        Buffered events are forgotten, they cannot be tagged
+        """
+
+        return None
+
+
+
+    ## --------------------------------------- ##
+    def toggle_tag(self):
+        """
+        Buffered events are forgotten, they cannot be tagged
+        """
+
+        print 'Streamed events cannot be tagged'
+
+
+
+    ## --------------------------------------- ##
+    def goto_entry(self, entry):
+        """
+        Fetch a buffered event into local containers, removing the cut if
+        the event does not pass it
+        """
+
+        if not self.passes(entry):
+            print 'Event does not pass "%s". Removing the cut' % self.current_cut
+            self.reset_cut()
+
+        return self.show(entry)
+
+
+
+    ## --------------------------------------- ##
+    def print_event(self):
+        """
+        Print the kinematics, followed by the state of the stream
+        """
+
+        Reader.print_event(self)
+
+        if len(self.event_particles) > 0:
+            print 'Stream : %d events received, %d dropped, %d waiting' % (self.buffer.received,
+                                                                         self.buffer.dropped,
+                                                                         self.buffer.waiting())
@@ -0,0 +1,329 @@
+#**************************************************#
+# file   : core/reader/synthetic.py                #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Reproducible synthetic events with the branches  #
+# of example.root, for benchmarks and tests        #
+# without input files                              #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import os, math
+from array import array
+
+## numpy imports
+import numpy
+
+## CDER imports
+from columnar import ColumnarStore, evaluate_column
+from expression import parse, is_scalar, ExpressionError
+from inputs import user_cache_directory
+
+## Events are generated by blocks, each from its own seed, so that any
+## range of entries is the same whatever the chunk size. Change the
+## version whenever the generated events change.
+BLOCK_SIZE        = 4096
+GENERATOR_VERSION = 1
+
+## Containers and the prefix of their branches
+CONTAINERS = (('jets',      'jet'),
+              ('taus',      'tau'),
+              ('muons',     'mu'),
+              ('electrons', 'el'),
+              ('photons',   'ph'))
+
+## Mean number of objects per event
+MULTIPLICITIES = {'jets'      : 4.0,
+                  'taus'      : 0.5,
+                  'muons'     : 0.5,
+                  'electrons' : 0.5,
+                  'photons'   : 1.0,
+                  'flebles'   : 3.0}
+
+## pt spectra are falling exponentials above a threshold, with these
+## slopes (MeV). met is the slope of the MET spectrum.
+PT_THRESHOLD = 15000.0
+PT_SCALES = {'jets'      : 40000.0,
+             'taus'      : 25000.0,
+             'muons'     : 30000.0,
+             'electrons' : 30000.0,
+             'photons'   : 20000.0,
+             'met'       : 30000.0}
+
+## Objects are spread uniformly up to this |eta|
+MAX_ETA = 2.5
+
+## Entries per run, RunNumber and EventNumber are unique together
+RUN_SIZE  = 100000
+FIRST_RUN = 1
+
+## Branches of the generated tree, std::vector<type> or leaf types
+VECTOR_BRANCHES = [prefix + variable for container, prefix in CONTAINERS
+                   for variable in ('_pt', '_eta', '_phi')] + ['jet_btag']
+VECTOR_TYPES    = {'Flebles' : 'int'}
+SCALAR_TYPES    = {'MET'         : 'F',
+                   'MET_phi'     : 'F',
+                   'RunNumber'   : 'i',
+                   'EventNumber' : 'i'}
+BRANCHES = VECTOR_BRANCHES + sorted(VECTOR_TYPES) + sorted(SCALAR_TYPES)
+
+## Python array typecodes of the leaf types
+TYPECODES = {'F' : 'f', 'i' : 'I'}
+
+## numpy types of the vector elements and of the leaf types
+DTYPES = {'float' : numpy.float32, 'int' : numpy.int32, 'F' : numpy.float32, 'i' : numpy.uint32}
+
+
+## --------------------------------------- ##
+def scaled_multiplicities(factor):
+    """
+    Nominal multiplicities, all multiplied by a factor
+    """
+
+    return dict((name, mean*factor) for name, mean in MULTIPLICITIES.iteritems())
+
+
+
+## --------------------------------------- ##
+def generate_block(index, seed, multiplicities, pt_scales):
+    """
+    Events of one block as a dictionary of (values, counts) pairs, counts
+    being the number of values of each event
+    """
+
+    random = numpy.random.RandomState([seed, index])
+    first_entry = index*BLOCK_SIZE
+    one = numpy.ones(BLOCK_SIZE, dtype=numpy.int64)
+
+    columns = {}
+    for container, prefix in CONTAINERS:
+        counts = random.poisson(multiplicities[container], BLOCK_SIZE)
+        n_objects = counts.sum()
+        columns[prefix + '_pt']  = (PT_THRESHOLD + random.exponential(pt_scales[container], n_objects), counts)
+        columns[prefix + '_eta'] = (random.uniform(-MAX_ETA, MAX_ETA, n_objects), counts)
+        columns[prefix + '_phi'] = (random.uniform(-math.pi, math.pi, n_objects), counts)
+        if container == 'jets':
+            columns['jet_btag'] = (random.normal(-0.5, 1.0, n_objects), counts)
+
+    counts = random.poisson(multiplicities['flebles'], BLOCK_SIZE)
+    columns['Flebles'] = (random.randint(0, 10, counts.sum()).astype(numpy.float64), counts)
+
+    columns['MET']     = (random.exponential(pt_scales['met'], BLOCK_SIZE), one)
+    columns['MET_phi'] = (random.uniform(-math.pi, math.pi, BLOCK_SIZE), one)
+
+    entries = numpy.arange(first_entry, first_entry + BLOCK_SIZE)
+    columns['RunNumber']   = ((FIRST_RUN + entries / RUN_SIZE).astype(numpy.float64), one)
+    columns['EventNumber'] = ((entries % RUN_SIZE + 1).astype(numpy.float64), one)
+
+    return columns
+
+
+
+####################################################
+class SyntheticStore(ColumnarStore):
+
+    ## --------------------------------------- ##
+    def __init__(self, n_entries, expressions=BRANCHES, seed=0, multiplicities=None, pt_scales=None,
+                 chunk_size=0, max_chunks=2, lock=None):
+        """
+        Constructor. Same interface as ColumnarStore, the columns of
+        n_entries events are generated instead of read. Expressions are
+        branch names or anything the numpy expression evaluator handles.
+        multiplicities and pt_scales override the nominal ones.
+        """
+
+        ColumnarStore.__init__(self, None, expressions, chunk_size, max_chunks, lock)
+
+        self.n_entries = n_entries
+        self.seed      = seed
+
+        self.multiplicities = dict(MULTIPLICITIES)
+        self.multiplicities.update(multiplicities or {})
+        self.pt_scales = dict(PT_SCALES)
+        self.pt_scales.update(pt_scales or {})
+
+        ## Branches of the last range of entries generated, the columns of a
+        ## chunk are read one after the other
+        self.generated = (None, None)
+
+
+
+    ## --------------------------------------- ##
+    def identity(self):
+        """
+        Identity of the generated events, the same settings give the same
+        events. The first path is where event indices go.
+        """
+
+        return ((os.path.join(user_cache_directory(), 'synthetic'),
+                 GENERATOR_VERSION,
+                 self.n_entries,
+                 self.seed,
+                 tuple(sorted(self.multiplicities.items())),
+                 tuple(sorted(self.pt_scales.items()))),)
+
+
+
+    ## --------------------------------------- ##
+    def generate(self, first_entry, last_entry):
+        """
+        All the branches over a range of entries, as (values, offsets) pairs
+        """
+
+        if last_entry <= first_entry:
+            return dict((name, (numpy.zeros(0), numpy.zeros(1, dtype=numpy.int64))) for name in BRANCHES)
+
+        first_block = first_entry / BLOCK_SIZE
+        blocks = [generate_block(index, self.seed, self.multiplicities, self.pt_scales)
+                  for index in range(first_block, (last_entry-1) / BLOCK_SIZE + 1)]
+
+        start = first_entry - first_block*BLOCK_SIZE
+        stop  = start + last_entry - first_entry
+
+        columns = {}
+        for name in BRANCHES:
+            values = numpy.concatenate([block[name][0] for block in blocks])
+            counts = numpy.concatenate([block[name][1] for block in blocks])
+
+            offsets = numpy.zeros(len(counts)+1, dtype=numpy.int64)
+            numpy.cumsum(counts, out=offsets[1:])
+            offsets = offsets[start:stop+1]
+
+            columns[name] = (values[offsets[0]:offsets[-1]], offsets - offsets[0])
+
+        return columns
+
+
+
+    ## --------------------------------------- ##
+    def is_scalar(self, expression):
+        """
+        Does an expression of the generated branches have one value per event?
+        """
+
+        try:
+            return is_scalar(parse(expression), set(SCALAR_TYPES))
+        except ExpressionError:
+            return False
+
+
+
+    ## --------------------------------------- ##
+    def read_column(self, expression, first_entry, n_entries):
+        """
+        Generate one column over a range of entries as a (values, offsets) pair
+        """
+
+        last_entry  = min(first_entry + n_entries, self.n_entries)
+        first_entry = min(first_entry, last_entry)
+
+        if self.generated[0] != (first_entry, last_entry):
+            self.generated = ((first_entry, last_entry), self.generate(first_entry, last_entry))
+        columns = self.generated[1]
+
+        if expression in columns:
+            return columns[expression]
+        return evaluate_column(expression, columns, last_entry - first_entry, set(SCALAR_TYPES))
+
+
+
+## --------------------------------------- ##
+def fill_vector(vector, values):
+    """
+    Set the content of a std::vector to a numpy array of its element
+    type, copied in one go
+    """
+
+    vector.resize(len(values))
+    if len(values) == 0:
+        return
+
+    ## The buffer of the vector does not know its own length
+    buffer = vector.data()
+    try:
+        buffer.SetSize(len(values))
+    except AttributeError:
+        buffer.reshape((len(values),))
+
+    numpy.frombuffer(buffer, dtype=values.dtype, count=len(values))[:] = values
+
+
+
+## --------------------------------------- ##
+def write_tree(store, path, tree_name='events', progress=None):
+    """
+    Write the events of a synthetic store to a ROOT file, with the
+    branch types of example.root. Each chunk is converted to the branch
+    types once, entries are filled by copying slices of it.
+    """
+
+    from ROOT import TFile, TTree, std
+
+    output = TFile(path + '.tmp', 'RECREATE')
+    tree = TTree(tree_name, 'Synthetic events')
+
+    vectors = []
+    for name in VECTOR_BRANCHES + sorted(VECTOR_TYPES):
+        vector = std.vector(VECTOR_TYPES.get(name, 'float'))()
+        tree.Branch(name, vector)
+        vectors.append((name, vector))
+
+    scalars = []
+    for name in sorted(SCALAR_TYPES):
+        buffer = array(TYPECODES[SCALAR_TYPES[name]], [0])
+        tree.Branch(name, buffer, '%s/%s' % (name, SCALAR_TYPES[name]))
+        scalars.append((name, buffer))
+
+    n_entries = 0
+    index = 0
+    while True:
+        chunk = store.load(index, BRANCHES)
+
+        ## Values in the types of the branches
+        columns = {}
+        for name in BRANCHES:
+            values, offsets = chunk.columns[name]
+            dtype = DTYPES[SCALAR_TYPES.get(name) or VECTOR_TYPES.get(name, 'float')]
+            columns[name] = (values.astype(dtype), offsets)
+
+        for i in range(chunk.n_entries):
+            for name, vector in vectors:
+                values, offsets = columns[name]
+                fill_vector(vector, values[offsets[i]:offsets[i+1]])
+            for name, buffer in scalars:
+                buffer[0] = columns[name][0][i]
+            tree.Fill()
+
+        n_entries += chunk.n_entries
+        if progress is not None:
+            progress.advance(chunk.n_entries)
+
+        if store.last_chunk(chunk):
+            break
+        index += 1
+
+    tree.Write()
+    output.Close()
+    os.rename(path + '.tmp', path)
+
+    return n_entries
@@ -0,0 +1,97 @@
+#**************************************************#
+# file   : core/reader/synthetic_reader.py         #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# A reader generating events on the fly, set up in #
+# the Synthetic section of config.ini              #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## CDER imports
+from .. import config
+from reader import Reader, CUT_NO_SELECTION
+from synthetic import SyntheticStore, BLOCK_SIZE
+from example_reader import first_jets_mass
+
+####################################################
+class Custom_Reader(Reader):
+
+    ## Objects to display, with the branches of the generated events
+    ## (the ones of example.root)
+    schema = {'jets'      : [{'pt'       : 'jet_pt',
+                              'eta'      : 'jet_eta',
+                              'phi'      : 'jet_phi',
+                              'btag'     : 'jet_btag',
+                              'btag_cut' : 0}],
+              'taus'      : [{'pt' : 'tau_pt', 'eta' : 'tau_eta', 'phi' : 'tau_phi'}],
+              'muons'     : [{'pt' : 'mu_pt',  'eta' : 'mu_eta',  'phi' : 'mu_phi'}],
+              'electrons' : [{'pt' : 'el_pt',  'eta' : 'el_eta',  'phi' : 'el_phi'}],
+              'photons'   : [{'pt' : 'ph_pt',  'eta' : 'ph_eta',  'phi' : 'ph_phi'}],
+              'met'       : [{'pt' : 'MET',    'phi' : 'MET_phi'}]}
+
+    ## Columns computed from the generated branches
+    derived = {'jet1_pt'    : 'jet_pt[0]/1000.0',
+               'mass_j1_j2' : (('jet_pt', 'jet_eta', 'jet_phi'), first_jets_mass)}
+
+    ## Extra information
+    extra_schema = {'flebles'       : ('Sum$(Flebles)', 'd'),
+                    'jet 1 pt'      : ('jet1_pt', '.2f'),
+                    'jets 1-2 mass' : ('mass_j1_j2', '.2f')}
+
+    ## --------------------------------------- ##
+    def __init__(self, file_path, tree_name, initial_cut_string=CUT_NO_SELECTION):
+        """
+        Constructor. file_path and tree_name are not used.
+        """
+
+        ## Execute the base class constructor
+        Reader.__init__(self, file_path, tree_name, initial_cut_string)
+
+
+
+    ## --------------------------------------- ##
+    @classmethod
+    def needs_root(cls, file_path):
+        """
+        Events are generated without ROOT
+        """
+
+        return False
+
+
+
+    ## --------------------------------------- ##
+    def open_store(self, file_path):
+        """
+        Columns generated chunk by chunk, cuts are evaluated with numpy.
+        Chunks are small so that jumping to any event is quick, and enough
+        of them are kept for all the events read ahead.
+        """
+
+        return SyntheticStore(config.synthetic_entries,
+                              self.compiled_schema.expressions,
+                              config.synthetic_seed,
+                              config.synthetic_multiplicities,
+                              config.synthetic_pt_scales,
+                              chunk_size=BLOCK_SIZE,
+                              max_chunks=2*config.prefetch_depth + 2,
+                              lock=self.tree_lock)
@@ -0,0 +1,306 @@
+#**************************************************#
+# file   : core/reader/tags.py                     #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Named sets of tagged entries, kept as sorted     #
+# arrays and stored in an append-only log          #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import os, hashlib
+
+## numpy imports
+import numpy
+
+## CDER imports
+from inputs import user_data_directory
+
+## Tag set used until another one is chosen
+DEFAULT_TAG_SET = 'bookmarks'
+
+## The log is compacted when opened if most of its lines are undone by later ones
+COMPACT_MIN_LINES = 1000
+
+## Changes to a set kept aside before being merged into its sorted array
+MERGE_SIZE = 4096
+
+
+## --------------------------------------- ##
+def tags_path(identity):
+    """
+    Log of the tags of given input files
+    """
+
+    digest = hashlib.sha1(repr(identity)).hexdigest()[:16]
+    base = os.path.splitext(os.path.basename(str(identity[0][0]).rstrip('/')))[0]
+    return os.path.join(user_data_directory(), 'tags', '%s-%s.log' % (base, digest))
+
+
+
+## --------------------------------------- ##
+def is_tagged_cut(cut_string):
+    """
+    Is a cut string the selection of a tag set (:tagged NAME)?
+    """
+
+    return cut_string.split()[:1] == [':tagged']
+
+
+
+####################################################
+class TagSets():
+
+    ## --------------------------------------- ##
+    def __init__(self, path):
+        """
+        Constructor. Tag sets stored in the log at path, one line per
+        entry added (+ NAME ENTRY) or removed (- NAME ENTRY).
+        """
+
+        self.path = path
+
+        ## Sorted array of the entries of each set, and the entries added
+        ## to it and removed from it since, merged once there are many
+        self.sets = {}
+        self.added = {}
+        self.removed = {}
+
+        n_lines = self.replay()
+        if n_lines >= COMPACT_MIN_LINES and n_lines > 2*self.count():
+            self.compact()
+
+        ## Lines are added as tags change, never rewritten. The log is only
+        ## created with the first change.
+        self.log = None
+
+
+
+    ## --------------------------------------- ##
+    def replay(self):
+        """
+        Read the sets back from the log, returns the number of lines read
+        """
+
+        if not os.path.exists(self.path):
+            return 0
+
+        sets = {}
+        n_lines = 0
+        with open(self.path) as log:
+            for line in log:
+
+                ## A line cut short by a crash is ignored
+                words = line.split()
+                if not line.endswith('\n') or len(words) != 3 or words[0] not in ('+', '-'):
+                    continue
+                try:
+                    entry = int(words[2])
+                except ValueError:
+                    continue
+
+                n_lines += 1
+                entries = sets.setdefault(words[1], set())
+                if words[0] == '+':
+                    entries.add(entry)
+                else:
+                    entries.discard(entry)
+
+        for name, entries in sets.iteritems():
+            self.sets[name] = numpy.array(sorted(entries), dtype=numpy.int64)
+
+        return n_lines
+
+
+
+    ## --------------------------------------- ##
+    def compact(self):
+        """
+        Rewrite the log with one line per tagged entry
+        """
+
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as log:
+            for name in self.names():
+                for entry in self.entries(name):
+                    log.write('+ %s %d\n' % (name, entry))
+        os.rename(temporary_path, self.path)
+
+
+
+    ## --------------------------------------- ##
+    def record(self, operation, name, entry):
+        """
+        Append a change to the log
+        """
+
+        if self.log is None:
+            directory = os.path.dirname(self.path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.log = open(self.path, 'a')
+
+        self.log.write('%s %s %d\n' % (operation, name, entry))
+        self.log.flush()
+
+
+
+    ## --------------------------------------- ##
+    def contains(self, name, entry):
+        """
+        Is entry in the set?
+        """
+
+        if entry in self.added.get(name, ()):
+            return True
+        if entry in self.removed.get(name, ()):
+            return False
+
+        entries = self.sets.get(name)
+        if entries is None:
+            return False
+        position = int(numpy.searchsorted(entries, entry))
+        return position < len(entries) and entries[position] == entry
+
+
+
+    ## --------------------------------------- ##
+    def add(self, name, entry):
+        """
+        Add an entry to a set, creating the set if needed
+        """
+
+        if self.contains(name, entry):
+            return
+
+        ## Logged first, a change that cannot be written is not made
+        self.record('+', name, entry)
+
+        removed = self.removed.setdefault(name, set())
+        if entry in removed:
+            removed.discard(entry)
+        else:
+            self.added.setdefault(name, set()).add(entry)
+        self.merge(name, MERGE_SIZE)
+
+
+
+    ## --------------------------------------- ##
+    def remove(self, name, entry):
+        """
+        Remove an entry from a set
+        """
+
+        if not self.contains(name, entry):
+            return
+
+        ## Logged first, a change that cannot be written is not made
+        self.record('-', name, entry)
+
+        added = self.added.setdefault(name, set())
+        if entry in added:
+            added.discard(entry)
+        else:
+            self.removed.setdefault(name, set()).add(entry)
+        self.merge(name, MERGE_SIZE)
+
+
+
+    ## --------------------------------------- ##
+    def merge(self, name, max_changes=0):
+        """
+        Merge the changes to a set into its sorted array if there are more
+        than max_changes
+        """
+
+        added, removed = self.added.get(name, set()), self.removed.get(name, set())
+        if len(added) + len(removed) <= max_changes:
+            return
+
+        entries = self.sets.get(name, numpy.zeros(0, dtype=numpy.int64))
+        if len(removed) > 0:
+            entries = entries[~numpy.in1d(entries, numpy.array(list(removed), dtype=numpy.int64))]
+        if len(added) > 0:
+            entries = numpy.union1d(entries, numpy.array(list(added), dtype=numpy.int64))
+
+        self.sets[name] = entries
+        self.added[name] = set()
+        self.removed[name] = set()
+
+
+
+    ## --------------------------------------- ##
+    def toggle(self, name, entry):
+        """
+        Add an entry to a set, or remove it if it is there already.
+        Returns whether it is in the set now.
+        """
+
+        if self.contains(name, entry):
+            self.remove(name, entry)
+            return False
+
+        self.add(name, entry)
+        return True
+
+
+
+    ## --------------------------------------- ##
+    def entries(self, name):
+        """
+        Sorted array of the entries of a set, empty if there is no such set
+        """
+
+        self.merge(name)
+        return self.sets.get(name, numpy.zeros(0, dtype=numpy.int64))
+
+
+
+    ## --------------------------------------- ##
+    def size(self, name):
+        """
+        Number of entries in a set
+        """
+
+        return len(self.sets.get(name, ())) + len(self.added.get(name, ())) - len(self.removed.get(name, ()))
+
+
+
+    ## --------------------------------------- ##
+    def names(self, entry=None):
+        """
+        Names of the sets that are not empty, or of those holding entry
+        """
+
+        names = set(self.sets) | set(self.added)
+        return [name for name in sorted(names)
+                if self.size(name) > 0 and (entry is None or self.contains(name, entry))]
+
+
+
+    ## --------------------------------------- ##
+    def count(self):
+        """
+        Number of tags in all the sets
+        """
+
+        return sum(self.size(name) for name in self.names())
@@ -26,18 +26,25 @@
 #   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
 #############################################################################
 
-## ROOT imports
-from ROOT import gROOT
-
 ## CDER imports
 from reader import Reader, CUT_NO_SELECTION
 
-## Enable ROOT to read std::vectors
-gROOT.ProcessLine('.L core/reader/addVectorToROOT.C+')
-
 ####################################################
 class Custom_Reader(Reader):
 
+    ## Objects to display
+    schema = {'taus'      : [{'pt' : 'evtsel_tau1_et', 'eta' : 'evtsel_tau1_eta', 'phi' : 'evtsel_tau1_phi', 'select' : 'evtsel_nMediumTaus > 0'},
+                             {'pt' : 'evtsel_tau2_et', 'eta' : 'evtsel_tau2_eta', 'phi' : 'evtsel_tau2_phi', 'select' : 'evtsel_nMediumTaus > 1'}],
+              'muons'     : [{'pt' : 'evtsel_vlep1_pt', 'eta' : 'evtsel_vlep1_eta', 'phi' : 'evtsel_vlep1_phi', 'select' : 'evtsel_vlep1_flavour == 13'},
+                             {'pt' : 'evtsel_vlep2_pt', 'eta' : 'evtsel_vlep2_eta', 'phi' : 'evtsel_vlep2_phi', 'select' : 'evtsel_vlep2_flavour == 13'},
+                             {'pt' : 'evtsel_hlep1_pt', 'eta' : 'evtsel_hlep1_eta', 'phi' : 'evtsel_hlep1_phi', 'select' : 'evtsel_hlep1_flavour == 13'},
+                             {'pt' : 'evtsel_hlep2_pt', 'eta' : 'evtsel_hlep2_eta', 'phi' : 'evtsel_hlep2_phi', 'select' : 'evtsel_hlep2_flavour == 13'}],
+              'electrons' : [{'pt' : 'evtsel_vlep1_pt', 'eta' : 'evtsel_vlep1_eta', 'phi' : 'evtsel_vlep1_phi', 'select' : 'evtsel_vlep1_flavour == 11'},
+                             {'pt' : 'evtsel_vlep2_pt', 'eta' : 'evtsel_vlep2_eta', 'phi' : 'evtsel_vlep2_phi', 'select' : 'evtsel_vlep2_flavour == 11'},
+                             {'pt' : 'evtsel_hlep1_pt', 'eta' : 'evtsel_hlep1_eta', 'phi' : 'evtsel_hlep1_phi', 'select' : 'evtsel_hlep1_flavour == 11'},
+                             {'pt' : 'evtsel_hlep2_pt', 'eta' : 'evtsel_hlep2_eta', 'phi' : 'evtsel_hlep2_phi', 'select' : 'evtsel_hlep2_flavour == 11'}],
+              'met'       : [{'pt' : 'evtsel_MET', 'phi' : 'evtsel_MET_phi'}]}
+
     ## --------------------------------------- ##
     def __init__(self, file_path, tree_name, initial_cut_string=CUT_NO_SELECTION):
         """
@@ -45,87 +52,3 @@ class Custom_Reader(Reader):
         """
         
         Reader.__init__(self, file_path, tree_name, initial_cut_string)
-
-
-
-    ## --------------------------------------- ##
-    def get_jets(self):
-        """
-        Jets
-        """
-
-
-    ## --------------------------------------- ##
-    def get_photons(self):
-        """
-        Photons
-        """
-
-
-            
-    ## --------------------------------------- ##
-    def get_taus(self):
-        """
-        Taus
-        """
-
-        if self.tree.evtsel_nMediumTaus > 0:
-            self.event_taus.append((self.tree.evtsel_tau1_et, self.tree.evtsel_tau1_eta, self.tree.evtsel_tau1_phi))
-        if self.tree.evtsel_nMediumTaus > 1:
-            self.event_taus.append((self.tree.evtsel_tau2_et, self.tree.evtsel_tau2_eta, self.tree.evtsel_tau2_phi))
-
-
-        
-    ## --------------------------------------- ##
-    def get_muons(self):
-        """
-        Muons
-        """
-
-        if self.tree.evtsel_vlep1_flavour == 13:
-            self.event_muons.append((self.tree.evtsel_vlep1_pt, self.tree.evtsel_vlep1_eta, self.tree.evtsel_vlep1_phi))
-        if self.tree.evtsel_vlep2_flavour == 13:
-            self.event_muons.append((self.tree.evtsel_vlep2_pt, self.tree.evtsel_vlep2_eta, self.tree.evtsel_vlep2_phi))
-        if self.tree.evtsel_hlep1_flavour == 13:
-            self.event_muons.append((self.tree.evtsel_hlep1_pt, self.tree.evtsel_hlep1_eta, self.tree.evtsel_hlep1_phi))
-        if self.tree.evtsel_hlep2_flavour == 13:
-            self.event_muons.append((self.tree.evtsel_hlep2_pt, self.tree.evtsel_hlep2_eta, self.tree.evtsel_hlep2_phi))
-
-
-            
-    ## --------------------------------------- ##
-    def get_electrons(self):
-        """
-        Electrons
-        """
-        
-        if self.tree.evtsel_vlep1_flavour == 11:
-            self.event_electrons.append((self.tree.evtsel_vlep1_pt, self.tree.evtsel_vlep1_eta, self.tree.evtsel_vlep1_phi))
-        if self.tree.evtsel_vlep2_flavour == 11:
-            self.event_electrons.append((self.tree.evtsel_vlep2_pt, self.tree.evtsel_vlep2_eta, self.tree.evtsel_vlep2_phi))
-        if self.tree.evtsel_hlep1_flavour == 11:
-            self.event_electrons.append((self.tree.evtsel_hlep1_pt, self.tree.evtsel_hlep1_eta, self.tree.evtsel_hlep1_phi))
-        if self.tree.evtsel_hlep2_flavour == 11:
-            self.event_electrons.append((self.tree.evtsel_hlep2_pt, self.tree.evtsel_hlep2_eta, self.tree.evtsel_hlep2_phi))
-
-
-    
-    ## --------------------------------------- ##
-    def get_met(self):
-        """
-        MET
-        """
-        
-        self.event_met = (self.tree.evtsel_MET, self.tree.evtsel_MET_phi)
-
-
-        
-    ## --------------------------------------- ##
-    def get_extra_information(self):
-        """
-        Extra information
-        """
-
-
-
-            
@@ -0,0 +1,188 @@
+#**************************************************#
+# file   : core/reader/weights.py                  #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Event weights and the alias table drawing events #
+# in proportion to them                            #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import random, threading
+
+## numpy imports
+import numpy
+
+## CDER imports
+from columnar import draw
+from expression import parse, names, evaluate_node, ExpressionError
+from jobs import Progress
+
+
+## --------------------------------------- ##
+def clean_weights(values):
+    """
+    Weights usable for sampling, negative and non-finite ones count as 0
+    """
+
+    weights = numpy.array(values, dtype=numpy.float64)
+    weights[~numpy.isfinite(weights) | (weights < 0)] = 0.0
+    return weights
+
+
+
+## --------------------------------------- ##
+def event_weights(tree, expression, n_entries, chunk_size=0, progress=None, lock=None):
+    """
+    Value of expression for each of the first n_entries of a tree, read
+    chunk_size entries at a time. Raises ValueError if ROOT cannot evaluate
+    it or if it is not one value per event.
+    """
+
+    if progress is None:
+        progress = Progress()
+    if lock is None:
+        lock = threading.RLock()
+    if chunk_size <= 0:
+        chunk_size = max(n_entries, 1)
+
+    chunks = []
+    for first_entry in xrange(0, n_entries, chunk_size):
+        n_chunk = min(chunk_size, n_entries - first_entry)
+        with lock:
+            values = draw(tree, expression, first_entry, n_chunk)
+        if values is None:
+            raise ValueError('Cannot evaluate weight "%s"' % expression)
+        if len(values) != n_chunk:
+            raise ValueError('Weight "%s" is not one value per event' % expression)
+        chunks.append(values)
+        progress.advance(n_chunk)
+
+    if len(chunks) == 0:
+        return numpy.zeros(0)
+    return clean_weights(numpy.concatenate(chunks))
+
+
+
+## --------------------------------------- ##
+def event_weights_columnar(store, expression, progress=None):
+    """
+    Same as event_weights, evaluating the expression with numpy over the
+    columns of a columnar store. Raises ExpressionError if it cannot be
+    evaluated this way.
+    """
+
+    if progress is None:
+        progress = Progress()
+
+    node = parse(expression)
+    branches = sorted(names(node))
+    scalars = store.scalars(branches)
+
+    chunks = []
+    index = 0
+    while True:
+        chunk = store.load(index, branches)
+        if chunk.n_entries == 0:
+            break
+
+        with numpy.errstate(all='ignore'):
+            values, counts = evaluate_node(node, chunk.columns, chunk.n_entries, scalars)
+        if counts is not None:
+            raise ExpressionError('Weight "%s" is not one value per event' % expression)
+        chunks.append(values)
+        progress.advance(chunk.n_entries)
+
+        if store.last_chunk(chunk):
+            break
+        index += 1
+
+    if len(chunks) == 0:
+        return numpy.zeros(0)
+    return clean_weights(numpy.concatenate(chunks))
+
+
+
+####################################################
+class AliasTable():
+
+    ## --------------------------------------- ##
+    def __init__(self, weights, seed=None):
+        """
+        Constructor. Draws indices of weights in proportion to them, in
+        constant time per draw (Walker's alias method, built with numpy by
+        sweeping heavy weights over light ones). Raises ValueError if no
+        weight is positive.
+        """
+
+        n = len(weights)
+        total = float(numpy.sum(weights))
+        if n == 0 or not total > 0:
+            raise ValueError('No event has a positive weight')
+
+        self.n = n
+        self.random = random.Random(seed)
+
+        ## Column i keeps i with probability probability[i], gives alias[i] otherwise
+        scaled = numpy.asarray(weights, dtype=numpy.float64) * (n / total)
+        light = numpy.flatnonzero(scaled < 1.0)
+        heavy = numpy.flatnonzero(scaled >= 1.0)
+        self.probability = numpy.ones(n)
+        self.alias = numpy.arange(n, dtype=numpy.int64)
+
+        ## Heavy weights fill the columns of light ones in order, one heavy
+        ## weight at a time, and whatever is left of a heavy weight once it
+        ## drops below 1 is topped up by the next one. Which heavy weight
+        ## fills each column follows from the running sums of what light
+        ## columns miss and of what heavy weights have to spare.
+        deficits = 1.0 - scaled[light]
+        filled = numpy.cumsum(deficits)
+        before = filled - deficits
+        surplus = numpy.cumsum(scaled[heavy] - 1.0)
+
+        ## Light columns, filled by the first heavy weight with enough to spare
+        donor = numpy.searchsorted(surplus, before, side='right')
+        covered = donor < len(heavy)
+        self.probability[light[covered]] = scaled[light[covered]]
+        self.alias[light[covered]] = heavy[donor[covered]]
+
+        ## Heavy columns keep what is left after the light columns they filled.
+        ## The last one keeps its whole column, as do light columns left
+        ## over by rounding errors.
+        served = numpy.searchsorted(before, surplus, side='left')
+        given = numpy.concatenate(([0.0], filled))[served]
+        residual = numpy.clip(1.0 + surplus - given, 0.0, 1.0)
+        self.probability[heavy[:-1]] = residual[:-1]
+        self.alias[heavy[:-1]] = heavy[1:]
+
+
+
+    ## --------------------------------------- ##
+    def draw(self):
+        """
+        Draw an index
+        """
+
+        column = self.random.randrange(self.n)
+        if self.random.random() < self.probability[column]:
+            return column
+        return int(self.alias[column])
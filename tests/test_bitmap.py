@@ -0,0 +1,113 @@
+#**************************************************#
+# file   : tests/test_bitmap.py                    #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Tests of the compressed selection bitmaps        #
+# against sets of entries                          #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import random, unittest
+
+## CDER imports
+from core.reader.bitmap import CHUNK_BITS, SPARSE_LIMIT, from_entries, combine_selections
+
+
+## --------------------------------------- ##
+def random_entries(generator, n_entries):
+    """
+    Set of entries among n_entries with a sparse, a dense, an empty and
+    a full chunk, and a partial last chunk
+    """
+
+    entries = set(generator.sample(xrange(CHUNK_BITS), SPARSE_LIMIT / 2))
+    entries |= set(generator.sample(xrange(CHUNK_BITS, 2*CHUNK_BITS), CHUNK_BITS / 3))
+    entries |= set(xrange(3*CHUNK_BITS, 4*CHUNK_BITS))
+    entries |= set(entry for entry in xrange(4*CHUNK_BITS, n_entries) if generator.random() < 0.01)
+    return entries
+
+
+
+####################################################
+class TestBitmap(unittest.TestCase):
+
+    ## --------------------------------------- ##
+    def setUp(self):
+        """
+        Two random sets of entries and their bitmaps
+        """
+
+        generator = random.Random(3)
+        self.n_entries = 4*CHUNK_BITS + 1000
+        self.first = random_entries(generator, self.n_entries)
+        self.second = random_entries(generator, self.n_entries)
+        self.first_bitmap = from_entries(sorted(self.first), self.n_entries)
+        self.second_bitmap = from_entries(sorted(self.second), self.n_entries)
+
+
+
+    ## --------------------------------------- ##
+    def test_entries(self):
+        """
+        A bitmap gives back its entries in order, and counts them
+        """
+
+        self.assertEqual(list(self.first_bitmap.entries()), sorted(self.first))
+        self.assertEqual(self.first_bitmap.count(), len(self.first))
+        self.assertEqual(list(from_entries([], self.n_entries).entries()), [])
+
+
+
+    ## --------------------------------------- ##
+    def test_operations(self):
+        """
+        And, or and invert behave as the set operations
+        """
+
+        everything = set(xrange(self.n_entries))
+        self.assertEqual(list((self.first_bitmap & self.second_bitmap).entries()),
+                         sorted(self.first & self.second))
+        self.assertEqual(list((self.first_bitmap | self.second_bitmap).entries()),
+                         sorted(self.first | self.second))
+        self.assertEqual(list(self.first_bitmap.invert().entries()),
+                         sorted(everything - self.first))
+
+
+
+    ## --------------------------------------- ##
+    def test_combine_selections(self):
+        """
+        Combinations of @N give the entries of the same set expression
+        """
+
+        bitmaps = [self.first_bitmap, self.second_bitmap]
+        everything = set(xrange(self.n_entries))
+        self.assertEqual(list(combine_selections('@1 && !@2', bitmaps, self.n_entries)),
+                         sorted(self.first - self.second))
+        self.assertEqual(list(combine_selections('!(@1 || @2)', bitmaps, self.n_entries)),
+                         sorted(everything - self.first - self.second))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+#**************************************************#
+# file   : tests/test_branches.py                  #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Tests of switching branches off while jobs read  #
+# them                                             #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import threading, unittest
+
+## CDER imports
+from core.reader.branches import BranchPruner
+
+
+####################################################
+class FakeBranch():
+
+    ## --------------------------------------- ##
+    def __init__(self, name):
+        """
+        Constructor. Branch with a single leaf of the same name
+        """
+
+        self.name = name
+
+
+
+    ## --------------------------------------- ##
+    def GetName(self):
+        """
+        Name of the branch
+        """
+
+        return self.name
+
+
+
+    ## --------------------------------------- ##
+    def GetBranch(self):
+        """
+        Branch of the leaf, itself
+        """
+
+        return self
+
+
+
+####################################################
+class FakeTree():
+
+    ## --------------------------------------- ##
+    def __init__(self, names):
+        """
+        Constructor. Tree keeping the status of its branches
+        """
+
+        self.branches = [FakeBranch(name) for name in names]
+        self.status = dict((name, 1) for name in names)
+
+
+
+    ## --------------------------------------- ##
+    def GetReadEntry(self):
+        """
+        A tree of the chain is always loaded
+        """
+
+        return 0
+
+
+
+    ## --------------------------------------- ##
+    def GetListOfLeaves(self):
+        """
+        One leaf per branch
+        """
+
+        return self.branches
+
+
+
+    ## --------------------------------------- ##
+    def GetListOfBranches(self):
+        """
+        All the branches
+        """
+
+        return self.branches
+
+
+
+    ## --------------------------------------- ##
+    def SetBranchStatus(self, name, status):
+        """
+        Switch a branch, or all of them with *, on or off
+        """
+
+        if name == '*':
+            for branch in self.status:
+                self.status[branch] = status
+        else:
+            self.status[name] = status
+
+
+
+####################################################
+class TestBranchPruner(unittest.TestCase):
+
+    ## --------------------------------------- ##
+    def test_prune_during_scan(self):
+        """
+        Branches held by a running scan stay active while other threads
+        prune for other cuts, and are switched off once released
+        """
+
+        tree = FakeTree(['jet_pt', 'MET', 'el_pt', 'mu_pt'])
+        pruner = BranchPruner(tree, ['jet_pt'])
+        lock = threading.RLock()
+
+        with lock:
+            pruner.hold(['MET'])
+
+        switched_off = []
+        def scan():
+            for i in range(2000):
+                with lock:
+                    if tree.status['MET'] != 1:
+                        switched_off.append(i)
+
+        def prune():
+            for i in range(2000):
+                with lock:
+                    pruner.prune(['el_pt'] if i % 2 else ['mu_pt'])
+
+        threads = [threading.Thread(target=scan), threading.Thread(target=prune)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(switched_off, [])
+
+        with lock:
+            pruner.release(['MET'])
+            pruner.prune(['el_pt'])
+        self.assertEqual(tree.status, {'jet_pt' : 1, 'MET' : 0, 'el_pt' : 1, 'mu_pt' : 0})
+
+
+
+    ## --------------------------------------- ##
+    def test_shared_branches(self):
+        """
+        A branch held by two jobs stays active until both released it
+        """
+
+        tree = FakeTree(['jet_pt', 'MET'])
+        pruner = BranchPruner(tree, ['jet_pt'])
+
+        pruner.hold(['MET'])
+        pruner.hold(['MET'])
+        pruner.release(['MET'])
+        pruner.prune([])
+        self.assertEqual(tree.status['MET'], 1)
+
+        pruner.release(['MET'])
+        pruner.prune([])
+        self.assertEqual(tree.status['MET'], 0)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+#**************************************************#
+# file   : tests/test_expression.py                #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Tests of the numpy evaluation of cuts            #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import unittest
+
+## numpy imports
+import numpy
+
+## CDER imports
+from core.reader.expression import parse, evaluate
+
+
+## Two events with one jet each, one with MET 10 and the other 25
+COLUMNS = {'jet_pt' : (numpy.array([30., 50.]), numpy.array([0, 1, 2])),
+           'MET'    : (numpy.array([10., 25.]), numpy.array([0, 1, 2]))}
+
+
+####################################################
+class TestEvaluate(unittest.TestCase):
+
+    ## --------------------------------------- ##
+    def test_vector_with_one_value_per_event(self):
+        """
+        A vector branch stays a vector when every event has one object
+        """
+
+        passing = evaluate(parse('Sum$(jet_pt > 40) == 1'), COLUMNS, 2, set(['MET']))
+        self.assertEqual(list(passing), [False, True])
+
+        passing = evaluate(parse('MET > 20'), COLUMNS, 2, set(['MET']))
+        self.assertEqual(list(passing), [False, True])
+
+
+
+    ## --------------------------------------- ##
+    def test_integer_modulo(self):
+        """
+        % truncates both sides to integers, like TTreeFormula
+        """
+
+        passing = evaluate(parse('MET % 4.5 == 2'), COLUMNS, 2, set(['MET']))
+        self.assertEqual(list(passing), [True, False])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
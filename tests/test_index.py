@@ -0,0 +1,103 @@
+#**************************************************#
+# file   : tests/test_index.py                     #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Tests of the index of tree entries by run and    #
+# event number                                     #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import os, random, shutil, tempfile, unittest
+
+## CDER imports
+from core.reader.index import build_index, open_index, save_index
+
+
+####################################################
+class TestEventIndex(unittest.TestCase):
+
+    ## --------------------------------------- ##
+    def setUp(self):
+        """
+        Random run and event numbers, some events repeated, and the first
+        entry of each event
+        """
+
+        generator = random.Random(5)
+        self.runs = [generator.randrange(1, 20) for i in range(5000)]
+        self.events = [generator.randrange(0, 2000) for i in range(5000)]
+        self.first_entry = {}
+        for entry, key in enumerate(zip(self.runs, self.events)):
+            self.first_entry.setdefault(key, entry)
+
+        self.directory = tempfile.mkdtemp()
+
+
+
+    ## --------------------------------------- ##
+    def tearDown(self):
+        """
+        Remove the stored index
+        """
+
+        shutil.rmtree(self.directory)
+
+
+
+    ## --------------------------------------- ##
+    def check_index(self, index):
+        """
+        Every event is found at its first entry, others are not found
+        """
+
+        for (run, event), entry in self.first_entry.iteritems():
+            self.assertEqual(index.find(run, event), entry)
+        for run, event in ((0, 0), (25, 3), (3, 2000)):
+            self.assertEqual(index.find(run, event), None)
+
+
+
+    ## --------------------------------------- ##
+    def test_find(self):
+        """
+        The built index finds what the dict does
+        """
+
+        self.check_index(build_index(self.runs, self.events))
+
+
+
+    ## --------------------------------------- ##
+    def test_stored(self):
+        """
+        The index finds the same events once stored and mapped back
+        """
+
+        path = os.path.join(self.directory, 'index')
+        self.assertEqual(save_index(build_index(self.runs, self.events), [path]), path)
+        self.check_index(open_index([os.path.join(self.directory, 'missing'), path]))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
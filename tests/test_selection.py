@@ -0,0 +1,195 @@
+#**************************************************#
+# file   : tests/test_selection.py                 #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Tests of the splitting of cuts into clauses      #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import os, random, shutil, tempfile, unittest
+from collections import OrderedDict
+
+## numpy imports
+import numpy
+
+## CDER imports
+from core.reader.selection import split_conjunction, extra_clauses, select_entries_columnar
+from core.reader.selection import SelectionStore, SelectionCache, encode_selection, decode_selection
+from core.reader.synthetic import SyntheticStore
+from core.reader.jobs import Progress
+
+
+####################################################
+class TestClauses(unittest.TestCase):
+
+    ## --------------------------------------- ##
+    def test_split_with_disjunction(self):
+        """
+        && binds tighter than ||, a top-level || keeps the cut whole
+        """
+
+        self.assertEqual(split_conjunction('MET>20 || njets>=2 && ntau>0'),
+                         ['MET>20||njets>=2&&ntau>0'])
+        self.assertEqual(split_conjunction('(MET>20 || njets>=2) && ntau>0'),
+                         ['MET>20||njets>=2', 'ntau>0'])
+
+
+
+    ## --------------------------------------- ##
+    def test_extra_clauses_with_disjunction(self):
+        """
+        A cut with a top-level || does not refine its first clause
+        """
+
+        self.assertEqual(extra_clauses('ntau>0 && MET>20 || njets>=2', 'ntau>0'), None)
+        self.assertEqual(extra_clauses('ntau>0 && (MET>20 || njets>=2)', 'ntau>0'),
+                         '(MET>20||njets>=2)')
+
+
+
+####################################################
+class TestRefinement(unittest.TestCase):
+
+    ## --------------------------------------- ##
+    def test_refinement_matches_full_scan(self):
+        """
+        Evaluating a cut over base entries only gives the entries of the
+        full scan found in the base, and only looks at the base entries
+        """
+
+        store = SyntheticStore(20000, chunk_size=4096)
+        base = select_entries_columnar(store, 'Length$(jet_pt) >= 5')
+        full = select_entries_columnar(store, 'jet_pt[4] > 30000 && MET > 20000')
+
+        progress = Progress()
+        refined = select_entries_columnar(store, 'jet_pt[4] > 30000 && MET > 20000', base, progress)
+
+        self.assertTrue(len(refined) > 0)
+        self.assertEqual(list(refined), list(numpy.intersect1d(full, base)))
+        self.assertEqual(progress.scanned, len(base))
+
+
+
+####################################################
+class TestSelectionCache(unittest.TestCase):
+
+    ## --------------------------------------- ##
+    def setUp(self):
+        """
+        Store in a new directory, and keys for files of known size
+        """
+
+        self.directory = tempfile.mkdtemp()
+        self.identity = (('example.root', 1000, 0),)
+
+
+
+    ## --------------------------------------- ##
+    def tearDown(self):
+        """
+        Remove the stored selections
+        """
+
+        shutil.rmtree(self.directory)
+
+
+
+    ## --------------------------------------- ##
+    def test_encoding(self):
+        """
+        Selections come back from their gaps, in a small type when possible
+        """
+
+        selection = numpy.array([3, 7, 300, 301, 90000], dtype=numpy.int64)
+        self.assertEqual(list(decode_selection(encode_selection(selection))), list(selection))
+        self.assertEqual(encode_selection(numpy.arange(0, 5000, 7)).dtype, numpy.uint8)
+        self.assertEqual(len(decode_selection(encode_selection(numpy.zeros(0, dtype=numpy.int64)))), 0)
+
+
+
+    ## --------------------------------------- ##
+    def test_least_recently_used(self):
+        """
+        Random puts and gets keep the selections an ordered dict within
+        the same size limit does
+        """
+
+        generator = random.Random(17)
+        cache = SelectionCache(4000)
+        model = OrderedDict()
+
+        for i in range(2000):
+            key = cache.key('MET > %d' % generator.randrange(20), self.identity)
+            if generator.random() < 0.5:
+                selection = numpy.arange(generator.randrange(1, 200), dtype=numpy.int64)
+                cache.put(key, selection)
+                model.pop(key, None)
+                model[key] = selection
+                while sum(kept.nbytes for kept in model.itervalues()) > 4000:
+                    model.popitem(last=False)
+            else:
+                selection = model.pop(key, None)
+                if selection is not None:
+                    model[key] = selection
+                    self.assertEqual(list(cache.get(key)), list(selection))
+                else:
+                    self.assertEqual(cache.get(key), None)
+
+            self.assertEqual(cache.selections.keys(), model.keys())
+
+        self.assertEqual(cache.key('MET > 2 &&  njets>0', self.identity),
+                         cache.key('MET>2&&njets>0', self.identity))
+
+
+
+    ## --------------------------------------- ##
+    def test_store(self):
+        """
+        Stored selections are found by a new cache, except for files of
+        unknown size, and the oldest ones go beyond the size limit
+        """
+
+        store = SelectionStore(self.directory, 10**6)
+        cache = SelectionCache(10**6, store)
+        selection = numpy.array(sorted(random.Random(19).sample(xrange(10**6), 5000)), dtype=numpy.int64)
+        key = cache.key('MET > 20', self.identity)
+        unknown = cache.key('MET > 20', (('example.root', None, 0),))
+        cache.put(key, selection)
+        cache.put(unknown, selection)
+
+        cache = SelectionCache(10**6, store)
+        self.assertEqual(list(cache.get(key)), list(selection))
+        self.assertEqual(cache.get(unknown), None)
+
+        ## A single selection fits
+        store.max_bytes = os.path.getsize(store.path(key)) + 100
+        older = os.path.getmtime(store.path(key)) - 10
+        os.utime(store.path(key), (older, older))
+        store.put(cache.key('MET > 30', self.identity), selection[::2])
+        self.assertFalse(os.path.exists(store.path(key)))
+        self.assertEqual(len(store.get(cache.key('MET > 30', self.identity))), 2500)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
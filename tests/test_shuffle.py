@@ -0,0 +1,73 @@
+#**************************************************#
+# file   : tests/test_shuffle.py                   #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Tests of the random permutation walked by random #
+# browsing                                         #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import unittest
+
+## CDER imports
+from core.reader.shuffle import Shuffle
+
+
+####################################################
+class TestShuffle(unittest.TestCase):
+
+    ## --------------------------------------- ##
+    def test_permutation(self):
+        """
+        Every value is drawn exactly once, the same seed gives the same order
+        """
+
+        shuffle = Shuffle(1000, 11)
+        values = [shuffle[k] for k in range(1000)]
+
+        self.assertEqual(sorted(values), range(1000))
+        self.assertEqual([Shuffle(1000, 11)[k] for k in range(1000)], values)
+        self.assertEqual(shuffle[1000], None)
+        self.assertEqual(shuffle[-1], None)
+
+
+
+    ## --------------------------------------- ##
+    def test_grow(self):
+        """
+        Growing keeps the values drawn so far in place and still gives a
+        permutation of the larger range
+        """
+
+        shuffle = Shuffle(100, 2)
+        drawn = [shuffle[k] for k in range(60)]
+        shuffle.grow(250)
+        values = [shuffle[k] for k in range(250)]
+
+        self.assertEqual(values[:60], drawn)
+        self.assertEqual(sorted(values), range(250))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
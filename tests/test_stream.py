@@ -0,0 +1,111 @@
+#**************************************************#
+# file   : tests/test_stream.py                    #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Tests of the buffer of streamed events against a #
+# list of serial numbers                           #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import random, unittest
+
+## CDER imports
+from core.reader.stream import EventBuffer
+
+
+####################################################
+class TestEventBuffer(unittest.TestCase):
+
+    ## --------------------------------------- ##
+    def test_latest(self):
+        """
+        Random arrivals and displays keep the events a plain list does:
+        the oldest waiting event goes first, shown ones beyond the capacity
+        """
+
+        generator = random.Random(13)
+        buffer = EventBuffer(50, 10, 'latest')
+        serials, shown, dropped = [], -1, 0
+
+        for serial in range(5000):
+            buffer.add({'serial' : serial})
+            waiting = [s for s in serials if s > shown]
+            if len(waiting) >= 10:
+                serials.remove(waiting[0])
+                dropped += 1
+            serials.append(serial)
+            while len(serials) > 50 and serials[0] < shown:
+                serials.pop(0)
+
+            ## The display shows the next waiting event now and then
+            if generator.random() < 0.3:
+                after = buffer.after(shown)
+                if after:
+                    shown = after[0]
+                    buffer.show(shown)
+
+            self.assertEqual(buffer.snapshot()[0], serials)
+
+        self.assertEqual(buffer.dropped, dropped)
+        self.assertEqual(buffer.get(serials[-1]), {'serial' : serials[-1]})
+        self.assertEqual(buffer.before(serials[-1]), serials[-2::-1])
+
+
+
+    ## --------------------------------------- ##
+    def test_sampled(self):
+        """
+        Once behind, the waiting events are a uniform sample of all the
+        events that arrived
+        """
+
+        counts = [0]*1000
+        for seed in range(200):
+            buffer = EventBuffer(100, 10, 'sampled', seed)
+            for serial in range(1000):
+                buffer.add(serial)
+            serials, records = buffer.snapshot()
+
+            self.assertEqual(len(serials), 10)
+            self.assertEqual(serials, records)
+            self.assertEqual(buffer.dropped, 990)
+            for serial in serials:
+                counts[serial] += 1
+
+        ## Each event is kept 2 times out of 200 on average
+        self.assertAlmostEqual(sum(counts[:500]) / 2000.0, 0.5, delta=0.05)
+
+
+
+    ## --------------------------------------- ##
+    def test_unknown_policy(self):
+        """
+        Only the known policies are accepted
+        """
+
+        self.assertRaises(ValueError, EventBuffer, 10, 5, 'oldest')
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#**************************************************#
+# file   : tests/test_tags.py                      #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Tests of the tag sets and their log against sets #
+# of entries                                       #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import os, random, shutil, tempfile, unittest
+
+## CDER imports
+from core.reader.tags import TagSets, is_tagged_cut
+
+
+####################################################
+class TestTagSets(unittest.TestCase):
+
+    ## --------------------------------------- ##
+    def setUp(self):
+        """
+        Log in a new directory
+        """
+
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'tags', 'example.log')
+
+
+
+    ## --------------------------------------- ##
+    def tearDown(self):
+        """
+        Remove the log
+        """
+
+        shutil.rmtree(self.directory)
+
+
+
+    ## --------------------------------------- ##
+    def check_sets(self, tags, model):
+        """
+        Tag sets hold the entries of the model sets
+        """
+
+        self.assertEqual(tags.names(), sorted(name for name in model if model[name]))
+        for name, entries in model.iteritems():
+            self.assertEqual(list(tags.entries(name)), sorted(entries))
+            self.assertEqual(tags.size(name), len(entries))
+
+
+
+    ## --------------------------------------- ##
+    def test_toggle(self):
+        """
+        Random toggles give the model sets, also once read back from the log
+        """
+
+        generator = random.Random(7)
+        tags = TagSets(self.path)
+        model = {'bookmarks' : set(), 'susy' : set()}
+
+        ## Enough changes for the sets to be merged into their arrays
+        for i in range(12000):
+            name = generator.choice(sorted(model))
+            entry = generator.randrange(20000)
+            self.assertEqual(tags.toggle(name, entry), entry not in model[name])
+            model[name] ^= set([entry])
+            if i % 1000 == 0:
+                self.assertEqual(tags.contains(name, entry), entry in model[name])
+
+        self.check_sets(tags, model)
+        self.assertEqual(tags.names(entry), sorted(name for name in model if entry in model[name]))
+        self.check_sets(TagSets(self.path), model)
+
+
+
+    ## --------------------------------------- ##
+    def test_log(self):
+        """
+        The log is only created by the first change, and compacted once
+        most of its lines are undone
+        """
+
+        tags = TagSets(self.path)
+        self.assertEqual(tags.names(), [])
+        self.assertFalse(os.path.exists(os.path.dirname(self.path)))
+
+        for i in range(1000):
+            tags.toggle('bookmarks', 3)
+        tags.toggle('bookmarks', 5)
+        self.assertEqual(len(open(self.path).readlines()), 1001)
+
+        tags = TagSets(self.path)
+        self.check_sets(tags, {'bookmarks' : set([5])})
+        self.assertEqual(open(self.path).readlines(), ['+ bookmarks 5\n'])
+
+
+
+    ## --------------------------------------- ##
+    def test_tagged_cut(self):
+        """
+        Only :tagged commands select tag sets
+        """
+
+        self.assertTrue(is_tagged_cut(':tagged susy'))
+        self.assertFalse(is_tagged_cut('MET > 20 && :tagged'))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#**************************************************#
+# file   : tests/test_weights.py                   #
+# author : Michel Trottier-McDonald                #
+# date   : April 2013                              #
+# description:                                     #
+# Tests of the weighted draws against the          #
+# normalized weights                               #
+#**************************************************#
+
+#############################################################################
+#   Copyright 2012-2013 Michel Trottier-McDonald                            #
+#                                                                           #
+#   This file is part of CDER.                                              #
+#                                                                           #
+#   CDER is free software: you can redistribute it and/or modify            #
+#   it under the terms of the GNU General Public License as published by    #
+#   the Free Software Foundation, either version 3 of the License, or       #
+#   (at your option) any later version.                                     #
+#                                                                           #
+#   CDER is distributed in the hope that it will be useful,                 #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#   GNU General Public License for more details.                            #
+#                                                                           #
+#   You should have received a copy of the GNU General Public License       #
+#   along with CDER.  If not, see <http://www.gnu.org/licenses/>.           #
+#############################################################################
+
+## Basic python imports
+import unittest
+
+## numpy imports
+import numpy
+
+## CDER imports
+from core.reader.weights import AliasTable, clean_weights
+
+
+## --------------------------------------- ##
+def draw_probabilities(table):
+    """
+    Probability of each index to be drawn from an alias table, as a dict
+    """
+
+    probabilities = {}
+    for column in range(table.n):
+        kept = table.probability[column]
+        probabilities[column] = probabilities.get(column, 0.0) + kept / table.n
+        alias = int(table.alias[column])
+        probabilities[alias] = probabilities.get(alias, 0.0) + (1.0 - kept) / table.n
+    return probabilities
+
+
+
+####################################################
+class TestAliasTable(unittest.TestCase):
+
+    ## --------------------------------------- ##
+    def check_table(self, weights):
+        """
+        The table draws every index in proportion to its weight
+        """
+
+        total = float(sum(weights))
+        table = AliasTable(numpy.array(weights, dtype=numpy.float64), 1)
+        probabilities = draw_probabilities(table)
+        for index, weight in enumerate(weights):
+            self.assertAlmostEqual(probabilities.get(index, 0.0), weight / total)
+
+
+
+    ## --------------------------------------- ##
+    def test_probabilities(self):
+        """
+        Exact probabilities for small, uniform and skewed weights
+        """
+
+        self.check_table([1.0, 0.0, 3.0, 6.0])
+        self.check_table([2.0]*7)
+        self.check_table([1000.0] + [1.0]*50 + [0.0, 25.0])
+        self.check_table(list(numpy.random.RandomState(2).exponential(size=500)))
+
+
+
+    ## --------------------------------------- ##
+    def test_draws(self):
+        """
+        Draws never give an index of weight 0 and follow the weights
+        """
+
+        table = AliasTable(numpy.array([1.0, 0.0, 3.0, 6.0]), 4)
+        counts = {}
+        for i in range(20000):
+            index = table.draw()
+            counts[index] = counts.get(index, 0) + 1
+
+        self.assertEqual(sorted(counts), [0, 2, 3])
+        self.assertAlmostEqual(counts[3] / 20000.0, 0.6, delta=0.02)
+
+
+
+    ## --------------------------------------- ##
+    def test_bad_weights(self):
+        """
+        Negative and non-finite weights count as 0, all 0 cannot be drawn
+        """
+
+        self.assertEqual(list(clean_weights([1.0, -2.0, numpy.nan, numpy.inf])), [1.0, 0.0, 0.0, 0.0])
+        self.assertRaises(ValueError, AliasTable, numpy.zeros(3))
+        self.assertRaises(ValueError, AliasTable, numpy.zeros(0))
+
+
+
+if __name__ == '__main__':
+    unittest.main()